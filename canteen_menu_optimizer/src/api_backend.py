@@ -1,21 +1,40 @@
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 from datetime import date
 
 from .decision_engine import predict_quantity
+from .enhanced_decision_engine import SiteEngineCache
 
 app = FastAPI()
 
+# Sites whose models stay loaded; others are loaded on demand, evicting the least recently used
+MAX_LOADED_SITES = 8
+site_engines = SiteEngineCache(max_sites=MAX_LOADED_SITES)
+
 class PredictionRequest(BaseModel):
     date: str
     item_id: str
+    site_id: Optional[str] = None  # Set to use that site's model (see site_trainer.py)
     current_stock: Optional[int] = None
     rainfall_today: Optional[float] = None
 
 @app.post("/predict")
 async def get_prediction(request: PredictionRequest):
+    if request.site_id is not None:
+        try:
+            site_engines.get(request.site_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Unknown site '{request.site_id}'")
+        except FileNotFoundError:
+            raise HTTPException(status_code=500, detail=f"Site '{request.site_id}' is missing model or data files")
+        predicted_qty = site_engines.predict_quantity(
+            request.site_id, request.date, request.item_id,
+            current_stock=request.current_stock, rainfall_today=request.rainfall_today
+        )
+        return {"site_id": request.site_id, "item_id": request.item_id, "predicted_quantity": predicted_qty}
+
     import os
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     predicted_qty = predict_quantity(
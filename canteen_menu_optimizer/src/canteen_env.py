@@ -3,21 +3,44 @@ import numpy as np
 import pandas as pd
 import os
 
+try:
+    from .data_cache import read_table
+    from .feature_pipeline import fill_context_defaults
+except ImportError:  # Running as a script from src/
+    from data_cache import read_table
+    from feature_pipeline import fill_context_defaults
+
+# The agent sees only day context that is known for any date, past or future, and each
+# feature takes a handful of values, so states recur across weeks instead of naming a day
+POLICY_FEATURES = ('day_of_week', 'is_exam_period', 'is_holiday', 'event_today', 'rain_level')
+RAIN_LEVELS_MM = (0.5, 20)  # Dry, light, heavy (heavy matches the > 20mm rainfall rule)
+
+def policy_state(date, context):
+    """RL state for one day from its context (a dict or row with the flags and rainfall).
+
+    Missing or NaN context counts as 0, so a request carrying only a date still maps
+    to a state the agent was trained on.
+    """
+    def value(name):
+        v = context.get(name, 0) if context is not None else 0
+        return 0 if pd.isna(v) else v
+
+    rain_level = int(np.searchsorted(RAIN_LEVELS_MM, value('rainfall'), side='right'))
+    return np.array([pd.Timestamp(date).weekday(), int(value('is_exam_period') > 0), int(value('is_holiday') > 0),
+                     int(value('event_today') > 0), rain_level], dtype=np.float32)
+
 class CanteenEnv:
     def __init__(self, historical_data_path, operational_data_path=None, weather_data_path=None):
-        self.sales_data = pd.read_csv(historical_data_path)
-        self.sales_data["date"] = pd.to_datetime(self.sales_data["date"])
+        self.sales_data = read_table(historical_data_path)
         
         # Load additional data sources if provided
         if operational_data_path and os.path.exists(operational_data_path):
-            self.operational_data = pd.read_csv(operational_data_path)
-            self.operational_data["date"] = pd.to_datetime(self.operational_data["date"])
+            self.operational_data = read_table(operational_data_path)
         else:
             self.operational_data = None
             
         if weather_data_path and os.path.exists(weather_data_path):
-            self.weather_data = pd.read_csv(weather_data_path)
-            self.weather_data["date"] = pd.to_datetime(self.weather_data["date"])
+            self.weather_data = read_table(weather_data_path)
         else:
             self.weather_data = None
         
@@ -35,85 +58,26 @@ class CanteenEnv:
         # Enhanced action levels for quantity
         self.action_levels = [0, 20, 40, 60, 80, 100, 150, 200, 250, 300]
 
+        # Each day's state, built once from the logged context (defaults where a day is missing)
+        days = pd.DataFrame({"date": pd.to_datetime(self.dates)})
+        for frame in (self.operational_data, self.weather_data):
+            if frame is not None:
+                days = days.merge(frame.drop_duplicates("date"), on="date", how="left")
+        days = fill_context_defaults(days)
+        self.states = np.array([policy_state(row.date, row._asdict()) for row in days.itertuples(index=False)])
+
     def reset(self):
         self.current_step = 0
-        return self._get_enhanced_state()
+        return self._get_state()
 
-    def _get_enhanced_state(self):
+    def get_state_matrix(self):
+        """States for every date as one (max_steps, state_size) matrix"""
+        return self.states.copy()
+
+    def _get_state(self):
         if self.current_step >= self.max_steps:
             return None
-
-        current_date = self.dates[self.current_step]
-        
-        # Base temporal features
-        state_features = [
-            current_date.weekday(),  # day_of_week
-            current_date.month,      # month
-            1 if current_date.weekday() >= 5 else 0,  # is_weekend
-        ]
-        
-        # Get operational data if available
-        if self.operational_data is not None:
-            op_data = self.operational_data[self.operational_data["date"] == current_date]
-            if not op_data.empty:
-                op_row = op_data.iloc[0]
-                state_features.extend([
-                    op_row.get('student_count', 250),
-                    op_row.get('staff_available', 5),
-                    op_row.get('canteen_capacity', 300),
-                    op_row.get('event_today', 0),
-                    op_row.get('hostel_open', 1),
-                    op_row.get('is_holiday', 0),
-                    op_row.get('is_exam_period', 0),
-                ])
-            else:
-                state_features.extend([250, 5, 300, 0, 1, 0, 0])  # Default values
-        else:
-            state_features.extend([250, 5, 300, 0, 1, 0, 0])
-        
-        # Get weather data if available
-        if self.weather_data is not None:
-            weather_data = self.weather_data[self.weather_data["date"] == current_date]
-            if not weather_data.empty:
-                weather_row = weather_data.iloc[0]
-                state_features.extend([
-                    weather_row.get('temperature', 25),
-                    weather_row.get('humidity', 70),
-                    weather_row.get('rainfall', 0),
-                    weather_row.get('feels_like_temp', 25),
-                ])
-            else:
-                state_features.extend([25, 70, 0, 25])  # Default values
-        else:
-            state_features.extend([25, 70, 0, 25])
-
-        # Historical sales features
-        if self.current_step > 0:
-            prev_date = self.dates[self.current_step - 1]
-            prev_sales = self.sales_data[self.sales_data["date"] == prev_date]
-            prev_sales_by_item = prev_sales.set_index("item_id")["quantity_sold"].reindex(self.items, fill_value=0)
-            state_features.extend(prev_sales_by_item.values)
-            
-            # Add waste data if available
-            if 'waste_quantity' in prev_sales.columns:
-                prev_waste_by_item = prev_sales.set_index("item_id")["waste_quantity"].reindex(self.items, fill_value=0)
-                state_features.extend(prev_waste_by_item.values)
-            else:
-                state_features.extend([0] * len(self.items))
-        else:
-            # No previous data available
-            state_features.extend([0] * len(self.items) * 2)
-        
-        # 3-day average sales if we have enough history
-        if self.current_step >= 3:
-            recent_dates = self.dates[max(0, self.current_step-3):self.current_step]
-            recent_sales = self.sales_data[self.sales_data["date"].isin(recent_dates)]
-            avg_sales = recent_sales.groupby("item_id")["quantity_sold"].mean().reindex(self.items, fill_value=0)
-            state_features.extend(avg_sales.values)
-        else:
-            state_features.extend([0] * len(self.items))
-
-        return np.array(state_features, dtype=np.float32)
+        return self.states[self.current_step]
 
     def step(self, action_index):
         prepared_qty = self.action_levels[action_index]
@@ -147,7 +111,7 @@ class CanteenEnv:
             total_reward += item_reward
 
         self.current_step += 1
-        next_state = self._get_enhanced_state()
+        next_state = self._get_state()
 
         if self.current_step >= self.max_steps:
             done = True
@@ -158,12 +122,7 @@ class CanteenEnv:
         return len(self.action_levels)
 
     def get_state_space_size(self):
-        # Calculate total state size based on enhanced features
-        base_features = 7  # day_of_week, month, is_weekend + 4 operational features
-        weather_features = 4  # temperature, humidity, rainfall, feels_like_temp
-        historical_features = len(self.items) * 3  # prev_sales + prev_waste + 3day_avg per item
-        
-        return base_features + weather_features + historical_features
+        return len(POLICY_FEATURES)
 
 if __name__ == '__main__':
     env = CanteenEnv("canteen_menu_optimizer/data/historical_sales.csv")
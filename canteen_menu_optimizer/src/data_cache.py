@@ -0,0 +1,93 @@
+import pandas as pd
+import hashlib
+import os
+
+try:
+    from .data_schema import SCHEMA_VERSION, apply_schema, parse_dates
+except ImportError:  # Running as a script from src/
+    from data_schema import SCHEMA_VERSION, apply_schema, parse_dates
+
+try:
+    import pyarrow  # noqa: F401  Parquet needs pyarrow; without it the cache falls back to pickle
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    CACHE_FORMAT = 'pickle'
+
+CACHE_DIR_NAME = ".cache"
+_hash_memo = {}  # (path, size, mtime) -> content hash, so a file is hashed once per process
+
+def file_hash(path):
+    """SHA-256 of a file's contents (first 16 hex digits)"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _hash_memo:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        _hash_memo[memo_key] = digest.hexdigest()[:16]
+    return _hash_memo[memo_key]
+
+def _cache_key(path, dtypes):
+    # The typed frame depends on the schema as well as the file, so both go into the key
+    signature = f"{file_hash(path)}:{SCHEMA_VERSION}:{dtypes!r}"
+    return hashlib.sha256(signature.encode()).hexdigest()[:16]
+
+def _cache_path(path, content_hash):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    extension = '.parquet' if CACHE_FORMAT == 'parquet' else '.pkl'
+    return os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME, f"{stem}-{content_hash}{extension}")
+
+def _save(df, cache_path):
+    # Drop entries for older versions of the same file, then write atomically
+    cache_dir, name = os.path.split(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = name.rsplit("-", 1)[0]
+    for old in os.listdir(cache_dir):
+        if old.rsplit("-", 1)[0] == stem and old != name:
+            os.remove(os.path.join(cache_dir, old))
+    tmp_path = cache_path + ".tmp"
+    if CACHE_FORMAT == 'parquet':
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
+
+def _load(cache_path):
+    if CACHE_FORMAT == 'parquet':
+        return pd.read_parquet(cache_path)
+    return pd.read_pickle(cache_path)
+
+def _convert(df, dtypes):
+    # dtypes=None applies the column schema; anything else (e.g. np.float32) is passed to astype
+    if dtypes is None:
+        return apply_schema(df)
+    return df.astype(dtypes)
+
+def read_table(path, date_columns=("date",), dtypes=None):
+    """Read a CSV through the binary cache.
+
+    The first read parses the CSV (converting `date_columns` to datetimes and
+    columns to their compact schema dtypes, or to `dtypes` if given) and stores
+    the typed frame under data/.cache, keyed by a hash of the CSV's contents;
+    later reads load the binary copy. Editing or regenerating the CSV changes
+    the hash, so a stale cache entry is never used.
+    """
+    cache_path = _cache_path(path, _cache_key(path, dtypes))
+    if os.path.exists(cache_path):
+        try:
+            return _load(cache_path)
+        except Exception:  # Corrupt or unreadable entry: rebuild it from the CSV
+            pass
+    df = _convert(parse_dates(pd.read_csv(path), date_columns), dtypes)
+    _save(df, cache_path)
+    return df
+
+def write_table(df, path, index=False, dtypes=None):
+    """Write a CSV and prime the cache with the frame, so the next read skips parsing.
+
+    Pass the same `dtypes` the frame will be read back with.
+    """
+    df.to_csv(path, index=index)
+    frame = df.reset_index() if index else df.reset_index(drop=True)
+    _save(_convert(frame, dtypes), _cache_path(path, _cache_key(path, dtypes)))
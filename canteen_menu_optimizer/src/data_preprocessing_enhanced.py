@@ -1,148 +1,233 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder, StandardScaler
+from sklearn.preprocessing import StandardScaler
+import argparse
 import os
 import joblib
 
+from data_cache import read_table, write_table
+from data_schema import apply_schema, memory_per_row, parse_dates
+from feature_pipeline import LAG_WINDOW_DAYS, FeaturePipeline, build_daily_context, trailing_window
+
+# Fitted pipeline parameters and the trailing sales window, saved by every full or incremental run
+FEATURE_STATE_FILE = 'enhanced_feature_state.pkl'
+
+# Sales log columns the lag features read; the trailing window keeps only these
+HISTORY_COLUMNS = ['date', 'item_id', 'quantity_sold', 'waste_quantity']
+
+# Streaming mode: a chunk's peak working set (raw rows, merge and lag intermediates, CSV
+# formatting) measured at up to 8x the footprint of its finished feature rows
+WORKING_SET_FACTOR = 8
+PROBE_ROWS = 1000  # Size of the first chunk, used to measure the feature rows' footprint
+SUMMARY_CHUNK_ROWS = 100000  # Two-column chunks for the per-item summary pass
+
 def preprocess_enhanced_data(sales_path, weather_path, calendar_path, operational_path):
     # Load all data sources
-    sales_df = pd.read_csv(sales_path)
-    weather_df = pd.read_csv(weather_path)
-    calendar_df = pd.read_csv(calendar_path)
-    operational_df = pd.read_csv(operational_path)
-
-    # Convert 'date' columns to datetime objects
-    sales_df["date"] = pd.to_datetime(sales_df["date"])
-    weather_df["date"] = pd.to_datetime(weather_df["date"])
-    calendar_df["date"] = pd.to_datetime(calendar_df["date"])
-    operational_df["date"] = pd.to_datetime(operational_df["date"])
-
-    # Merge all dataframes
-    df = pd.merge(sales_df, weather_df, on="date", how="left")
-    df = pd.merge(df, calendar_df, on="date", how="left")
-    df = pd.merge(df, operational_df, on="date", how="left")
-
-    # Enhanced Feature Engineering
-    # 1. Day Context Features
-    df["day_of_week"] = df["date"].dt.dayofweek
-    df["month"] = df["date"].dt.month
-    df["day_of_year"] = df["date"].dt.dayofyear
-    df["week_of_year"] = df["date"].dt.isocalendar().week.astype(int)
-    df["is_weekend"] = (df["day_of_week"] >= 5).astype(int)
-    
-    # 2. Weather Context Features (already included: temperature, humidity, rainfall, feels_like_temp)
-    
-    # 3. Operational/Logistics Context Features (already included from operational_df)
-    
-    # 4. Enhanced Sales Context Features
-    df = df.sort_values(by=['item_id', 'date'])
-    
-    # Previous day sales and waste
-    df['sales_lag_1'] = df.groupby('item_id')['quantity_sold'].shift(1)
-    df['sales_lag_7'] = df.groupby('item_id')['quantity_sold'].shift(7)
-    
-    # 3-day average sales
-    df['sales_3day_avg'] = df.groupby('item_id')['quantity_sold'].rolling(window=3, min_periods=1).mean().reset_index(0, drop=True)
-    
-    # Previous week same day sales (weekly seasonality)
-    df['sales_same_day_prev_week'] = df.groupby('item_id')['quantity_sold'].shift(7)
-    
-    # Calculate waste (assuming some percentage of unsold items become waste)
-    df['estimated_waste'] = np.maximum(0, df['quantity_sold'] * np.random.uniform(0.05, 0.15, len(df)))
-    df['waste_lag_1'] = df.groupby('item_id')['estimated_waste'].shift(1)
-    
-    # Revenue and cost features
-    df['revenue'] = df['quantity_sold'] * df['price']
-    df['total_cost'] = df['quantity_sold'] * df['cost']
-    df['profit'] = df['revenue'] - df['total_cost']
-    
-    # Item popularity rank (based on average sales)
-    item_popularity = df.groupby('item_id')['quantity_sold'].mean().rank(ascending=False)
-    df['item_popularity_rank'] = df['item_id'].map(item_popularity)
-    
-    # Seasonal patterns
-    df['is_monsoon'] = df['month'].isin([6, 7, 8, 9]).astype(int)
-    df['is_winter'] = df['month'].isin([12, 1, 2]).astype(int)
-    df['is_summer'] = df['month'].isin([3, 4, 5]).astype(int)
-    
-    # Interaction features
-    df['temp_humidity_interaction'] = df['temperature'] * df['humidity'] / 100
-    df['rain_temp_interaction'] = df['rainfall'] * (40 - df['temperature'])  # Cold rain effect
-    df['student_weekend_interaction'] = df['student_count'] * df['is_weekend']
-    
-    # Fill NaN values created by shifting and other operations
-    df = df.fillna(0)
-
-    # Encode categorical features
-    le_item_id = LabelEncoder()
-    df["item_id_encoded"] = le_item_id.fit_transform(df["item_id"])    # Select enhanced features and target
-    features = [
-        # Day context
-        "day_of_week", "month", "day_of_year", "week_of_year", "is_weekend",
-        
-        # Weather context  
-        "temperature", "humidity", "rainfall", "feels_like_temp",
-        
-        # Operational context (from operational_data.csv)
-        "student_count", "staff_available", "canteen_capacity", "event_today",
-        "hostel_open", "is_exam_period",
-        
-        # Academic calendar (from academic_calendar.csv)
-        "is_exam_week", "is_festival",
-        
-        # Note: is_holiday comes from operational_data, not from both sources
-        
-        # Sales history context
-        "sales_lag_1", "sales_lag_7", "sales_3day_avg", "sales_same_day_prev_week",
-        "waste_lag_1",
-        
-        # Item context
-        "item_id_encoded", "item_popularity_rank",
-        
-        # Seasonal patterns
-        "is_monsoon", "is_winter", "is_summer",
-        
-        # Interaction features
-        "temp_humidity_interaction", "rain_temp_interaction", "student_weekend_interaction"
-    ]
-    
+    sales_df = read_table(sales_path)
+    weather_df = read_table(weather_path)
+    calendar_df = read_table(calendar_path)
+    operational_df = read_table(operational_path)
+    return preprocess_enhanced_frames(sales_df, weather_df, calendar_df, operational_df)
+
+def preprocess_enhanced_frames(sales_df, weather_df, calendar_df, operational_df):
+    """preprocess_enhanced_data on frames already in memory (e.g. one site's partitions)"""
+    # Enhanced Feature Engineering (day, weather, operational, sales history, item,
+    # seasonal and interaction features) is shared with serving through FeaturePipeline
+    context = build_daily_context(weather_df, calendar_df, operational_df)
+    pipeline = FeaturePipeline('enhanced').fit(sales_df)
+    df = pipeline.build_frame(sales_df.sort_values(by=['item_id', 'date']), sales_df, context)
+    le_item_id = pipeline.item_encoder
+
+    df = add_revenue_features(df)
+
+    features = pipeline.feature_columns
     target = "quantity_sold"
 
-    X = df[features]
+    X = df[features].astype(np.float64)  # Scale at full precision; the compact dtypes are for storage
     y = df[target]
 
     # Scale numerical features
     scaler = StandardScaler()
     X_scaled = scaler.fit_transform(X)
-    X_scaled_df = pd.DataFrame(X_scaled, columns=features)
+    X_scaled_df = pd.DataFrame(X_scaled, columns=features, dtype=np.float32)  # XGBoost trains on float32 anyway
 
     return X_scaled_df, y, df, scaler, le_item_id
 
+def add_revenue_features(df):
+    """Revenue and cost features (need the logged price and cost, so training data only)"""
+    df['revenue'] = df['quantity_sold'] * df['price']
+    df['total_cost'] = df['quantity_sold'] * df['cost']
+    df['profit'] = df['revenue'] - df['total_cost']
+    return apply_schema(df)
+
+def save_feature_state(filepath, pipeline, sales_df):
+    """Save the pipeline parameters and the sales window the next incremental run needs (atomically)"""
+    history_columns = [c for c in HISTORY_COLUMNS if c in sales_df.columns]
+    state = {'pipeline': pipeline.to_dict(), 'sales_window': trailing_window(sales_df[history_columns])}
+    tmp_path = filepath + ".tmp"
+    joblib.dump(state, tmp_path)
+    os.replace(tmp_path, filepath)
+
+def append_enhanced_data(new_sales_path, weather_path, calendar_path, operational_path, data_dir, models_dir):
+    """Featurize only new sales rows and append them to the preprocessed CSVs.
+
+    Lags come from the trailing window saved by the previous run and the fitted
+    scaler is reused, so the cost depends on the number of new rows, not the history.
+    """
+    state_path = os.path.join(models_dir, FEATURE_STATE_FILE)
+    state = joblib.load(state_path)
+    pipeline = FeaturePipeline.from_dict(state['pipeline'])
+    sales_window = state['sales_window']
+
+    new_sales = apply_schema(parse_dates(pd.read_csv(new_sales_path)))
+    if new_sales["date"].min() <= sales_window["date"].max():
+        raise ValueError("New sales must be dated after the last preprocessed day "
+                         f"({sales_window['date'].max().date()}); rerun the full preprocessing to backfill")
+
+    context = build_daily_context(read_table(weather_path), read_table(calendar_path), read_table(operational_path))
+    history = pd.concat([sales_window, new_sales.reindex(columns=sales_window.columns)], ignore_index=True)
+    df = pipeline.build_frame(new_sales.sort_values(by=['item_id', 'date']), history, context)
+    df = add_revenue_features(df)
+
+    # Append in the column order of the existing files
+    full_path = os.path.join(data_dir, 'full_enhanced_dataset.csv')
+    df.reindex(columns=pd.read_csv(full_path, nrows=0).columns).to_csv(full_path, mode='a', header=False, index=False)
+    scaler = joblib.load(os.path.join(models_dir, 'enhanced_scaler.pkl'))
+    X = pd.DataFrame(scaler.transform(df[pipeline.feature_columns].astype(np.float64)),
+                     columns=pipeline.feature_columns, dtype=np.float32)
+    X.to_csv(os.path.join(data_dir, 'X_enhanced_preprocessed.csv'), mode='a', header=False, index=False)
+    y = df['quantity_sold']
+    y.to_csv(os.path.join(data_dir, 'y_enhanced_target.csv'), mode='a', header=False, index=False)
+
+    save_feature_state(state_path, pipeline, history)
+    return X, y, df
+
+def item_sales_summary(sales_path):
+    """Mean quantity sold per item, accumulated over chunks of the sales log.
+
+    One row per item carries everything FeaturePipeline.fit needs (the item
+    encoding and popularity ranks), so the full log never has to be in memory.
+    """
+    totals = None
+    for chunk in pd.read_csv(sales_path, usecols=['item_id', 'quantity_sold'], chunksize=SUMMARY_CHUNK_ROWS):
+        sums = chunk.groupby('item_id')['quantity_sold'].agg(['sum', 'count'])
+        totals = sums if totals is None else totals.add(sums, fill_value=0)
+    means = totals['sum'] / totals['count']
+    return means.rename('quantity_sold').rename_axis('item_id').reset_index()
+
+def rows_per_chunk(max_memory_mb, bytes_per_row):
+    """Largest chunk whose working set fits in `max_memory_mb`"""
+    return max(1, int(max_memory_mb * 2 ** 20 / (bytes_per_row * WORKING_SET_FACTOR)))
+
+def stream_enhanced_data(sales_path, weather_path, calendar_path, operational_path, data_dir, models_dir,
+                         max_memory_mb=256):
+    """Preprocess a date-ordered sales log in chunks, writing the outputs as it goes.
+
+    Memory is bounded by `max_memory_mb` rather than by the size of the log:
+    1. item summary pass: fit the item encoding and popularity ranks;
+    2. feature pass: featurize each chunk, carrying the trailing sales window across
+       chunk boundaries for the lags, append it to full_enhanced_dataset.csv and
+       y_enhanced_target.csv and update the scaler with partial_fit;
+    3. scaling pass: reread the feature columns in chunks and write X_enhanced_preprocessed.csv.
+    Only the daily context (one row per date) and the 7-day window are held throughout.
+    Rows come out in date order rather than sorted by item.
+    """
+    context = build_daily_context(read_table(weather_path), read_table(calendar_path), read_table(operational_path))
+    pipeline = FeaturePipeline('enhanced').fit(item_sales_summary(sales_path))
+    features = pipeline.feature_columns
+    full_path = os.path.join(data_dir, 'full_enhanced_dataset.csv')
+    X_path = os.path.join(data_dir, 'X_enhanced_preprocessed.csv')
+    y_path = os.path.join(data_dir, 'y_enhanced_target.csv')
+
+    scaler = StandardScaler()
+    sales_window = None
+    chunk_rows, n_rows = PROBE_ROWS, 0
+    with pd.read_csv(sales_path, iterator=True) as reader:
+        while True:
+            try:
+                chunk = apply_schema(parse_dates(reader.get_chunk(chunk_rows)))
+            except StopIteration:
+                break
+            if sales_window is None:
+                history = chunk
+            elif chunk['date'].min() < sales_window['date'].max():
+                raise ValueError("Streaming needs the sales log sorted by date "
+                                 f"(found {chunk['date'].min().date()} after {sales_window['date'].max().date()})")
+            else:
+                history = pd.concat([sales_window, chunk.reindex(columns=sales_window.columns)], ignore_index=True)
+
+            df = add_revenue_features(pipeline.build_frame(chunk, history, context))
+            first = n_rows == 0
+            df.to_csv(full_path, mode='w' if first else 'a', header=first, index=False)
+            df[['quantity_sold']].to_csv(y_path, mode='w' if first else 'a', header=first, index=False)
+            scaler.partial_fit(df[features].astype(np.float64))
+
+            # One extra day: the next chunk may continue the last date, whose lags reach 7 days before it
+            history_columns = [c for c in HISTORY_COLUMNS if c in history.columns]
+            sales_window = trailing_window(history[history_columns], days=LAG_WINDOW_DAYS + 1)
+            if first:
+                chunk_rows = rows_per_chunk(max_memory_mb, memory_per_row(df))
+            n_rows += len(df)
+
+    with pd.read_csv(full_path, usecols=features, chunksize=chunk_rows) as reader:
+        for i, chunk in enumerate(reader):
+            X = pd.DataFrame(scaler.transform(apply_schema(chunk)[features].astype(np.float64)),
+                             columns=features, dtype=np.float32)
+            X.to_csv(X_path, mode='a' if i else 'w', header=not i, index=False)
+
+    os.makedirs(models_dir, exist_ok=True)
+    joblib.dump(scaler, os.path.join(models_dir, 'enhanced_scaler.pkl'))
+    joblib.dump(pipeline.item_encoder, os.path.join(models_dir, 'enhanced_le_item_id.pkl'))
+    save_feature_state(os.path.join(models_dir, FEATURE_STATE_FILE), pipeline, sales_window)
+    return n_rows, chunk_rows
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the enhanced feature dataset")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--append", metavar="NEW_SALES_CSV",
+                      help="featurize only these new sales rows and append them to the existing outputs")
+    mode.add_argument("--stream", action="store_true",
+                      help="process a date-ordered sales log in chunks instead of loading it whole")
+    parser.add_argument("--max-memory-mb", type=int, default=256,
+                        help="working-set budget that sizes the chunks in --stream mode")
+    args = parser.parse_args()
+
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     sales_path = os.path.join(base_dir, 'data/historical_sales.csv')
     weather_path = os.path.join(base_dir, 'data/weather_data.csv')
     calendar_path = os.path.join(base_dir, 'data/academic_calendar.csv')
     operational_path = os.path.join(base_dir, 'data/operational_data.csv')
+    models_dir = os.path.join(base_dir, 'models')
+    data_dir = os.path.join(base_dir, 'data')
 
-    X, y, df_full, scaler, le_item_id = preprocess_enhanced_data(sales_path, weather_path, calendar_path, operational_path)
-    print("Enhanced data preprocessing complete. Shape of features:", X.shape)
-    print("Feature columns:", X.columns.tolist())
-    print("First 5 rows of preprocessed features:\n", X.head())
-    print("First 5 rows of target:\n", y.head())
+    if args.append:
+        X, y, df_new = append_enhanced_data(args.append, weather_path, calendar_path, operational_path,
+                                            data_dir, models_dir)
+        print(f"Appended {len(X)} new rows to the enhanced preprocessed data.")
+    elif args.stream:
+        n_rows, chunk_rows = stream_enhanced_data(sales_path, weather_path, calendar_path, operational_path,
+                                                  data_dir, models_dir, max_memory_mb=args.max_memory_mb)
+        print(f"Streamed {n_rows} rows in chunks of up to {chunk_rows} rows; "
+              "enhanced scaler, LabelEncoder, feature state and preprocessed data saved.")
+    else:
+        X, y, df_full, scaler, le_item_id = preprocess_enhanced_data(sales_path, weather_path, calendar_path, operational_path)
+        print("Enhanced data preprocessing complete. Shape of features:", X.shape)
+        print(f"Merged dataset: {len(df_full.columns)} columns, {memory_per_row(df_full):.0f} bytes per row")
+        print("Feature columns:", X.columns.tolist())
+        print("First 5 rows of preprocessed features:\n", X.head())
+        print("First 5 rows of target:\n", y.head())
 
-    # Save enhanced models and data
-    models_dir = os.path.join(base_dir, 'models')
-    os.makedirs(models_dir, exist_ok=True)
+        # Save enhanced models and data
+        os.makedirs(models_dir, exist_ok=True)
     
-    joblib.dump(scaler, os.path.join(models_dir, 'enhanced_scaler.pkl'))
-    joblib.dump(le_item_id, os.path.join(models_dir, 'enhanced_le_item_id.pkl'))
-    print("Enhanced scaler and LabelEncoder saved.")
+        joblib.dump(scaler, os.path.join(models_dir, 'enhanced_scaler.pkl'))
+        joblib.dump(le_item_id, os.path.join(models_dir, 'enhanced_le_item_id.pkl'))
+        pipeline = FeaturePipeline('enhanced', item_encoder=le_item_id).fit(df_full)
+        save_feature_state(os.path.join(models_dir, FEATURE_STATE_FILE), pipeline, df_full)
+        print("Enhanced scaler, LabelEncoder and feature state saved.")
 
-    # Save enhanced preprocessed data
-    data_dir = os.path.join(base_dir, 'data')
-    X.to_csv(os.path.join(data_dir, 'X_enhanced_preprocessed.csv'), index=False)
-    y.to_csv(os.path.join(data_dir, 'y_enhanced_target.csv'), index=False)
-    df_full.to_csv(os.path.join(data_dir, 'full_enhanced_dataset.csv'), index=False)
-    print("Enhanced preprocessed features (X) and target (y) saved to CSV.")
+        # Save enhanced preprocessed data
+        write_table(X, os.path.join(data_dir, 'X_enhanced_preprocessed.csv'), dtypes=np.float32)
+        write_table(y.to_frame(), os.path.join(data_dir, 'y_enhanced_target.csv'))
+        write_table(df_full, os.path.join(data_dir, 'full_enhanced_dataset.csv'))
+        print("Enhanced preprocessed features (X) and target (y) saved to CSV.")
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# Every CSV in data/ stores dates as ISO days; an explicit format skips pandas' format inference
+DATE_FORMAT = "%Y-%m-%d"
+
+# Bump when COLUMN_DTYPES changes so cached frames typed with the old schema are rebuilt
+SCHEMA_VERSION = 2
+
+# Compact dtype for each known column: categorical ids, int8 flags, small ints for counts and
+# calendar fields, float32 for measurements and engineered values
+COLUMN_DTYPES = {
+    # Item identity
+    "item_id": "category", "item_name": "category", "item_id_encoded": "int16",
+    # Sales log
+    "quantity_sold": "int32", "waste_quantity": "float32", "price": "float32", "cost": "float32",
+    # Weather
+    "temperature": "float32", "humidity": "float32", "rainfall": "float32", "feels_like_temp": "float32",
+    # Operational counts
+    "student_count": "int16", "staff_available": "int16", "canteen_capacity": "int16",
+    # Calendar fields
+    "day_of_week": "int8", "month": "int8", "day_of_year": "int16", "week_of_year": "int8",
+    # 0/1 flags
+    "event_today": "int8", "hostel_open": "int8", "is_holiday": "int8", "is_exam_period": "int8",
+    "is_exam_week": "int8", "is_festival": "int8", "is_vacation": "int8", "is_weekend": "int8",
+    "is_monsoon": "int8", "is_winter": "int8", "is_summer": "int8",
+    # Engineered features
+    "sales_lag_1": "float32", "sales_lag_7": "float32", "sales_3day_avg": "float32",
+    "sales_same_day_prev_week": "float32", "waste_lag_1": "float32", "waste_ratio_lag_1": "float32",
+    "temp_humidity_interaction": "float32", "rain_temp_interaction": "float32",
+    "student_weekend_interaction": "int16", "item_popularity_rank": "float32",
+    "revenue": "float32", "total_cost": "float32", "profit": "float32",
+}
+
+# Integer widths tried in order when a column's values don't fit its schema dtype
+INT_DTYPES = ("int8", "int16", "int32", "int64")
+
+def column_dtype(column):
+    """Schema dtype for a column name, or None if the column is not in the schema"""
+    if column in COLUMN_DTYPES:
+        return COLUMN_DTYPES[column]
+    if column.startswith("stock_") or column.endswith("_stock_available"):
+        return "int8"
+    return None
+
+def apply_schema(df):
+    """Cast the frame's known columns to their schema dtypes (in place) and return it.
+
+    An integer column with missing values is stored as float32 instead, so gaps
+    survive as NaN. An integer column with values outside its schema dtype's range
+    (e.g. a student_count override above 32767) keeps the narrowest wider integer
+    dtype that holds them rather than wrapping around. Columns outside the schema
+    are left unchanged.
+    """
+    for column in df.columns:
+        dtype = column_dtype(column)
+        if dtype is None or df[column].dtype == dtype:
+            continue
+        if dtype.startswith("int"):
+            if df[column].isna().any():
+                dtype = "float32"
+            else:
+                dtype = fitting_int_dtype(df[column], dtype)
+        df[column] = df[column].astype(dtype)
+    return df
+
+def fitting_int_dtype(values, dtype):
+    """`dtype`, or the first wider integer dtype whose range holds every value.
+
+    Raises ValueError if even int64 can't hold them.
+    """
+    if len(values) == 0 or not pd.api.types.is_numeric_dtype(values):
+        return dtype
+    low, high = values.min(), values.max()
+    for candidate in INT_DTYPES[INT_DTYPES.index(dtype):]:
+        limits = np.iinfo(candidate)
+        if limits.min <= low and high <= limits.max:
+            return candidate
+    raise ValueError(f"Column {values.name!r} has values outside the int64 range ({low}..{high})")
+
+def parse_dates(df, date_columns=("date",)):
+    for column in date_columns:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], format=DATE_FORMAT)
+    return df
+
+def memory_per_row(df):
+    """Bytes per row, counting the contents of object and string columns"""
+    return df.memory_usage(deep=True).sum() / max(len(df), 1)
@@ -7,7 +7,7 @@ from datetime import date
 import logging
 import os
 
-from .enhanced_decision_engine import predict_quantity
+from .enhanced_decision_engine import SiteEngineCache, predict_quantity
 
 app = FastAPI(
     title="Enhanced Canteen Menu Optimizer",
@@ -33,9 +33,14 @@ if os.path.exists(static_path):
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Sites whose models stay loaded; others are loaded on demand, evicting the least recently used
+MAX_LOADED_SITES = 8
+site_engines = SiteEngineCache(max_sites=MAX_LOADED_SITES)
+
 class EnhancedPredictionRequest(BaseModel):
     date: str
     item_id: str
+    site_id: Optional[str] = None  # Set to use that site's model (see site_trainer.py)
     current_stock: Optional[int] = None
     rainfall_today: Optional[float] = None
     student_count: Optional[int] = None
@@ -55,6 +60,7 @@ class EnhancedPredictionRequest(BaseModel):
 
 class PredictionResponse(BaseModel):
     item_id: str
+    site_id: Optional[str] = None
     predicted_quantity: int
     model_version: str = "enhanced_v2.0"
     
@@ -94,13 +100,26 @@ async def health_check():
 @app.post("/predict", response_model=PredictionResponse)
 async def get_enhanced_prediction(request: EnhancedPredictionRequest):
     try:
-        logger.info(f"Prediction request for {request.item_id} on {request.date}")
+        logger.info(f"Prediction request for {request.item_id} on {request.date}"
+                    + (f" at site {request.site_id}" if request.site_id is not None else ""))
         
-        # Validate item_id (basic validation)
-        valid_items = [
-            "veg_biryani", "fish_curry_rice", "luchi_aloo", "ghugni", "maggi",
-            "tea_biscuit", "chicken_roll", "egg_roll", "veg_momo", "ice_cream"
-        ]
+        if request.site_id is not None:
+            try:
+                site_engine = site_engines.get(request.site_id)
+            except KeyError:
+                raise HTTPException(status_code=404, detail=f"Unknown site '{request.site_id}'")
+            except FileNotFoundError as e:
+                # A trained site whose artifacts or data partitions are incomplete is a server-side problem
+                logger.error(f"Site {request.site_id} failed to load: {str(e)}")
+                raise HTTPException(status_code=500, detail=f"Site '{request.site_id}' is missing model or data files")
+            # A site's items come from its own sales history
+            valid_items = [str(item_id) for item_id in site_engine.le_item_id.classes_]
+        else:
+            # Validate item_id (basic validation)
+            valid_items = [
+                "veg_biryani", "fish_curry_rice", "luchi_aloo", "ghugni", "maggi",
+                "tea_biscuit", "chicken_roll", "egg_roll", "veg_momo", "ice_cream"
+            ]
         
         if request.item_id not in valid_items:
             raise HTTPException(
@@ -109,22 +128,34 @@ async def get_enhanced_prediction(request: EnhancedPredictionRequest):
             )
         
         # Get enhanced prediction
-        predicted_qty = predict_quantity(
-            date=request.date,
-            item_id=request.item_id,
-            current_stock=request.current_stock,
-            rainfall_today=request.rainfall_today,
-            student_count=request.student_count,
-            event_today=request.event_today
-        )
+        if request.site_id is not None:
+            predicted_qty = site_engine.predict_quantity(
+                request.date, request.item_id,
+                current_stock=request.current_stock,
+                rainfall_today=request.rainfall_today,
+                student_count=request.student_count,
+                event_today=request.event_today
+            )
+        else:
+            predicted_qty = predict_quantity(
+                date=request.date,
+                item_id=request.item_id,
+                current_stock=request.current_stock,
+                rainfall_today=request.rainfall_today,
+                student_count=request.student_count,
+                event_today=request.event_today
+            )
         
         logger.info(f"Predicted {predicted_qty} units for {request.item_id}")
         
         return PredictionResponse(
             item_id=request.item_id,
+            site_id=request.site_id,
             predicted_quantity=predicted_qty
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Prediction error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
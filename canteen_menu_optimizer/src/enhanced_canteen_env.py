@@ -2,26 +2,74 @@ import numpy as np
 import pandas as pd
 import os
 
+try:
+    from .data_cache import read_table
+except ImportError:  # Running as a script from src/
+    from data_cache import read_table
+
 class EnhancedCanteenEnv:
-    def __init__(self, historical_data_path, operational_data_path, weather_data_path, academic_calendar_path):
-        # Load all data sources
-        self.sales_data = pd.read_csv(historical_data_path)
-        self.sales_data["date"] = pd.to_datetime(self.sales_data["date"])
-        
-        self.operational_data = pd.read_csv(operational_data_path)
-        self.operational_data["date"] = pd.to_datetime(self.operational_data["date"])
-        
-        self.weather_data = pd.read_csv(weather_data_path)
-        self.weather_data["date"] = pd.to_datetime(self.weather_data["date"])
-        
-        self.academic_data = pd.read_csv(academic_calendar_path)
-        self.academic_data["date"] = pd.to_datetime(self.academic_data["date"])
+    N_CONTEXT_FEATURES = 18  # day (5) + operational (7) + weather (4) + academic (2)
+
+    def __init__(self, historical_data_path, operational_data_path, weather_data_path, academic_calendar_path, seed=None):
+        # Load all data sources (parsed once, then read from the binary cache)
+        self.sales_data = read_table(historical_data_path)
+        self.operational_data = read_table(operational_data_path)
+        self.weather_data = read_table(weather_data_path)
+        self.academic_data = read_table(academic_calendar_path)
         
-        self.current_step = 0
         self.dates = sorted(self.sales_data["date"].unique())
-        self.max_steps = len(self.dates)
         self.items = sorted(self.sales_data["item_id"].unique())
 
+        # Precompute per-date context and per-item sales so stepping never filters DataFrames
+        self._build_matrices()
+        self._build_base_states()
+        self._init_simulation(seed)
+
+    # Arrays that fully describe the simulation once the CSVs have been parsed
+    SHARED_ARRAYS = ('dates', 'items', 'sales_matrix', 'sales_present', 'base_states')
+
+    @classmethod
+    def attach_shared(cls, directory, seed=None):
+        """Create an environment backed read-only by arrays written with publish_shared().
+
+        The .npy files are memory-mapped, so worker processes share one copy of the data
+        through the page cache and no CSV is read or parsed.
+        """
+        env = cls.__new__(cls)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+            for name in cls.SHARED_ARRAYS
+        }
+        env.sales_data = env.operational_data = env.weather_data = env.academic_data = None
+        env.dates = list(pd.DatetimeIndex(arrays['dates']))
+        env.items = [str(item) for item in arrays['items']]
+        env.sales_matrix = arrays['sales_matrix']
+        env.sales_present = arrays['sales_present']
+        env.base_states = arrays['base_states']
+        env._init_simulation(seed)
+        return env
+
+    def publish_shared(self, directory):
+        """Write the precomputed matrices as .npy files that attach_shared() can memory-map"""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {
+            'dates': np.array(self.dates, dtype='datetime64[ns]'),
+            'items': np.array(self.items, dtype=str),
+            'sales_matrix': self.sales_matrix,
+            'sales_present': self.sales_present,
+            'base_states': self.base_states,
+        }
+        for name, array in arrays.items():
+            # Write then rename so attaching workers never see a partial file
+            tmp_path = os.path.join(directory, f"{name}.tmp.npy")
+            np.save(tmp_path, np.ascontiguousarray(array))
+            os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+        return directory
+
+    def _init_simulation(self, seed):
+        self.current_step = 0
+        self.max_steps = len(self.dates)
+
         # Enhanced costs and rewards with realistic values
         self.cost_per_unit = 15  # Average cost to prepare one unit
         self.revenue_per_unit = 35 # Average revenue from selling one unit
@@ -31,150 +79,167 @@ class EnhancedCanteenEnv:
         # Enhanced action levels for quantity
         self.action_levels = [0, 20, 40, 60, 80, 100, 120, 150, 200, 250, 300]
 
-    def reset(self):
-        self.current_step = 0
-        return self._get_enhanced_state()
+        # Owned random generator so runs with the same seed are comparable
+        self.rng = np.random.default_rng(seed)
 
-    def _get_enhanced_state(self):
-        if self.current_step >= self.max_steps:
-            return None
+        # Waste columns sit after the 18 context features and the previous day sales
+        n_items = len(self.items)
+        self.waste_columns = slice(self.N_CONTEXT_FEATURES + n_items, self.N_CONTEXT_FEATURES + 2 * n_items)
+        self.waste_states = np.zeros(self.sales_matrix.shape, dtype=np.float32)
 
-        current_date = self.dates[self.current_step]
-        
-        # 1. Day Context Features
-        state_features = [
-            current_date.weekday(),  # day_of_week (0-6)
-            current_date.month,      # month (1-12)
-            current_date.dayofyear,  # day_of_year (1-365)
-            current_date.isocalendar().week,  # week_of_year
-            1 if current_date.weekday() >= 5 else 0,  # is_weekend
-        ]
-        
-        # 2. Operational Context Features
-        op_data = self.operational_data[self.operational_data["date"] == current_date]
-        if not op_data.empty:
-            op_row = op_data.iloc[0]
-            state_features.extend([
-                op_row.get('student_count', 250),
-                op_row.get('staff_available', 5),
-                op_row.get('canteen_capacity', 300),
-                op_row.get('event_today', 0),
-                op_row.get('hostel_open', 1),
-                op_row.get('is_holiday', 0),
-                op_row.get('is_exam_period', 0),
-            ])
-        else:
-            state_features.extend([250, 5, 300, 0, 1, 0, 0])  # Default values
-        
-        # 3. Weather Context Features
-        weather_data = self.weather_data[self.weather_data["date"] == current_date]
-        if not weather_data.empty:
-            weather_row = weather_data.iloc[0]
-            state_features.extend([
-                weather_row.get('temperature', 25),
-                weather_row.get('humidity', 70),
-                weather_row.get('rainfall', 0),
-                weather_row.get('feels_like_temp', 25),
-            ])
-        else:
-            state_features.extend([25, 70, 0, 25])  # Default values
-
-        # 4. Academic Calendar Features
-        academic_data = self.academic_data[self.academic_data["date"] == current_date]
-        if not academic_data.empty:
-            academic_row = academic_data.iloc[0]
-            state_features.extend([
-                academic_row.get('is_exam_week', 0),
-                academic_row.get('is_festival', 0),
+    def _build_matrices(self):
+        """Build the date x feature context matrix and the date x item sales matrices"""
+        date_index = pd.DatetimeIndex(self.dates)
+
+        # 1. Day context (day_of_week, month, day_of_year, week_of_year, is_weekend)
+        day_context = np.column_stack([
+            date_index.dayofweek,
+            date_index.month,
+            date_index.dayofyear,
+            date_index.isocalendar().week.to_numpy(),
+            (date_index.dayofweek >= 5).astype(int),
+        ])
+
+        # 2-4. Operational, weather and academic context with the same defaults as before
+        def lookup(df, columns_with_defaults):
+            rows = df.drop_duplicates("date").set_index("date").reindex(date_index)
+            return np.column_stack([
+                rows[col].fillna(default).to_numpy() if col in rows.columns else np.full(len(date_index), default)
+                for col, default in columns_with_defaults
             ])
-        else:
-            state_features.extend([0, 0])
-
-        # 5. Historical Sales Context Features
-        if self.current_step > 0:
-            # Previous day sales
-            prev_date = self.dates[self.current_step - 1]
-            prev_sales = self.sales_data[self.sales_data["date"] == prev_date]
-            prev_sales_by_item = prev_sales.set_index("item_id")["quantity_sold"].reindex(self.items, fill_value=0)
-            state_features.extend(prev_sales_by_item.values)
-            
-            # Previous day estimated waste (5-15% of sales)
-            prev_waste = prev_sales_by_item * np.random.uniform(0.05, 0.15, len(self.items))
-            state_features.extend(prev_waste.values)
-        else:
-            # No previous data available
-            state_features.extend([0] * len(self.items) * 2)
-        
-        # 6. 3-day average sales if we have enough history
-        if self.current_step >= 3:
-            recent_dates = self.dates[max(0, self.current_step-3):self.current_step]
-            recent_sales = self.sales_data[self.sales_data["date"].isin(recent_dates)]
-            avg_sales = recent_sales.groupby("item_id")["quantity_sold"].mean().reindex(self.items, fill_value=0)
-            state_features.extend(avg_sales.values)
-        else:
-            state_features.extend([0] * len(self.items))
-
-        # 7. Same day previous week sales (weekly seasonality)
-        if self.current_step >= 7:
-            prev_week_date = self.dates[self.current_step - 7]
-            prev_week_sales = self.sales_data[self.sales_data["date"] == prev_week_date]
-            prev_week_sales_by_item = prev_week_sales.set_index("item_id")["quantity_sold"].reindex(self.items, fill_value=0)
-            state_features.extend(prev_week_sales_by_item.values)
-        else:
-            state_features.extend([0] * len(self.items))
+
+        operational_context = lookup(self.operational_data, [
+            ('student_count', 250), ('staff_available', 5), ('canteen_capacity', 300),
+            ('event_today', 0), ('hostel_open', 1), ('is_holiday', 0), ('is_exam_period', 0),
+        ])
+        weather_context = lookup(self.weather_data, [
+            ('temperature', 25), ('humidity', 70), ('rainfall', 0), ('feels_like_temp', 25),
+        ])
+        academic_context = lookup(self.academic_data, [
+            ('is_exam_week', 0), ('is_festival', 0),
+        ])
+
+        self.context_matrix = np.column_stack([
+            day_context, operational_context, weather_context, academic_context
+        ]).astype(np.float64)
+
+        # Sales per date and item; missing (date, item) pairs count as zero sales
+        sales = self.sales_data.pivot(index="date", columns="item_id", values="quantity_sold")
+        sales = sales.reindex(index=date_index, columns=self.items)
+        self.sales_present = sales.notna().to_numpy()
+        self.sales_matrix = sales.fillna(0).to_numpy(dtype=np.float32)
+
+    def _build_base_states(self):
+        """Build every deterministic state row up front; only the waste noise is drawn per episode"""
+        n_dates, n_items = self.sales_matrix.shape
+        steps = np.arange(n_dates)[:, np.newaxis]
+
+        # 5. Previous day sales (zero on the first day)
+        prev_sales = np.zeros_like(self.sales_matrix)
+        prev_sales[1:] = self.sales_matrix[:-1]
+
+        # 6. 3-day average sales from cumulative sums, available from step 3
+        sales_cumsum = np.vstack([np.zeros(n_items), np.cumsum(self.sales_matrix, axis=0, dtype=np.float64)])
+        count_cumsum = np.vstack([np.zeros(n_items), np.cumsum(self.sales_present, axis=0)])
+        recent_sales = np.zeros((n_dates, n_items))
+        recent_counts = np.zeros((n_dates, n_items))
+        recent_sales[3:] = sales_cumsum[3:-1] - sales_cumsum[:-4]
+        recent_counts[3:] = count_cumsum[3:-1] - count_cumsum[:-4]
+        avg_sales = np.where(steps >= 3, recent_sales / np.maximum(recent_counts, 1), 0)
+
+        # 7. Same day previous week sales, available from step 7
+        prev_week_sales = np.zeros_like(self.sales_matrix)
+        prev_week_sales[7:] = self.sales_matrix[:-7]
 
         # 8. Seasonal and interaction features
-        is_monsoon = 1 if current_date.month in [6, 7, 8, 9] else 0
-        is_winter = 1 if current_date.month in [12, 1, 2] else 0
-        is_summer = 1 if current_date.month in [3, 4, 5] else 0
-        
-        # Get current weather for interactions
-        current_temp = state_features[12]  # temperature from weather features
-        current_humidity = state_features[13]  # humidity from weather features
-        current_rainfall = state_features[14]  # rainfall from weather features
-        current_students = state_features[5]   # student count from operational features
-        current_weekend = state_features[4]    # is_weekend from day features
-        
-        state_features.extend([
-            is_monsoon, is_winter, is_summer,
-            current_temp * current_humidity / 100,  # temp_humidity_interaction
-            current_rainfall * (40 - current_temp), # rain_temp_interaction
-            current_students * current_weekend       # student_weekend_interaction
+        month = self.context_matrix[:, 1]
+        current_temp = self.context_matrix[:, 12]
+        current_humidity = self.context_matrix[:, 13]
+        current_rainfall = self.context_matrix[:, 14]
+        current_students = self.context_matrix[:, 5]
+        current_weekend = self.context_matrix[:, 4]
+        seasonal_interaction = np.column_stack([
+            np.isin(month, [6, 7, 8, 9]),
+            np.isin(month, [12, 1, 2]),
+            np.isin(month, [3, 4, 5]),
+            current_temp * current_humidity / 100,
+            current_rainfall * (40 - current_temp),
+            current_students * current_weekend,
         ])
 
-        return np.array(state_features, dtype=np.float32)
+        # Waste columns stay zero here and are overlaid from the episode's noise draw
+        self.base_states = np.column_stack([
+            self.context_matrix, prev_sales, np.zeros((n_dates, n_items)),
+            avg_sales, prev_week_sales, seasonal_interaction
+        ]).astype(np.float32)
 
-    def step(self, action_index):
-        prepared_qty = self.action_levels[action_index]
-        current_date = self.dates[self.current_step]
-        
-        # Get actual demand for all items on this date
-        daily_sales = self.sales_data[self.sales_data["date"] == current_date]
-        daily_demand = daily_sales.set_index("item_id")["quantity_sold"].reindex(self.items, fill_value=0)
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.current_step = 0
 
-        total_reward = 0
-        done = False
+        # Previous day estimated waste (5-15% of sales), drawn for the whole episode at once
+        waste_noise = self.rng.uniform(0.05, 0.15, self.sales_matrix.shape)
+        self.waste_states = np.zeros(self.sales_matrix.shape, dtype=np.float32)
+        self.waste_states[1:] = self.sales_matrix[:-1] * waste_noise[1:]
 
-        # Calculate enhanced reward based on all items
-        for item_id in self.items:
-            actual_demand = daily_demand.get(item_id, 0)
+        return self._get_enhanced_state()
 
-            # For simplicity, assume the action applies proportionally to all items
-            # In practice, you might want separate actions per item
-            item_prepared = prepared_qty // len(self.items)  # Distribute equally
-            
-            sold_qty = min(item_prepared, actual_demand)
-            waste_qty = max(0, item_prepared - actual_demand)
-            unmet_demand = max(0, actual_demand - item_prepared)
+    def get_snapshot(self):
+        """Capture the mutable episode state cheaply (no DataFrame copies)"""
+        return {
+            'current_step': self.current_step,
+            'rng_state': self.rng.bit_generator.state,
+            'waste_states': self.waste_states,  # replaced, never mutated, on reset
+        }
 
-            # Enhanced reward calculation
-            revenue = sold_qty * self.revenue_per_unit
-            cost = item_prepared * self.cost_per_unit
-            waste_penalty = waste_qty * self.waste_penalty_per_unit
-            underproduction_penalty = unmet_demand * self.underproduction_penalty_per_unit
+    def restore(self, snapshot):
+        """Return the environment to a state captured by get_snapshot()"""
+        self.current_step = snapshot['current_step']
+        self.rng.bit_generator.state = snapshot['rng_state']
+        self.waste_states = snapshot['waste_states']
+        return self._get_enhanced_state()
+
+    def get_state_matrix(self):
+        """All states of the current episode as one (max_steps, state_size) matrix"""
+        states = np.array(self.base_states)
+        states[:, self.waste_columns] = self.waste_states
+        return states
+
+    def get_transitions(self, action_indices):
+        """Transitions for taking action_indices[t] on every day of the episode, without stepping.
 
-            item_reward = revenue - cost - waste_penalty - underproduction_penalty
-            total_reward += item_reward
+        Returns (states, actions, rewards, next_states, dones) arrays, e.g. to fill a replay buffer.
+        """
+        states = self.get_state_matrix()
+        actions = np.asarray(action_indices, dtype=np.int64)
+        item_prepared = np.asarray(self.action_levels)[actions] // len(self.items)
+        rewards = self._calculate_rewards(item_prepared, self.sales_matrix)
+
+        next_states = np.zeros_like(states)
+        next_states[:-1] = states[1:]
+        dones = np.zeros(len(states), dtype=bool)
+        dones[-1] = True
+        return states, actions, rewards, next_states, dones
+
+    def _get_enhanced_state(self):
+        if self.current_step >= self.max_steps:
+            return None
+        state = np.array(self.base_states[self.current_step])
+        state[self.waste_columns] = self.waste_states[self.current_step]
+        return state
+
+    def step(self, action_index):
+        prepared_qty = self.action_levels[action_index]
+
+        # Actual demand for all items on this date
+        daily_demand = self.sales_matrix[self.current_step]
+        done = False
+
+        # For simplicity, assume the action applies proportionally to all items
+        # In practice, you might want separate actions per item
+        item_prepared = prepared_qty // len(self.items)  # Distribute equally
+        total_reward = int(self._calculate_rewards(np.array([item_prepared]), daily_demand)[0])
 
         # Move to next step
         self.current_step += 1
@@ -186,6 +251,21 @@ class EnhancedCanteenEnv:
 
         return next_state, total_reward, done, {}
 
+    def _calculate_rewards(self, item_prepared, demand):
+        """Vectorized reward: item_prepared has shape (...,), demand has shape (..., n_items)"""
+        item_prepared = np.asarray(item_prepared)[..., np.newaxis]
+        sold_qty = np.minimum(item_prepared, demand)
+        waste_qty = np.maximum(0, item_prepared - demand)
+        unmet_demand = np.maximum(0, demand - item_prepared)
+
+        # Enhanced reward calculation
+        revenue = sold_qty * self.revenue_per_unit
+        cost = item_prepared * self.cost_per_unit
+        waste_penalty = waste_qty * self.waste_penalty_per_unit
+        underproduction_penalty = unmet_demand * self.underproduction_penalty_per_unit
+
+        return (revenue - cost - waste_penalty - underproduction_penalty).sum(axis=-1)
+
     def get_action_space_size(self):
         return len(self.action_levels)
 
@@ -207,7 +287,7 @@ if __name__ == '__main__':
     weather_path = os.path.join(base_dir, "data/weather_data.csv")
     academic_path = os.path.join(base_dir, "data/academic_calendar.csv")
     
-    env = EnhancedCanteenEnv(sales_path, operational_path, weather_path, academic_path)
+    env = EnhancedCanteenEnv(sales_path, operational_path, weather_path, academic_path, seed=42)
     state = env.reset()
     print("Initial Enhanced State Shape:", state.shape)
     print("State space size:", env.get_state_space_size())
@@ -215,7 +295,7 @@ if __name__ == '__main__':
     print("First few state features:", state[:20])
 
     # Example: take a random action
-    random_action_index = np.random.randint(0, env.get_action_space_size())
+    random_action_index = env.rng.integers(0, env.get_action_space_size())
     next_state, reward, done, _ = env.step(random_action_index)
     print("\\nAfter action", random_action_index)
     print("Next State Shape:", next_state.shape if next_state is not None else "None")
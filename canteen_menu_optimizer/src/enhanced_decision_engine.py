@@ -1,127 +1,97 @@
 import joblib
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import os
 
+try:
+    from .data_cache import read_table
+    from .feature_manifest import model_features, subset_scaler
+    from .feature_pipeline import FeaturePipeline, build_daily_context, index_sales_history
+    from .item_models import ItemModelRegistry
+    from .q_table import DenseQTable
+    from .site_partitions import list_sites, read_site, site_dir
+except ImportError:  # Running as a script from src/
+    from data_cache import read_table
+    from feature_manifest import model_features, subset_scaler
+    from feature_pipeline import FeaturePipeline, build_daily_context, index_sales_history
+    from item_models import ItemModelRegistry
+    from q_table import DenseQTable
+    from site_partitions import list_sites, read_site, site_dir
+
 class EnhancedDecisionEngine:
-    def __init__(self):
+    def __init__(self, site_id=None):
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        # A site's artifacts and partitions (see site_trainer.py), or the single-canteen files
+        models_dir = os.path.join(base_dir, "models")
+        data_dir = os.path.join(base_dir, "data")
+        if site_id is not None:
+            models_dir = site_dir(models_dir, site_id)
+        self.site_id = site_id
         
         # Load enhanced models
-        self.ml_model = joblib.load(os.path.join(base_dir, "models/enhanced_xgboost_model.pkl"))
-        self.rl_agent_data = joblib.load(os.path.join(base_dir, "models/enhanced_rl_q_table.pkl"))
-        self.scaler = joblib.load(os.path.join(base_dir, "models/enhanced_scaler.pkl"))
-        self.le_item_id = joblib.load(os.path.join(base_dir, "models/enhanced_le_item_id.pkl"))
+        self.ml_model = joblib.load(os.path.join(models_dir, "enhanced_xgboost_model.pkl"))
+        # None unless train_item_models.py was run on the global model's features
+        self.item_models = ItemModelRegistry.load(models_dir, model_features(self.ml_model))
+        rl_model_path = os.path.join(models_dir, "enhanced_rl_q_table.pkl")
+        self.rl_agent_data = joblib.load(rl_model_path) if os.path.exists(rl_model_path) else {}
+        if 'q_table' in self.rl_agent_data:  # Older files pickled the Q-table as a dict
+            self.rl_q_values = np.array(list(self.rl_agent_data['q_table'].values()))
+        elif DenseQTable.exists(rl_model_path):
+            self.rl_q_values = DenseQTable.load(rl_model_path, mmap_mode='r').values
+        else:
+            self.rl_q_values = np.zeros((0, 1))  # No RL policy (e.g. a site trained without one)
+        self.scaler = joblib.load(os.path.join(models_dir, "enhanced_scaler.pkl"))
+        self.le_item_id = joblib.load(os.path.join(models_dir, "enhanced_le_item_id.pkl"))
         
         # Load data for context
-        self.historical_sales = pd.read_csv(os.path.join(base_dir, "data/historical_sales.csv"))
-        self.weather_data = pd.read_csv(os.path.join(base_dir, "data/weather_data.csv"))
-        self.operational_data = pd.read_csv(os.path.join(base_dir, "data/operational_data.csv"))
-        self.academic_data = pd.read_csv(os.path.join(base_dir, "data/academic_calendar.csv"))
-        
-        # Convert dates
-        self.historical_sales["date"] = pd.to_datetime(self.historical_sales["date"])
-        self.weather_data["date"] = pd.to_datetime(self.weather_data["date"])
-        self.operational_data["date"] = pd.to_datetime(self.operational_data["date"])
-        self.academic_data["date"] = pd.to_datetime(self.academic_data["date"])
-        
-        # Get feature columns from the training data
-        self.feature_columns = [
-            'day_of_week', 'month', 'day_of_year', 'week_of_year', 'is_weekend',
-            'temperature', 'humidity', 'rainfall', 'feels_like_temp', 'student_count',
-            'staff_available', 'canteen_capacity', 'event_today', 'hostel_open', 'is_exam_period',
-            'is_exam_week', 'is_festival', 'sales_lag_1', 'sales_lag_7', 'sales_3day_avg',
-            'sales_same_day_prev_week', 'waste_lag_1', 'item_id_encoded', 'item_popularity_rank',
-            'is_monsoon', 'is_winter', 'is_summer', 'temp_humidity_interaction',
-            'rain_temp_interaction', 'student_weekend_interaction'
-        ]
+        if site_id is None:
+            self.historical_sales = read_table(os.path.join(data_dir, "historical_sales.csv"))
+            self.weather_data = read_table(os.path.join(data_dir, "weather_data.csv"))
+            self.operational_data = read_table(os.path.join(data_dir, "operational_data.csv"))
+            self.academic_data = read_table(os.path.join(data_dir, "academic_calendar.csv"))
+        else:
+            self.historical_sales = read_site(data_dir, site_id, "historical_sales")
+            self.weather_data = read_site(data_dir, site_id, "weather_data")
+            self.operational_data = read_site(data_dir, site_id, "operational_data")
+            self.academic_data = read_site(data_dir, site_id, "academic_calendar")
+
+        # Same feature definition and column order as data_preprocessing_enhanced.py
+        self.context = build_daily_context(self.weather_data, self.academic_data, self.operational_data)
+        self.sales_index = index_sales_history(self.historical_sales)
+        self.feature_pipeline = FeaturePipeline('enhanced', item_encoder=self.le_item_id).fit(self.historical_sales)
+        # Build and scale only the features the model was trained on (see select_features.py)
+        used_features = model_features(self.ml_model)
+        if used_features is not None and used_features != self.feature_pipeline.feature_columns:
+            self.feature_pipeline.select(used_features)
+            self.scaler = subset_scaler(self.scaler, used_features)
+        self.feature_columns = self.feature_pipeline.feature_columns
+
+    def create_feature_frame(self, requests):
+        """Feature rows for a batch of requests (columns date, item_id and optional overrides:
+        current_stock, rainfall, student_count, event_today)"""
+        return self.feature_pipeline.build_frame(requests, self.sales_index, self.context)
 
     def create_enhanced_features(self, date, item_id, current_stock=None, rainfall_today=None, 
                                 student_count=None, event_today=None):
         """Create enhanced feature vector for a single prediction"""
-        
-        pred_date = pd.to_datetime(date)
-        
-        # Basic temporal features
-        features = {
-            'day_of_week': pred_date.weekday(),
-            'month': pred_date.month,
-            'day_of_year': pred_date.dayofyear,
-            'week_of_year': pred_date.isocalendar().week,
-            'is_weekend': 1 if pred_date.weekday() >= 5 else 0,
-        }
-        
-        # Weather features (use provided or estimate)
-        if rainfall_today is not None:
-            features['rainfall'] = rainfall_today
-            # Estimate other weather based on season and rainfall
-            if pred_date.month in [6, 7, 8, 9]:  # Monsoon
-                features['temperature'] = 28 + np.random.normal(0, 2)
-                features['humidity'] = 85 + np.random.normal(0, 5)
-            elif pred_date.month in [12, 1, 2]:  # Winter
-                features['temperature'] = 20 + np.random.normal(0, 3)
-                features['humidity'] = 65 + np.random.normal(0, 8)
-            else:  # Summer/Post-monsoon
-                features['temperature'] = 32 + np.random.normal(0, 4)
-                features['humidity'] = 60 + np.random.normal(0, 10)
-        else:
-            # Use historical weather patterns or defaults
-            features.update({
-                'temperature': 27, 'humidity': 70, 'rainfall': 0
-            })
-        
-        features['feels_like_temp'] = features['temperature'] + (features['humidity'] - 60) * 0.1
-        
-        # Operational features (use provided or estimate)
-        features['student_count'] = student_count if student_count else 250
-        features['staff_available'] = 5 if pred_date.weekday() < 5 else 3
-        features['canteen_capacity'] = 450 if event_today else 320
-        features['event_today'] = event_today if event_today is not None else 0
-        features['hostel_open'] = 0 if pred_date.month in [6, 7] else 1
-        features['is_exam_period'] = 1 if pred_date.month in [5, 11] else 0
-        
-        # Academic calendar features
-        features['is_exam_week'] = features['is_exam_period']
-        features['is_festival'] = 1 if (pred_date.month == 10 and pred_date.day in [12, 13, 14, 15]) else 0
-        
-        # Historical sales features (get from data)
-        item_sales = self.historical_sales[self.historical_sales['item_id'] == item_id].sort_values('date')
-        
-        if len(item_sales) > 0:
-            # Get most recent sales for lagged features
-            features['sales_lag_1'] = item_sales.iloc[-1]['quantity_sold'] if len(item_sales) >= 1 else 0
-            features['sales_lag_7'] = item_sales.iloc[-7]['quantity_sold'] if len(item_sales) >= 7 else 0
-            features['sales_3day_avg'] = item_sales.tail(3)['quantity_sold'].mean() if len(item_sales) >= 3 else 0
-            features['sales_same_day_prev_week'] = item_sales.iloc[-7]['quantity_sold'] if len(item_sales) >= 7 else 0
-            features['waste_lag_1'] = features['sales_lag_1'] * 0.1  # Estimate 10% waste
-        else:
-            features.update({
-                'sales_lag_1': 0, 'sales_lag_7': 0, 'sales_3day_avg': 0,
-                'sales_same_day_prev_week': 0, 'waste_lag_1': 0
-            })
-        
-        # Item features
-        try:
-            features['item_id_encoded'] = self.le_item_id.transform([item_id])[0]
-        except:
-            features['item_id_encoded'] = 0
-            
-        # Item popularity (calculate from historical data)
-        item_avg_sales = self.historical_sales.groupby('item_id')['quantity_sold'].mean()
-        features['item_popularity_rank'] = item_avg_sales.rank(ascending=False).get(item_id, 5)
-        
-        # Seasonal features
-        features['is_monsoon'] = 1 if pred_date.month in [6, 7, 8, 9] else 0
-        features['is_winter'] = 1 if pred_date.month in [12, 1, 2] else 0
-        features['is_summer'] = 1 if pred_date.month in [3, 4, 5] else 0
-        
-        # Interaction features
-        features['temp_humidity_interaction'] = features['temperature'] * features['humidity'] / 100
-        features['rain_temp_interaction'] = features['rainfall'] * (40 - features['temperature'])
-        features['student_weekend_interaction'] = features['student_count'] * features['is_weekend']
-        
-        return features
+        request = pd.DataFrame({
+            'date': [date], 'item_id': [item_id], 'current_stock': [current_stock],
+            'rainfall': [rainfall_today], 'student_count': [student_count], 'event_today': [event_today]
+        }).astype({'current_stock': float, 'rainfall': float, 'student_count': float, 'event_today': float})
+        return self.create_feature_frame(request).iloc[0].to_dict()
+
+    def predict_scaled(self, features_scaled, item_ids):
+        """ML predictions for scaled feature rows, routed to per-item models when there are any"""
+        if self.item_models is None:
+            return self.ml_model.predict(features_scaled)
+        return self.item_models.predict(features_scaled, item_ids, self.ml_model)
+
+    def predict_demand(self, requests):
+        """ML predictions for a batch of requests (see create_feature_frame), one predict call per model"""
+        features = self.feature_pipeline.transform(requests, self.sales_index, self.context)
+        return self.predict_scaled(self.scaler.transform(features), requests['item_id'].tolist())
 
     def predict_quantity(self, date, item_id, current_stock=None, rainfall_today=None,
                         student_count=None, event_today=None):
@@ -139,16 +109,14 @@ class EnhancedDecisionEngine:
         features_scaled = self.scaler.transform(features_df)
         
         # ML prediction
-        ml_prediction = self.ml_model.predict(features_scaled)[0]
+        ml_prediction = self.predict_scaled(features_scaled, [item_id])[0]
         
         # RL adjustment (simplified - using average Q-values)
         rl_adjustment = 0
-        if hasattr(self.rl_agent_data, 'get') and 'q_table' in self.rl_agent_data:
+        if len(self.rl_q_values):
             # Get average Q-value as a rough adjustment
-            q_values = list(self.rl_agent_data['q_table'].values())
-            if q_values:
-                avg_q = np.mean([np.max(q) for q in q_values])
-                rl_adjustment = avg_q * 0.01  # Small adjustment factor
+            avg_q = self.rl_q_values.max(axis=1).mean()
+            rl_adjustment = avg_q * 0.01  # Small adjustment factor
         
         # Combine predictions
         combined_prediction = ml_prediction + rl_adjustment
@@ -193,6 +161,45 @@ class EnhancedDecisionEngine:
         
         return int(round(final_quantity))
 
+class SiteEngineCache:
+    """Per-site engines loaded on first use, keeping at most `max_sites` in memory.
+
+    One deployment can serve many canteens: a site's model, scaler and context
+    are only loaded when it gets a request, and the least recently used site is
+    dropped once the limit is reached. Only sites trained into models/sites/ are
+    loaded; any other id raises KeyError before a path is built from it.
+    """
+
+    def __init__(self, max_sites=8):
+        self.max_sites = max_sites
+        self._engines = OrderedDict()
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.models_dir = os.path.join(base_dir, "models")
+
+    def __len__(self):
+        return len(self._engines)
+
+    def __contains__(self, site_id):
+        return site_id in self._engines
+
+    def get(self, site_id):
+        if site_id in self._engines:
+            self._engines.move_to_end(site_id)
+            return self._engines[site_id]
+        # Ids come from requests: match them against the trained sites, never join them into a path first
+        if site_id not in list_sites(self.models_dir):
+            raise KeyError(site_id)
+        engine = EnhancedDecisionEngine(site_id=site_id)
+        self._engines[site_id] = engine
+        if len(self._engines) > self.max_sites:
+            self._engines.popitem(last=False)
+        return engine
+
+    def predict_quantity(self, site_id, date, item_id, current_stock=None, rainfall_today=None,
+                         student_count=None, event_today=None):
+        return self.get(site_id).predict_quantity(date, item_id, current_stock, rainfall_today,
+                                                  student_count, event_today)
+
 def predict_quantity(date, item_id, current_stock=None, rainfall_today=None,
                     student_count=None, event_today=None):
     """Wrapper function for compatibility"""
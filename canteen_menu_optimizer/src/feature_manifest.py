@@ -0,0 +1,42 @@
+import numpy as np
+import joblib
+import os
+from sklearn.preprocessing import StandardScaler
+
+# The feature subset chosen by select_features.py; training uses it when present, and serving
+# follows whatever features the loaded model was trained on
+FEATURE_MANIFEST_FILE = "enhanced_feature_manifest.pkl"
+
+def manifest_path(models_dir):
+    return os.path.join(models_dir, FEATURE_MANIFEST_FILE)
+
+def load_feature_manifest(models_dir):
+    """The saved feature selection, or None if every feature is used"""
+    path = manifest_path(models_dir)
+    return joblib.load(path) if os.path.exists(path) else None
+
+def save_feature_manifest(models_dir, manifest):
+    tmp_path = manifest_path(models_dir) + ".tmp"
+    joblib.dump(manifest, tmp_path)
+    os.replace(tmp_path, manifest_path(models_dir))
+
+def selected_features(models_dir):
+    """Feature columns to train on: the manifest's selection, or None for all of them"""
+    manifest = load_feature_manifest(models_dir)
+    return None if manifest is None else list(manifest['features'])
+
+def model_features(model):
+    """Feature names a fitted XGBoost model was trained on (None if it was trained without names)"""
+    return model.get_booster().feature_names
+
+def subset_scaler(scaler, columns):
+    """A StandardScaler for `columns` only, with the statistics `scaler` learnt for them"""
+    positions = [list(scaler.feature_names_in_).index(column) for column in columns]
+    subset = StandardScaler(with_mean=scaler.with_mean, with_std=scaler.with_std)
+    for attribute in ('mean_', 'var_', 'scale_'):
+        values = getattr(scaler, attribute)
+        setattr(subset, attribute, None if values is None else values[positions])
+    subset.n_samples_seen_ = scaler.n_samples_seen_
+    subset.n_features_in_ = len(columns)
+    subset.feature_names_in_ = np.array(columns, dtype=object)
+    return subset
@@ -0,0 +1,255 @@
+import pandas as pd
+import numpy as np
+from sklearn.preprocessing import LabelEncoder
+
+try:
+    from .data_schema import apply_schema
+except ImportError:  # Running as a script from src/
+    from data_schema import apply_schema
+
+# Column order expected by the saved scalers and models; both training and serving select from here
+BASIC_FEATURES = [
+    "day_of_week", "month", "day_of_year", "week_of_year",
+    "temperature", "humidity", "rainfall", "feels_like_temp",
+    "is_exam_week", "is_festival", "is_weekend", "is_exam_period", "is_vacation",
+    "student_count", "staff_available", "canteen_capacity",
+    "event_today", "hostel_open",
+    "sales_lag_1", "sales_lag_7", "sales_3day_avg",
+    "waste_lag_1", "waste_ratio_lag_1", "item_id_encoded"
+]
+
+ENHANCED_FEATURES = [
+    # Day context
+    "day_of_week", "month", "day_of_year", "week_of_year", "is_weekend",
+    # Weather context
+    "temperature", "humidity", "rainfall", "feels_like_temp",
+    # Operational context
+    "student_count", "staff_available", "canteen_capacity", "event_today",
+    "hostel_open", "is_exam_period",
+    # Academic calendar
+    "is_exam_week", "is_festival",
+    # Sales history context
+    "sales_lag_1", "sales_lag_7", "sales_3day_avg", "sales_same_day_prev_week",
+    "waste_lag_1",
+    # Item context
+    "item_id_encoded", "item_popularity_rank",
+    # Seasonal patterns
+    "is_monsoon", "is_winter", "is_summer",
+    # Interaction features
+    "temp_humidity_interaction", "rain_temp_interaction", "student_weekend_interaction"
+]
+
+# Features computed by a shared step; build_frame skips a step when none of its features are used
+SALES_HISTORY_FEATURES = [
+    "sales_lag_1", "sales_lag_7", "sales_3day_avg", "sales_same_day_prev_week",
+    "waste_lag_1", "waste_ratio_lag_1"
+]
+INTERACTION_FEATURES = ["temp_humidity_interaction", "rain_temp_interaction", "student_weekend_interaction"]
+
+# Share of sales assumed wasted when the sales log has no waste_quantity column
+ESTIMATED_WASTE_RATE = 0.1
+
+# Longest look-back of any sales history feature (sales_lag_7), in days
+LAG_WINDOW_DAYS = 7
+
+def build_daily_context(weather_df, calendar_df, operational_df):
+    """One row per date with weather, operational and calendar columns.
+
+    A column present in several sources (is_holiday) keeps the operational value,
+    falling back to the calendar where operational data is missing.
+    """
+    context = None
+    for frame in (weather_df, operational_df, calendar_df):
+        frame = frame.copy()
+        frame["date"] = pd.to_datetime(frame["date"])
+        frame = frame.drop_duplicates("date").set_index("date")
+        context = frame if context is None else context.combine_first(frame)
+    return context.reset_index()
+
+def fill_context_defaults(df):
+    """Fill context missing for a date (e.g. a future day) with seasonal and weekday defaults"""
+    month = df["date"].dt.month
+    weekday = df["date"].dt.dayofweek
+    is_monsoon, is_winter = month.isin([6, 7, 8, 9]), month.isin([12, 1, 2])
+
+    def fill(column, default):
+        default = pd.Series(default, index=df.index)
+        df[column] = df[column].fillna(default) if column in df.columns else default
+
+    fill("temperature", np.select([is_monsoon, is_winter], [28.0, 20.0], 32.0))
+    fill("humidity", np.select([is_monsoon, is_winter], [85.0, 65.0], 60.0))
+    fill("rainfall", 0.0)
+    fill("feels_like_temp", df["temperature"] + (df["humidity"] - 60) * 0.1)
+    fill("student_count", 250)
+    fill("staff_available", np.where(weekday < 5, 5, 3))
+    fill("event_today", 0)
+    fill("canteen_capacity", np.where(df["event_today"] > 0, 450, 320))
+    fill("hostel_open", (~month.isin([6, 7])).astype(int))
+    fill("is_exam_period", month.isin([5, 11]).astype(int))
+    fill("is_exam_week", df["is_exam_period"])
+    fill("is_festival", ((month == 10) & df["date"].dt.day.isin([12, 13, 14, 15])).astype(int))
+    fill("is_holiday", 0)
+    fill("is_vacation", 0)
+    return df
+
+def add_date_features(df):
+    dates = df["date"].dt
+    df["day_of_week"] = dates.dayofweek
+    df["month"] = dates.month
+    df["day_of_year"] = dates.dayofyear
+    df["week_of_year"] = dates.isocalendar().week.astype(int).to_numpy()
+    df["is_weekend"] = (df["day_of_week"] >= 5).astype(int)
+    df["is_monsoon"] = df["month"].isin([6, 7, 8, 9]).astype(int)
+    df["is_winter"] = df["month"].isin([12, 1, 2]).astype(int)
+    df["is_summer"] = df["month"].isin([3, 4, 5]).astype(int)
+    return df
+
+def _lag(series, item_ids, dates, days):
+    """Value of an (item_id, date)-indexed series `days` days before each row; NaN if not logged"""
+    index = pd.MultiIndex.from_arrays([item_ids, dates - pd.Timedelta(days=days)])
+    return series.reindex(index).to_numpy(dtype=np.float64)
+
+def index_sales_history(sales_history):
+    """Sales (and waste) per (item_id, date), the lookup table used for lag features.
+
+    Serving code can build this once and pass it to build_frame/transform in place
+    of the raw sales log, so each request batch skips the group-by.
+    """
+    history = sales_history.copy()
+    history["date"] = pd.to_datetime(history["date"])
+    value_columns = ["quantity_sold"] + (["waste_quantity"] if "waste_quantity" in history.columns else [])
+    history = history.groupby(["item_id", "date"])[value_columns].sum()
+    if "waste_quantity" not in history.columns:
+        history["waste_quantity"] = history["quantity_sold"] * ESTIMATED_WASTE_RATE
+    return history
+
+def trailing_window(sales_history, days=LAG_WINDOW_DAYS):
+    """The last `days` days of the sales log: all the history the next day's lag features need"""
+    dates = pd.to_datetime(sales_history["date"])
+    return sales_history[dates > dates.max() - pd.Timedelta(days=days)].reset_index(drop=True)
+
+def add_sales_history_features(df, sales_history):
+    """Calendar-day lags of each item's sales and waste, looked up from the sales log.
+
+    Lags always refer to days before the row's date, so a training row and a
+    serving request for the same (item, date) get identical values.
+    """
+    if not isinstance(sales_history.index, pd.MultiIndex):
+        sales_history = index_sales_history(sales_history)
+    sales, waste = sales_history["quantity_sold"], sales_history["waste_quantity"]
+
+    item_ids, dates = df["item_id"].to_numpy(), pd.DatetimeIndex(df["date"])
+    recent = np.column_stack([_lag(sales, item_ids, dates, days) for days in (1, 2, 3)])
+    logged_days = (~np.isnan(recent)).sum(axis=1)
+
+    df["sales_lag_1"] = np.nan_to_num(recent[:, 0])
+    df["sales_lag_7"] = np.nan_to_num(_lag(sales, item_ids, dates, 7))
+    df["sales_3day_avg"] = np.nansum(recent, axis=1) / np.maximum(logged_days, 1)
+    df["sales_same_day_prev_week"] = df["sales_lag_7"]
+    df["waste_lag_1"] = np.nan_to_num(_lag(waste, item_ids, dates, 1))
+    df["waste_ratio_lag_1"] = df["waste_lag_1"] / (df["sales_lag_1"] + 1)  # Avoid division by zero
+    return df
+
+def add_interaction_features(df):
+    df["temp_humidity_interaction"] = df["temperature"] * df["humidity"] / 100
+    df["rain_temp_interaction"] = df["rainfall"] * (40 - df["temperature"])  # Cold rain effect
+    df["student_weekend_interaction"] = df["student_count"] * df["is_weekend"]
+    return df
+
+class FeaturePipeline:
+    """Single feature definition shared by preprocessing, training and the decision engines.
+
+    `fit` learns the item encoding and popularity ranks from the sales log; `build_frame`
+    turns any batch of (date, item_id) rows - the full history or a few serving requests -
+    into the same columns with vectorized operations. Request rows may carry context
+    overrides (rainfall, student_count, event_today, ...) and a current_stock column.
+    """
+
+    FEATURE_SETS = {'basic': BASIC_FEATURES, 'enhanced': ENHANCED_FEATURES}
+
+    def __init__(self, feature_set='enhanced', item_encoder=None):
+        self.feature_set = feature_set
+        self.item_encoder = item_encoder
+        self.item_popularity = None
+        self.feature_columns = None
+
+    def fit(self, sales_df):
+        """Learn the item encoding (unless one was given) and popularity ranks from the sales log"""
+        if self.item_encoder is None:
+            self.item_encoder = LabelEncoder().fit(sales_df["item_id"])
+        self.item_popularity = sales_df.groupby("item_id")["quantity_sold"].mean().rank(ascending=False)
+
+        self.feature_columns = list(self.FEATURE_SETS[self.feature_set])
+        if self.feature_set == 'basic':
+            self.feature_columns += [f"{item}_stock_available" for item in self.item_encoder.classes_]
+        return self
+
+    def select(self, columns):
+        """Restrict the pipeline to `columns`, a subset of its features in the order a model expects.
+
+        build_frame then skips the sales history lookups and interaction features
+        when none of them are selected.
+        """
+        unknown = [column for column in columns if column not in self.feature_columns]
+        if unknown:
+            raise ValueError(f"Not {self.feature_set} features: {', '.join(unknown)}")
+        self.feature_columns = list(columns)
+        return self
+
+    def to_dict(self):
+        """Plain-data representation for saving alongside the preprocessed data"""
+        return {
+            'feature_set': self.feature_set,
+            'item_classes': list(self.item_encoder.classes_),
+            'item_popularity': self.item_popularity.to_dict(),
+            'feature_columns': self.feature_columns
+        }
+
+    @classmethod
+    def from_dict(cls, params):
+        item_encoder = LabelEncoder()
+        item_encoder.classes_ = np.array(params['item_classes'], dtype=object)
+        pipeline = cls(params['feature_set'], item_encoder=item_encoder)
+        pipeline.item_popularity = pd.Series(params['item_popularity'], dtype=np.float64)
+        pipeline.feature_columns = list(params['feature_columns'])
+        return pipeline
+
+    def build_frame(self, rows, sales_history, context):
+        """Rows joined with their daily context plus every engineered feature"""
+        df = rows.copy()
+        df["date"] = pd.to_datetime(df["date"])
+
+        # Columns supplied on the rows (request overrides) win over the logged context
+        df = df.merge(context, on="date", how="left", suffixes=("", "_context"))
+        for column in context.columns.drop("date"):
+            if column + "_context" in df.columns:
+                df[column] = df[column].fillna(df.pop(column + "_context"))
+        df = fill_context_defaults(df)
+
+        used = set(self.feature_columns)
+        df = add_date_features(df)
+        if used.intersection(SALES_HISTORY_FEATURES):
+            df = add_sales_history_features(df, sales_history)
+        if used.intersection(INTERACTION_FEATURES):
+            df = add_interaction_features(df)
+
+        codes = {item: code for code, item in enumerate(self.item_encoder.classes_)}
+        item_ids = df["item_id"].astype(str)  # Mapping a categorical column would return categories
+        df["item_id_encoded"] = item_ids.map(codes).fillna(0).astype(int)  # Unknown items encode as 0
+        if "item_popularity_rank" in used:
+            df["item_popularity_rank"] = item_ids.map(self.item_popularity).fillna(self.item_popularity.mean())
+
+        # Stock availability per item (basic features only): a logged stock_<item> column, else the
+        # row's current_stock for its own item. One column per item, so skipped for the enhanced set
+        if self.feature_set == 'basic':
+            current_stock = df["current_stock"] if "current_stock" in df.columns else pd.Series(np.nan, index=df.index)
+            for item in self.item_encoder.classes_:
+                available = df[f"stock_{item}"] if f"stock_{item}" in df.columns else pd.Series(1, index=df.index)
+                own_stock = (df["item_id"] == item) & current_stock.notna()
+                df[f"{item}_stock_available"] = np.where(own_stock, (current_stock > 0).astype(int), available)
+
+        return apply_schema(df.fillna(0))
+
+    def transform(self, rows, sales_history, context):
+        """Feature matrix for `rows` in the fitted column order, as float64 like the matrix the scaler was fitted on"""
+        return self.build_frame(rows, sales_history, context)[self.feature_columns].astype(np.float64)
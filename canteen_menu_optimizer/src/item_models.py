@@ -0,0 +1,57 @@
+import joblib
+import numpy as np
+import os
+import warnings
+
+# Specialised demand models live in models/enhanced_item_models/: one <group>.pkl per item or
+# item cluster, plus a registry mapping each routed item to its group (see train_item_models.py)
+ITEM_MODELS_DIR = "enhanced_item_models"
+REGISTRY_FILE = "registry.pkl"
+
+def registry_path(models_dir):
+    return os.path.join(models_dir, ITEM_MODELS_DIR, REGISTRY_FILE)
+
+def group_model_path(models_dir, group):
+    return os.path.join(models_dir, ITEM_MODELS_DIR, f"{group}.pkl")
+
+class ItemModelRegistry:
+    """Routes prediction rows to the specialised model of their item.
+
+    Items that have no specialised model, or whose model did not beat the
+    global one in the backtest, are predicted by the global model.
+    """
+
+    def __init__(self, item_groups, models):
+        self.item_groups = item_groups  # item_id -> group
+        self.models = models  # group -> model
+
+    @classmethod
+    def load(cls, models_dir, features=None):
+        """The registry under `models_dir`, or None if no item models were trained there.
+
+        The item models share the global model's scaled feature vector, so a
+        registry trained on other `features` than the global model's is ignored
+        (with a warning) until train_item_models.py is rerun.
+        """
+        path = registry_path(models_dir)
+        if not os.path.exists(path):
+            return None
+        registry = joblib.load(path)
+        if features is not None and registry.get('features') != list(features):
+            warnings.warn(f"Ignoring the item models in {os.path.dirname(path)}: they were trained on other "
+                          "features than the global model; rerun train_item_models.py")
+            return None
+        item_groups = registry['items']
+        models = {group: joblib.load(group_model_path(models_dir, group)) for group in set(item_groups.values())}
+        return cls(item_groups, models)
+
+    def predict(self, features, item_ids, fallback_model):
+        """Predictions for the rows of `features`, with one predict call per model"""
+        rows_by_group = {}
+        for row, item_id in enumerate(item_ids):
+            rows_by_group.setdefault(self.item_groups.get(item_id), []).append(row)
+        predictions = np.empty(len(features), dtype=np.float32)
+        for group, rows in rows_by_group.items():
+            model = fallback_model if group is None else self.models[group]
+            predictions[rows] = model.predict(features[rows])
+        return predictions
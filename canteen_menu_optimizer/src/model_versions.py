@@ -0,0 +1,131 @@
+import pandas as pd
+import argparse
+import joblib
+import os
+import sys
+import time
+
+from data_cache import file_hash
+from feature_manifest import selected_features
+
+# Every training run saves a bundle (model plus metadata) under models/enhanced_xgboost_versions/;
+# the current one is also published as enhanced_xgboost_model.pkl, the file the engines load
+VERSIONS_DIR = "enhanced_xgboost_versions"
+CURRENT_FILE = "CURRENT"
+MODEL_FILE = "enhanced_xgboost_model.pkl"
+SCALER_FILE = "enhanced_scaler.pkl"
+KEEP_VERSIONS = 30  # Older bundles are deleted, except the current one and its parent
+
+def _dump_atomic(obj, path):
+    tmp_path = path + ".tmp"
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+def _version_path(models_dir, version):
+    return os.path.join(models_dir, VERSIONS_DIR, f"{version}.pkl")
+
+def list_versions(models_dir):
+    versions_dir = os.path.join(models_dir, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(name[:-len(".pkl")] for name in os.listdir(versions_dir) if name.endswith(".pkl"))
+
+def load_version(models_dir, version):
+    return joblib.load(_version_path(models_dir, version))
+
+def current_version(models_dir):
+    path = os.path.join(models_dir, VERSIONS_DIR, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read().strip()
+
+def current_bundle(models_dir):
+    """The published bundle, or None before the first versioned training run"""
+    version = current_version(models_dir)
+    return load_version(models_dir, version) if version else None
+
+def publish(models_dir, version):
+    """Make `version` the model the engines load (model file first, then the pointer)"""
+    bundle = load_version(models_dir, version)
+    _dump_atomic(bundle['model'], os.path.join(models_dir, MODEL_FILE))
+    pointer_path = os.path.join(models_dir, VERSIONS_DIR, CURRENT_FILE)
+    with open(pointer_path + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(pointer_path + ".tmp", pointer_path)
+    return bundle
+
+def save_version(models_dir, model, metadata):
+    """Save a new bundle, publish it and prune old bundles; returns the version id"""
+    os.makedirs(os.path.join(models_dir, VERSIONS_DIR), exist_ok=True)
+    existing = list_versions(models_dir)
+    version = f"v{int(existing[-1][1:]) + 1 if existing else 1:04d}"
+    bundle = {
+        'version': version,
+        'parent': current_version(models_dir),
+        'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+        **metadata,
+        'model': model
+    }
+    _dump_atomic(bundle, _version_path(models_dir, version))
+    publish(models_dir, version)
+    for old in list_versions(models_dir)[:-KEEP_VERSIONS]:
+        if old != bundle['parent']:  # Keep the default rollback target, however old
+            os.remove(_version_path(models_dir, old))
+    return version
+
+def incompatibility(models_dir, bundle):
+    """Why `bundle` cannot serve with the current scaler and feature selection, or None if it can"""
+    scaler_path = os.path.join(models_dir, SCALER_FILE)
+    if bundle.get('scaler_hash') != file_hash(scaler_path):
+        return f"it was trained on features scaled by a different {SCALER_FILE}"
+    features = selected_features(models_dir) or list(joblib.load(scaler_path).feature_names_in_)
+    if bundle.get('features') != features:
+        return "it was trained on a different feature set than the current selection"
+    return None
+
+def rollback(models_dir, version=None, force=False):
+    """Republish `version`, by default the parent of the current bundle.
+
+    Only the model is versioned, so a bundle trained before the preprocessing or
+    the feature selection was rerun is refused unless `force` is set.
+    """
+    if version is None:
+        version = current_bundle(models_dir)['parent']
+        if version is None:
+            raise ValueError("The current version has no parent to roll back to")
+    if version not in list_versions(models_dir):
+        raise ValueError(f"Unknown model version {version}; available: {', '.join(list_versions(models_dir))}")
+    reason = None if force else incompatibility(models_dir, load_version(models_dir, version))
+    if reason is not None:
+        raise ValueError(f"Cannot roll back to {version}: {reason}. Retrain with train_enhanced_ml_model.py, "
+                         f"or pass --force to publish it anyway")
+    return publish(models_dir, version)
+
+def version_table(models_dir):
+    """One row of metadata per saved bundle"""
+    rows = [{key: value for key, value in load_version(models_dir, version).items() if key != 'model'}
+            for version in list_versions(models_dir)]
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or roll back versions of the enhanced XGBoost model")
+    parser.add_argument("--rollback", nargs="?", const="", metavar="VERSION",
+                        help="republish VERSION (default: the current version's parent)")
+    parser.add_argument("--force", action="store_true",
+                        help="roll back even if the version was trained with a different scaler or feature set")
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    models_dir = os.path.join(base_dir, "models")
+    if args.rollback is not None:
+        try:
+            bundle = rollback(models_dir, args.rollback or None, force=args.force)
+        except ValueError as e:  # Unknown or incompatible version: report it, not a traceback
+            sys.exit(str(e))
+        print(f"Rolled back to {bundle['version']} ({bundle['mode']} training, {bundle['created']})")
+    table = version_table(models_dir)
+    print(f"Current version: {current_version(models_dir)}")
+    if len(table):
+        print(table[['version', 'parent', 'created', 'mode', 'trees', 'trained_rows', 'last_date',
+                     'rmse', 'seconds']].to_string(index=False))
@@ -0,0 +1,252 @@
+import numpy as np
+import pandas as pd
+import argparse
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from enhanced_canteen_env import EnhancedCanteenEnv
+from q_table import DenseQTable, decode_keys, encode_keys
+from state_quantizer import StateQuantizer
+from train_enhanced_rl_agent import EnhancedQLearningAgent
+
+# The table every worker starts a round from, published next to the shared env arrays
+Q_TABLE_FILES = {'keys': "q_table_state_keys.npy", 'values': "q_table_q_values.npy"}
+
+def merge_q_tables(base, updates, n_actions):
+    """Apply the workers' Q-value changes to the table they all started the round from.
+
+    `base` is the (key_words, q_values) pair published for the round, and each entry
+    of `updates` is one worker's (key_words, deltas) for only the rows it changed
+    (see _run_worker); key_words are state keys packed by q_table.encode_keys. Each
+    entry moves by the mean change of the workers that actually updated it, so one
+    worker's update is kept in full instead of being diluted by workers that never
+    visited the state. States first seen during the round start from zero and
+    only count the workers that added them.
+    """
+    key_words, values = merge_q_arrays(base, updates, n_actions)
+    return DenseQTable.from_arrays(decode_keys(key_words), values)
+
+def merge_q_arrays(base, updates, n_actions):
+    """merge_q_tables() on plain arrays: the merged (key_words, q_values) pair, sorted by key.
+
+    Keeping the table sorted lets the next round's merge skip sorting it: only the
+    touched keys are sorted and binary-searched, and new states are slotted in.
+    """
+    base_words, base_values = base
+    base_values = np.asarray(base_values).reshape(-1, n_actions)
+    n_base = len(base_values)
+    words = _stack_words([base_words] + [words for words, _ in updates])
+    keys = _sort_keys(words)
+
+    # A stable sort is linear on input that is already in order, like the previous round's result
+    sorter = np.argsort(keys[:n_base], kind='stable')
+    base_keys = keys[:n_base][sorter]
+    update_keys = keys[n_base:]
+
+    # Touched keys missing from the base are new states, inserted at their sorted position
+    touched_keys, first = np.unique(update_keys, return_index=True)
+    position = np.searchsorted(base_keys, touched_keys)
+    known = position < n_base
+    known[known] = base_keys[position[known]] == touched_keys[known]
+    added = np.flatnonzero(~known)
+    added_rows = position[added] + np.arange(len(added))
+    is_base = np.ones(n_base + len(added), dtype=bool)
+    is_base[added_rows] = False
+
+    merged_keys = np.empty(len(is_base), dtype=keys.dtype)
+    merged_keys[is_base] = base_keys
+    merged_keys[added_rows] = touched_keys[added]
+    merged_words = np.empty((len(is_base), words.shape[1]), dtype=np.int64)
+    merged_words[is_base] = words[:n_base][sorter]
+    merged_words[added_rows] = words[n_base:][first[added]]
+
+    start = np.zeros((len(is_base), n_actions))
+    start[is_base] = base_values[sorter]
+    totals = np.zeros_like(start)
+    counts = np.zeros(start.shape, dtype=np.int64)
+    rows = np.searchsorted(merged_keys, update_keys)
+    offset = 0
+    for _, deltas in updates:
+        deltas = np.asarray(deltas, dtype=np.float64).reshape(-1, n_actions)
+        row_index = rows[offset:offset + len(deltas)]  # Keys are unique within a worker, so rows never repeat
+        totals[row_index] += deltas
+        counts[row_index] += deltas != 0
+        offset += len(deltas)
+
+    values = (start + totals / np.maximum(counts, 1)).astype(base_values.dtype)
+    return merged_words, values
+
+def _sort_keys(words):
+    """One sortable value per packed key: its single word, or its words high first as big-endian bytes"""
+    if words.shape[1] == 1:
+        return words[:, 0]
+    # Words are non-negative, so comparing big-endian bytes orders keys numerically
+    high_first = np.ascontiguousarray(words[:, ::-1]).astype('>i8')
+    return high_first.view(np.dtype((np.void, 8 * words.shape[1]))).ravel()
+
+def _stack_words(blocks):
+    """Concatenate key word arrays, zero-padding narrower ones (high words are zero for smaller keys)"""
+    blocks = [np.asarray(block, dtype=np.int64) for block in blocks]
+    n_words = max(block.shape[1] for block in blocks)
+    return np.vstack([np.pad(block, ((0, 0), (0, n_words - block.shape[1]))) for block in blocks])
+
+def _publish_q_table(shared_dir, key_words, q_values):
+    """Write the round's starting table for the workers to load, instead of pickling it to each one"""
+    for name, array in (('keys', key_words), ('values', q_values)):
+        path = os.path.join(shared_dir, Q_TABLE_FILES[name])
+        tmp_path = path[:-len(".npy")] + ".tmp.npy"
+        np.save(tmp_path, np.ascontiguousarray(array))
+        os.replace(tmp_path, path)
+
+def _run_worker(shared_dir, seed, agent_params, quantizer_params, epsilon, n_episodes):
+    """Train a local copy of the agent for a few episodes on its own attached env.
+
+    Returns the key words and Q-value changes of only the rows the worker touched.
+    """
+    env = EnhancedCanteenEnv.attach_shared(shared_dir, seed=seed)
+    agent = EnhancedQLearningAgent(seed=seed, quantizer=StateQuantizer.from_dict(quantizer_params), **agent_params)
+    start = np.load(os.path.join(shared_dir, Q_TABLE_FILES['values']))
+    key_words = np.load(os.path.join(shared_dir, Q_TABLE_FILES['keys']))
+    agent.q_table = DenseQTable.from_arrays(decode_keys(key_words), start.reshape(-1, agent.action_size))
+    agent.epsilon = epsilon
+
+    rewards = []
+    steps = 0
+    for _ in range(n_episodes):
+        state = env.reset()
+        done = False
+        total_reward = 0
+        while not done:
+            action = agent.choose_action(state)
+            next_state, reward, done, _ = env.step(action)
+            agent.learn(state, action, reward, next_state, done)
+            state = next_state
+            total_reward += reward
+            steps += 1
+        rewards.append(total_reward)
+
+    # New states were appended after the starting rows and start from zero, so only
+    # their keys need encoding; the starting rows' key words are already loaded
+    n_start = len(start)
+    deltas = np.array(agent.q_table.values, dtype=np.float64)
+    deltas[:n_start] -= start.reshape(-1, agent.action_size)
+    touched = np.flatnonzero(deltas.any(axis=1))
+    new_keys = list(itertools.islice(agent.q_table.keys(), n_start, None))
+    touched_words = _stack_words([key_words[touched[touched < n_start]],
+                                  encode_keys([new_keys[row - n_start] for row in touched[touched >= n_start]])])
+    return touched_words, deltas[touched], agent.epsilon, rewards, steps
+
+class ParallelQLearningTrainer:
+    """Runs K worker processes, each with its own env, seed and exploration schedule.
+
+    Workers train local copies of the Q-table for `sync_every` episodes and send back
+    the rows they changed; the changes are merged (see merge_q_tables) and the merged
+    table is published to the shared directory, so all workers continue from shared
+    knowledge.
+    """
+
+    def __init__(self, env, n_workers=None, sync_every=5, seed=42, **agent_params):
+        self.env = env
+        self.n_workers = n_workers or os.cpu_count()
+        self.sync_every = sync_every
+        self.seed = seed
+        self.agent_params = {
+            'state_size': env.get_state_space_size(),
+            'action_size': env.get_action_space_size(),
+            **agent_params,
+        }
+
+        # Fit the quantizer once so every worker produces identical state keys
+        env.reset(seed=seed)
+        self.agent = EnhancedQLearningAgent(seed=seed, **self.agent_params)
+        self.agent.fit_quantizer(env.get_state_matrix())
+        self.throughput_history = []
+
+    def train(self, episodes, shared_dir=None):
+        """Train for `episodes` episodes per worker and return the merged agent"""
+        if shared_dir is None:
+            with tempfile.TemporaryDirectory(prefix="canteen_env_") as tmp_dir:
+                return self.train(episodes, tmp_dir)
+        self.env.publish_shared(shared_dir)
+
+        quantizer_params = self.agent.quantizer.to_dict()
+        epsilons = [self.agent.epsilon] * self.n_workers
+        n_rounds = -(-episodes // self.sync_every)
+
+        # Rounds merge plain arrays; the DenseQTable is rebuilt once training ends
+        q_words = encode_keys(self.agent.q_table.keys())
+        q_values = np.array(self.agent.q_table.values)
+        with ProcessPoolExecutor(max_workers=self.n_workers) as pool:
+            for round_index in range(n_rounds):
+                n_episodes = min(self.sync_every, episodes - round_index * self.sync_every)
+                _publish_q_table(shared_dir, q_words, q_values)
+
+                round_start = time.perf_counter()
+                futures = [
+                    pool.submit(_run_worker, shared_dir, self.seed + 1000 * round_index + worker,
+                                self.agent_params, quantizer_params, epsilons[worker], n_episodes)
+                    for worker in range(self.n_workers)
+                ]
+                results = [future.result() for future in futures]
+                round_time = time.perf_counter() - round_start
+
+                q_words, q_values = merge_q_arrays((q_words, q_values),
+                                                   [(words, deltas) for words, deltas, *_ in results],
+                                                   self.agent.action_size)
+                epsilons = [epsilon for _, _, epsilon, *_ in results]
+                self.agent.epsilon = float(np.mean(epsilons))
+
+                # Episode rewards are recorded worker by worker within each round
+                for _, _, _, rewards, _ in results:
+                    self.agent.episode_rewards.extend(rewards)
+                    self.agent.epsilon_history.extend([self.agent.epsilon] * len(rewards))
+
+                total_steps = sum(steps for *_, steps in results)
+                steps_per_sec = total_steps / round_time
+                self.throughput_history.append(steps_per_sec)
+                print(f"Round {round_index + 1}/{n_rounds}: {total_steps} steps in {round_time:.2f}s "
+                      f"({steps_per_sec:,.0f} steps/s across {self.n_workers} workers), "
+                      f"Avg Reward = {np.mean([np.mean(r[3]) for r in results]):.0f}, "
+                      f"Q-table entries = {len(q_values)}")
+
+        self.agent.q_table = DenseQTable.from_arrays(decode_keys(q_words), q_values)
+        return self.agent
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the enhanced Q-learning agent across worker processes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--episodes", type=int, default=150, help="episodes per worker")
+    parser.add_argument("--sync-every", type=int, default=5, help="episodes between Q-table merges")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sales_path = os.path.join(base_dir, "data/historical_sales.csv")
+    operational_path = os.path.join(base_dir, "data/operational_data.csv")
+    weather_path = os.path.join(base_dir, "data/weather_data.csv")
+    academic_path = os.path.join(base_dir, "data/academic_calendar.csv")
+
+    env = EnhancedCanteenEnv(sales_path, operational_path, weather_path, academic_path, seed=args.seed)
+    trainer = ParallelQLearningTrainer(env, n_workers=args.workers, sync_every=args.sync_every, seed=args.seed)
+
+    start = time.perf_counter()
+    agent = trainer.train(args.episodes)
+    print(f"\nParallel training completed in {time.perf_counter() - start:.1f}s")
+    print(f"Mean throughput: {np.mean(trainer.throughput_history):,.0f} steps/s")
+    print(f"Total Q-table entries: {len(agent.q_table)}")
+
+    models_dir = os.path.join(base_dir, 'models')
+    os.makedirs(models_dir, exist_ok=True)
+    agent.save_model(os.path.join(models_dir, "enhanced_rl_q_table.pkl"))
+    print("Enhanced RL Q-table saved.")
+
+    history_df = pd.DataFrame({
+        'episode': range(1, len(agent.episode_rewards) + 1),
+        'reward': agent.episode_rewards,
+        'epsilon': agent.epsilon_history
+    })
+    history_df.to_csv(os.path.join(base_dir, "data/rl_training_history.csv"), index=False)
+    print("RL training history saved.")
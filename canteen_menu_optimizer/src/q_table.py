@@ -0,0 +1,140 @@
+import numpy as np
+import os
+
+class DenseQTable:
+    """Q-table stored as one contiguous (n_states, n_actions) matrix.
+
+    A dict maps each state key to its row, and the matrix doubles in capacity when
+    full. Indexing with a state key returns that row as a view, inserting a zero row
+    for unseen states like the defaultdict it replaces. Saved as .npy files, so the
+    server can memory-map the values instead of unpickling one array per state; a
+    read-only (memory-mapped) table answers unseen states with zeros and is never
+    modified by a lookup.
+    """
+
+    def __init__(self, n_actions, initial_capacity=1024, dtype=np.float32):
+        self.n_actions = n_actions
+        self.index = {}
+        self._values = np.zeros((initial_capacity, n_actions), dtype=dtype)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, state_key):
+        return state_key in self.index
+
+    def __getitem__(self, state_key):
+        if state_key not in self.index and self.read_only:
+            return np.zeros(self.n_actions, dtype=self._values.dtype)
+        row = self.row(state_key)  # May grow (reallocate) the matrix, so index afterwards
+        return self._values[row]
+
+    @property
+    def read_only(self):
+        """True for tables loaded with mmap_mode='r'"""
+        return not self._values.flags.writeable
+
+    def row(self, state_key):
+        """Row index of `state_key`, adding a zero row if it has not been seen"""
+        row = self.index.get(state_key)
+        if row is None:
+            if self.read_only:
+                raise ValueError("Cannot add states to a read-only Q-table; load it without mmap_mode='r'")
+            row = len(self.index)
+            if row == len(self._values):
+                self._grow()
+            self.index[state_key] = row
+        return row
+
+    def _grow(self):
+        grown = np.zeros((max(1, 2 * len(self._values)), self.n_actions), dtype=self._values.dtype)
+        grown[:len(self._values)] = self._values
+        self._values = grown
+
+    @property
+    def values(self):
+        """Q-values of all known states, in insertion order"""
+        return self._values[:len(self.index)]
+
+    def keys(self):
+        return self.index.keys()
+
+    @classmethod
+    def from_arrays(cls, state_keys, q_values):
+        """Build a table from parallel lists of keys and Q-value rows"""
+        q_values = np.asarray(q_values)
+        table = cls(q_values.shape[1], initial_capacity=0, dtype=q_values.dtype)
+        table._values = q_values.copy()
+        table.index = {state_key: row for row, state_key in enumerate(state_keys)}
+        return table
+
+    @classmethod
+    def from_dict(cls, q_table, n_actions):
+        """Convert a {state_key: q_values} mapping (the old pickled format)"""
+        _check_keys(q_table.keys())
+        table = cls(n_actions, initial_capacity=max(1, len(q_table)))
+        for state_key, q_values in q_table.items():
+            table[state_key][:] = q_values
+        return table
+
+    @staticmethod
+    def _paths(filepath):
+        base = os.path.splitext(filepath)[0]
+        return base + "_q_values.npy", base + "_state_keys.npy"
+
+    @classmethod
+    def exists(cls, filepath):
+        return all(os.path.exists(path) for path in cls._paths(filepath))
+
+    def save(self, filepath):
+        """Write <base>_q_values.npy and <base>_state_keys.npy next to `filepath`"""
+        values_path, keys_path = self._paths(filepath)
+        np.save(values_path, self.values)
+        np.save(keys_path, encode_keys(list(self.index)))
+
+    @classmethod
+    def load(cls, filepath, mmap_mode=None):
+        """Load a table saved with save(); mmap_mode='r' maps the values read-only"""
+        values_path, keys_path = cls._paths(filepath)
+        values = np.load(values_path, mmap_mode=mmap_mode)
+        table = cls(values.shape[1], initial_capacity=0, dtype=values.dtype)
+        table._values = values
+        table.index = {state_key: row for row, state_key in enumerate(decode_keys(np.load(keys_path)))}
+        return table
+
+# Packed state keys can exceed 64 bits, so they are stored as int64 words (63 bits each)
+KEY_WORD_BITS = 63
+KEY_WORD_MASK = (1 << KEY_WORD_BITS) - 1
+
+def _check_keys(keys):
+    # Tables pickled before the StateQuantizer keyed states by per-episode bin tuples; those
+    # bins were never saved, so the keys cannot be mapped to packed keys and the agent
+    # has to be retrained (src/rl_agent.py or src/train_enhanced_rl_agent.py)
+    for key in keys:
+        if not isinstance(key, (int, np.integer)):
+            raise ValueError(f"Q-table state keys must be packed integer keys from a StateQuantizer, "
+                             f"got {type(key).__name__}: this is a legacy table, retrain the agent to replace it")
+
+def encode_keys(keys):
+    """(n_keys, n_words) int64 array of packed state keys, low word first"""
+    keys = list(keys)
+    _check_keys(keys)
+    if not keys or max(keys) <= KEY_WORD_MASK:
+        return np.array(keys, dtype=np.int64).reshape(-1, 1)  # Keys are non-negative, so one word each
+    # Shift and mask whole columns of Python ints rather than looping over keys
+    remaining = np.array([int(key) for key in keys], dtype=object)
+    n_words = -(-int(max(keys)).bit_length() // KEY_WORD_BITS)
+    words = np.zeros((len(keys), n_words), dtype=np.int64)
+    for word in range(n_words):
+        words[:, word] = remaining & KEY_WORD_MASK
+        remaining = remaining >> KEY_WORD_BITS
+    return words
+
+def decode_keys(words):
+    """Packed state keys from an array written by encode_keys()"""
+    if words.shape[1] == 1:
+        return words[:, 0].tolist()
+    keys = words[:, -1].astype(object)
+    for word in range(words.shape[1] - 2, -1, -1):
+        keys = (keys << KEY_WORD_BITS) | words[:, word].astype(object)
+    return keys.tolist()
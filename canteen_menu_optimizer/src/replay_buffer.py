@@ -0,0 +1,77 @@
+import numpy as np
+
+class ReplayBuffer:
+    """Fixed-capacity experience replay stored in preallocated NumPy ring buffers"""
+
+    def __init__(self, capacity, state_size, seed=None):
+        self.capacity = capacity
+        self.states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float64)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.position = 0  # Next slot to write
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, done):
+        """Store one transition; a None next_state (end of data) is stored as zeros and done"""
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        if next_state is None:
+            self.next_states[i] = 0
+            done = True
+        else:
+            self.next_states[i] = next_state
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        """Store many transitions at once, overwriting the oldest when full"""
+        n = len(actions)
+        if n > self.capacity:  # Only the newest `capacity` transitions survive
+            states, actions, rewards = states[-self.capacity:], actions[-self.capacity:], rewards[-self.capacity:]
+            next_states, dones = next_states[-self.capacity:], dones[-self.capacity:]
+            n = self.capacity
+        slots = (self.position + np.arange(n)) % self.capacity
+        self.states[slots] = states
+        self.actions[slots] = actions
+        self.rewards[slots] = rewards
+        self.next_states[slots] = next_states
+        self.dones[slots] = dones
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def sample(self, batch_size):
+        """Uniformly sample a minibatch as (states, actions, rewards, next_states, dones)"""
+        idx = self.rng.integers(0, self.size, size=batch_size)
+        return self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx]
+
+    def to_dict(self):
+        """Buffer contents, write position and RNG state, for checkpointing"""
+        return {
+            'states': self.states[:self.size], 'actions': self.actions[:self.size],
+            'rewards': self.rewards[:self.size], 'next_states': self.next_states[:self.size],
+            'dones': self.dones[:self.size], 'capacity': self.capacity, 'position': self.position,
+            'rng_state': self.rng.bit_generator.state
+        }
+
+    @classmethod
+    def from_dict(cls, params):
+        buffer = cls(params['capacity'], params['states'].shape[1])
+        size = len(params['actions'])
+        buffer.states[:size] = params['states']
+        buffer.actions[:size] = params['actions']
+        buffer.rewards[:size] = params['rewards']
+        buffer.next_states[:size] = params['next_states']
+        buffer.dones[:size] = params['dones']
+        buffer.position = params['position']
+        buffer.size = size
+        buffer.rng.bit_generator.state = params['rng_state']
+        return buffer
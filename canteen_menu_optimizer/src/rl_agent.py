@@ -2,12 +2,14 @@
 import numpy as np
 import pandas as pd
 import random
-from collections import defaultdict
 import joblib
 import os
 
+from q_table import DenseQTable
+from state_quantizer import StateQuantizer
+
 class QLearningAgent:
-    def __init__(self, state_size, action_size, learning_rate=0.1, discount_factor=0.99, epsilon=1.0, epsilon_decay_rate=0.001, min_epsilon=0.01):
+    def __init__(self, state_size, action_size, learning_rate=0.1, discount_factor=0.99, epsilon=1.0, epsilon_decay_rate=0.001, min_epsilon=0.01, n_bins=10, quantizer=None):
         self.state_size = state_size
         self.action_size = action_size
         self.learning_rate = learning_rate
@@ -15,37 +17,47 @@ class QLearningAgent:
         self.epsilon = epsilon
         self.epsilon_decay_rate = epsilon_decay_rate
         self.min_epsilon = min_epsilon
-        self.q_table = defaultdict(lambda: np.zeros(self.action_size))
+        self.q_table = DenseQTable(self.action_size)
+        # Global per-feature quantile bins, fitted once so keys are stable across calls
+        self.quantizer = quantizer or StateQuantizer(n_bins, strategy='quantile')
+
+    def fit_quantizer(self, states):
+        self.quantizer.fit(states)
+        return self
 
-    def _state_to_tuple(self, state):
-        # Convert numpy array state to a hashable tuple
-        # Quantize state for Q-table indexing if state is continuous
-        return tuple(np.digitize(state, bins=np.linspace(state.min(), state.max(), 10)).astype(int))
+    def _state_to_key(self, state):
+        # Quantize the continuous state with the fitted bins into a hashable integer key
+        return self.quantizer.key(state)
 
     def choose_action(self, state):
         if random.uniform(0, 1) < self.epsilon:
             return random.randint(0, self.action_size - 1) # Explore
         else:
-            return np.argmax(self.q_table[self._state_to_tuple(state)]) # Exploit
+            return np.argmax(self.q_table[self._state_to_key(state)]) # Exploit
 
     def learn(self, state, action, reward, next_state, done):
-        state_tuple = self._state_to_tuple(state)
-        next_state_tuple = self._state_to_tuple(next_state) if next_state is not None else None
+        state_key = self._state_to_key(state)
+        next_state_key = self._state_to_key(next_state) if next_state is not None else None
 
-        current_q = self.q_table[state_tuple][action]
-        max_next_q = np.max(self.q_table[next_state_tuple]) if next_state is not None else 0
+        current_q = self.q_table[state_key][action]
+        max_next_q = np.max(self.q_table[next_state_key]) if next_state is not None else 0
 
         new_q = current_q + self.learning_rate * (reward + self.discount_factor * max_next_q - current_q)
-        self.q_table[state_tuple][action] = new_q
+        self.q_table[state_key][action] = new_q
 
         if done:
             self.epsilon = max(self.min_epsilon, self.epsilon - self.epsilon_decay_rate)
 
     def save_model(self, path):
-        joblib.dump(dict(self.q_table), path)
+        # The quantizer is saved as plain arrays so inference can rebuild identical keys;
+        # the Q-table goes to .npy files beside `path` so it can be memory-mapped
+        self.q_table.save(path)
+        joblib.dump({'quantizer': self.quantizer.to_dict()}, path)
 
-    def load_model(self, path):
-        self.q_table = defaultdict(lambda: np.zeros(self.action_size), joblib.load(path))
+    def load_model(self, path, mmap_mode=None):
+        model_data = joblib.load(path)
+        self.q_table = DenseQTable.load(path, mmap_mode=mmap_mode)
+        self.quantizer = StateQuantizer.from_dict(model_data['quantizer'])
 
 
 if __name__ == '__main__':
@@ -62,9 +74,13 @@ if __name__ == '__main__':
     
     print(f"Enhanced RL Environment - State size: {state_size}, Action size: {action_size}")
 
-    agent = QLearningAgent(state_size, action_size, epsilon=0.9, epsilon_decay_rate=0.005)
+    # The state is a few small integer codes (see canteen_env.POLICY_FEATURES); uniform bins as
+    # many as the widest code range (7 weekdays) give every value of every feature its own bin
+    agent = QLearningAgent(state_size, action_size, epsilon=0.9, epsilon_decay_rate=0.005,
+                           quantizer=StateQuantizer(7, strategy='uniform'))
+    agent.fit_quantizer(env.get_state_matrix())
 
-    episodes = 150  # More episodes for the more complex environment
+    episodes = 150
     for episode in range(episodes):
         state = env.reset()
         done = False
@@ -84,5 +100,5 @@ if __name__ == '__main__':
 
     models_dir = os.path.join(base_dir, 'models')
     os.makedirs(models_dir, exist_ok=True)
-    agent.save_model(os.path.join(models_dir, "enhanced_rl_q_table.pkl"))
-    print("Enhanced RL Q-table saved.")
+    agent.save_model(os.path.join(models_dir, "rl_q_table.pkl"))
+    print(f"RL Q-table with {len(agent.q_table)} states saved.")
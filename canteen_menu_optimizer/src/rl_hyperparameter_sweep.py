@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from enhanced_canteen_env import EnhancedCanteenEnv
+from search_space import grid_trials, random_trials
+from train_enhanced_rl_agent import EnhancedQLearningAgent, EarlyStopping, train_agent
+
+# Values tried for each hyperparameter; max_steps of None means the full history per episode
+SEARCH_SPACE = {
+    'learning_rate': [0.05, 0.1, 0.2],
+    'discount_factor': [0.9, 0.99],
+    'epsilon_decay_rate': [0.99, 0.995, 0.999],
+    'n_bins': [3, 5, 8],
+    'max_steps': [365, None],
+}
+
+RESULT_COLUMNS = ['trial', 'learning_rate', 'discount_factor', 'epsilon_decay_rate', 'n_bins', 'max_steps',
+                  'episodes', 'final_reward', 'reward_per_step', 'best_reward', 'episodes_to_converge', 'q_table_entries',
+                  'wall_time_seconds']
+
+def episodes_to_converge(rewards, window=10, tolerance=0.01):
+    """First episode whose moving-average reward is within `tolerance` of the final moving average"""
+    if len(rewards) < window:
+        return len(rewards)
+    moving_average = np.convolve(rewards, np.ones(window) / window, mode='valid')
+    final = moving_average[-1]
+    converged = np.abs(moving_average - final) <= tolerance * abs(final)
+    return int(np.argmax(converged)) + window
+
+def _run_trial(shared_dir, trial, params, episodes, patience, seed):
+    """Train one agent on its own attached env and summarise the run"""
+    start = time.perf_counter()
+    env = EnhancedCanteenEnv.attach_shared(shared_dir, seed=seed)
+    max_steps = params['max_steps'] or env.max_steps
+
+    agent = EnhancedQLearningAgent(env.get_state_space_size(), env.get_action_space_size(),
+                                   learning_rate=params['learning_rate'],
+                                   discount_factor=params['discount_factor'],
+                                   epsilon_decay_rate=params['epsilon_decay_rate'],
+                                   n_bins=params['n_bins'], seed=seed)
+    env.reset()
+    agent.fit_quantizer(env.get_state_matrix())
+    early_stopping = EarlyStopping(patience=patience) if patience else None
+    train_agent(agent, env, episodes, early_stopping=early_stopping, max_steps=max_steps, verbose=False)
+
+    rewards = agent.episode_rewards
+    return {
+        'trial': trial,
+        **params,
+        'max_steps': max_steps,
+        'episodes': len(rewards),
+        'final_reward': float(np.mean(rewards[-10:])),
+        'reward_per_step': float(np.mean(rewards[-10:])) / max_steps,  # Comparable across episode lengths
+        'best_reward': float(max(rewards)),
+        'episodes_to_converge': episodes_to_converge(rewards),
+        'q_table_entries': len(agent.q_table),
+        'wall_time_seconds': time.perf_counter() - start
+    }
+
+def run_sweep(env, trials, results_path, episodes=50, patience=0, n_workers=None, seed=42, shared_dir=None):
+    """Run each trial in a worker process, appending a CSV row as soon as each one finishes"""
+    if shared_dir is None:
+        with tempfile.TemporaryDirectory(prefix="canteen_env_") as tmp_dir:
+            return run_sweep(env, trials, results_path, episodes, patience, n_workers, seed, tmp_dir)
+    env.publish_shared(shared_dir)
+
+    pd.DataFrame(columns=RESULT_COLUMNS).to_csv(results_path, index=False)
+    results = []
+    with ProcessPoolExecutor(max_workers=n_workers or os.cpu_count()) as pool:
+        futures = [pool.submit(_run_trial, shared_dir, trial, params, episodes, patience, seed + trial)
+                   for trial, params in enumerate(trials)]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            pd.DataFrame([result], columns=RESULT_COLUMNS).to_csv(results_path, mode='a', header=False, index=False)
+            print(f"Trial {result['trial'] + 1}/{len(trials)} ({len(results)} done): "
+                  f"Final Reward = {result['final_reward']:.0f}, "
+                  f"Converged by episode {result['episodes_to_converge']}, "
+                  f"Q-table entries = {result['q_table_entries']}, {result['wall_time_seconds']:.1f}s")
+
+    return pd.DataFrame(results, columns=RESULT_COLUMNS).sort_values('reward_per_step', ascending=False)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep for the enhanced Q-learning agent")
+    parser.add_argument("--search", choices=["grid", "random"], default="grid")
+    parser.add_argument("--trials", type=int, default=20, help="number of random-search trials")
+    parser.add_argument("--episodes", type=int, default=50, help="training episodes per trial")
+    parser.add_argument("--patience", type=int, default=0, help="early-stopping patience per trial (0 = never)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sales_path = os.path.join(base_dir, "data/historical_sales.csv")
+    operational_path = os.path.join(base_dir, "data/operational_data.csv")
+    weather_path = os.path.join(base_dir, "data/weather_data.csv")
+    academic_path = os.path.join(base_dir, "data/academic_calendar.csv")
+    results_path = os.path.join(base_dir, "data/rl_sweep_results.csv")
+
+    env = EnhancedCanteenEnv(sales_path, operational_path, weather_path, academic_path, seed=args.seed)
+    if args.search == "grid":
+        trials = grid_trials(SEARCH_SPACE)
+    else:
+        trials = random_trials(SEARCH_SPACE, args.trials, seed=args.seed)
+    print(f"Running {len(trials)} trials ({args.search} search) on {args.workers} workers")
+
+    start = time.perf_counter()
+    results = run_sweep(env, trials, results_path, episodes=args.episodes, patience=args.patience,
+                        n_workers=args.workers, seed=args.seed)
+    print(f"\nSweep completed in {time.perf_counter() - start:.1f}s; results saved to rl_sweep_results.csv")
+    print("Best configurations:")
+    print(results.head().to_string(index=False))
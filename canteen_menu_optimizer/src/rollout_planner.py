@@ -0,0 +1,94 @@
+import numpy as np
+import os
+
+class RolloutPlanner:
+    """Monte Carlo lookahead planner on top of EnhancedCanteenEnv.
+
+    Candidate action sequences are scored from the environment's current step in a
+    single vectorized pass over the precomputed sales matrix, so no environment or
+    DataFrame is copied per rollout.
+    """
+
+    def __init__(self, env, horizon=7, n_rollouts=64, discount_factor=0.99, seed=None):
+        self.env = env
+        self.horizon = horizon
+        self.n_rollouts = n_rollouts
+        self.discount_factor = discount_factor
+        self.rng = np.random.default_rng(seed)
+        self.action_levels = np.asarray(env.action_levels)
+
+    def evaluate(self, action_sequences):
+        """Discounted return of each candidate sequence, shape (n_candidates, horizon) -> (n_candidates,)"""
+        action_sequences = np.atleast_2d(np.asarray(action_sequences, dtype=np.int64))
+        start = self.env.current_step
+        horizon = min(action_sequences.shape[1], self.env.max_steps - start)
+        if horizon <= 0:
+            return np.zeros(len(action_sequences))
+
+        # Same equal split across items as EnhancedCanteenEnv.step
+        item_prepared = self.action_levels[action_sequences[:, :horizon]] // len(self.env.items)
+        demand = self.env.sales_matrix[start:start + horizon]
+
+        # (n_candidates, horizon) rewards in one broadcasted call
+        rewards = self.env._calculate_rewards(item_prepared, demand)
+        discounts = self.discount_factor ** np.arange(horizon)
+        return rewards @ discounts
+
+    def evaluate_policy(self, policy, n_rollouts=None):
+        """Average discounted return of `policy(state) -> action` rolled out from the current state"""
+        n_rollouts = n_rollouts or self.n_rollouts
+        snapshot = self.env.get_snapshot()
+        returns = np.zeros(n_rollouts)
+
+        for rollout in range(n_rollouts):
+            state = self.env.restore(snapshot)
+            done = state is None
+            step = 0
+            while not done and step < self.horizon:
+                state, reward, done, _ = self.env.step(policy(state))
+                returns[rollout] += (self.discount_factor ** step) * reward
+                step += 1
+
+        self.env.restore(snapshot)
+        return returns.mean()
+
+    def plan_next_action(self):
+        """Pick the first action with the best expected return over random continuations"""
+        n_actions = len(self.action_levels)
+        sequences = self.rng.integers(0, n_actions, size=(n_actions, self.n_rollouts, self.horizon))
+        sequences[:, :, 0] = np.arange(n_actions)[:, np.newaxis]
+
+        returns = self.evaluate(sequences.reshape(-1, self.horizon)).reshape(n_actions, self.n_rollouts)
+        expected_returns = returns.mean(axis=1)
+        return int(np.argmax(expected_returns)), expected_returns
+
+    def plan_next_quantity(self, best_action=None):
+        """Best total preparation quantity for the environment's current (next) day.
+
+        Pass the action already returned by plan_next_action() to convert it;
+        otherwise a fresh plan is drawn, which may pick a different action.
+        """
+        if best_action is None:
+            best_action, _ = self.plan_next_action()
+        return int(self.action_levels[best_action])
+
+if __name__ == '__main__':
+    from enhanced_canteen_env import EnhancedCanteenEnv
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sales_path = os.path.join(base_dir, "data/historical_sales.csv")
+    operational_path = os.path.join(base_dir, "data/operational_data.csv")
+    weather_path = os.path.join(base_dir, "data/weather_data.csv")
+    academic_path = os.path.join(base_dir, "data/academic_calendar.csv")
+
+    env = EnhancedCanteenEnv(sales_path, operational_path, weather_path, academic_path, seed=42)
+    env.reset()
+    for _ in range(30):
+        env.step(env.rng.integers(0, env.get_action_space_size()))
+
+    planner = RolloutPlanner(env, horizon=7, n_rollouts=256, seed=42)
+    best_action, expected_returns = planner.plan_next_action()
+    print(f"Planning for {env.dates[env.current_step].date()} (step {env.current_step})")
+    for level, expected in zip(env.action_levels, expected_returns):
+        print(f"  Prepare {level:>3} units -> expected {planner.horizon}-day return {expected:,.0f}")
+    print(f"Best preparation quantity for tomorrow: {planner.plan_next_quantity(best_action)}")
@@ -0,0 +1,16 @@
+import numpy as np
+import itertools
+
+# Trial generators shared by the RL sweep and the XGBoost search; a search space maps each
+# hyperparameter name to the list of values to try
+
+def grid_trials(search_space):
+    """Every combination of the search space, as a list of parameter dicts"""
+    names = list(search_space)
+    return [dict(zip(names, values)) for values in itertools.product(*search_space.values())]
+
+def random_trials(search_space, n_trials, seed=42):
+    """`n_trials` combinations drawn independently per hyperparameter"""
+    rng = np.random.default_rng(seed)
+    return [{name: values[rng.integers(len(values))] for name, values in search_space.items()}
+            for _ in range(n_trials)]
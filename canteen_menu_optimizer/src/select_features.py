@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from data_cache import read_table
+from data_schema import parse_dates
+from feature_manifest import FEATURE_MANIFEST_FILE, save_feature_manifest
+from train_enhanced_ml_model import (N_FOLDS, booster_params, regression_metrics, time_series_folds,
+                                     train_enhanced_ml_model)
+from training_matrix import cached_matrix
+
+# The last rolling-origin fold is held out: features are ranked on the earlier folds only, and
+# a candidate set is accepted or rejected on the held-out block, so the check is not biased
+# towards the folds the ranking was fitted to
+N_REPEATS = 3  # Shuffles per feature and fold
+MIN_IMPORTANCE = 0.002  # Keep features whose shuffling raises the fold RMSE by more than this share
+TOLERANCE_SPREADS = 1  # The selected set may cost at most this many standard deviations of the ranking folds' RMSE
+ADD_BACK_STEP = 2  # Features added back (most important first) while the selection misses the tolerance
+
+_matrix = None  # The full training matrix, loaded once per worker process
+
+def _attach_matrix(path):
+    global _matrix
+    _matrix = xgb.DMatrix(path)
+
+def _fold_importance(fold, train_rows, test_rows, n_jobs, seed):
+    """Permutation and gain importance of every feature on one fold's test block"""
+    params, rounds = booster_params(n_jobs)
+    booster = xgb.train(params, _matrix.slice(train_rows), rounds)
+    dtest = _matrix.slice(test_rows)
+    X_test, y_test = dtest.get_data().toarray(), dtest.get_label()
+    base_rmse = regression_metrics(y_test, booster.inplace_predict(X_test))['rmse']
+
+    rng = np.random.default_rng(seed + fold)
+    increases = []
+    for column in range(X_test.shape[1]):
+        X_shuffled = X_test.copy()
+        scores = []
+        for _ in range(N_REPEATS):
+            X_shuffled[:, column] = rng.permutation(X_test[:, column])
+            scores.append(regression_metrics(y_test, booster.inplace_predict(X_shuffled))['rmse'])
+        increases.append((np.mean(scores) - base_rmse) / base_rmse)
+    gain = booster.get_score(importance_type='total_gain')
+    return pd.DataFrame({
+        'fold': fold,
+        'rmse': base_rmse,
+        'feature': dtest.feature_names,
+        'permutation': increases,
+        'gain': [gain.get(feature, 0.0) for feature in dtest.feature_names]
+    })
+
+def feature_importance(matrix_path, dates, n_folds=N_FOLDS, n_workers=None, seed=42):
+    """Permutation importance (relative RMSE increase) and gain share per feature, averaged over
+    every fold but the last, and the RMSE of each of those folds' models.
+
+    Each fold's model is trained on earlier days only and its features are
+    shuffled on the following test block, so the ranking reflects forecasting
+    accuracy rather than fit on the training days. The last fold is left for
+    select_features().
+    """
+    folds = time_series_folds(dates, n_folds)[:-1]
+    n_workers = min(n_workers or os.cpu_count(), len(folds))
+    n_jobs = max(1, os.cpu_count() // n_workers)  # Split the cores between workers rather than oversubscribe
+    jobs = [(fold, train_rows, test_rows, n_jobs, seed) for fold, (train_rows, test_rows) in enumerate(folds, 1)]
+    if n_workers == 1:  # No pool to start on a single core
+        _attach_matrix(matrix_path)
+        per_fold = [_fold_importance(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_attach_matrix, initargs=(matrix_path,)) as pool:
+            per_fold = list(pool.map(_fold_importance, *zip(*jobs)))
+
+    per_fold = pd.concat(per_fold, ignore_index=True)
+    per_fold['gain'] /= per_fold.groupby('fold')['gain'].transform('sum')
+    importance = per_fold.groupby('feature', sort=False)[['permutation', 'gain']].mean()
+    fold_rmse = per_fold.groupby('fold')['rmse'].first()
+    return importance.sort_values('permutation', ascending=False).reset_index(), fold_rmse
+
+def holdout_metrics(X, y, dates, n_folds=N_FOLDS, n_jobs=-1):
+    """Metrics of a model trained on every day before the last fold's test block and scored on that block"""
+    train_rows, test_rows = time_series_folds(dates, n_folds)[-1]
+    params, rounds = booster_params(n_jobs)
+    booster = xgb.train(params, xgb.DMatrix(X.iloc[train_rows], y.iloc[train_rows]), rounds)
+    return regression_metrics(y.iloc[test_rows], booster.inplace_predict(X.iloc[test_rows]))
+
+def select_features(importance, fold_rmse, X, y, dates):
+    """The smallest importance-ranked feature set whose held-out RMSE is within the tolerance of all features.
+
+    Starts from the features above MIN_IMPORTANCE and adds back the next most
+    important ones until the RMSE on the held-out last fold is at most
+    TOLERANCE_SPREADS standard deviations of the ranking folds' RMSE above that
+    of all features. Returns the selection (in the preprocessed column order),
+    the held-out metrics of both and the tolerance.
+    """
+    tolerance = TOLERANCE_SPREADS * fold_rmse.std()
+    all_holdout = holdout_metrics(X, y, dates)
+    ranked = importance['feature'].tolist()
+    k = max(1, int((importance['permutation'] > MIN_IMPORTANCE).sum()))
+    while True:
+        selected = [column for column in X.columns if column in ranked[:k]]
+        holdout = holdout_metrics(X[selected], y, dates)
+        print(f"{len(selected)} features: held-out RMSE {holdout['rmse']:.2f} "
+              f"(all features: {all_holdout['rmse']:.2f}, tolerance {tolerance:.2f})")
+        if holdout['rmse'] <= all_holdout['rmse'] + tolerance or k >= len(ranked):
+            return selected, holdout, all_holdout, tolerance
+        k = min(k + ADD_BACK_STEP, len(ranked))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Select the enhanced model's features by time-series permutation importance")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--no-retrain", action="store_true", help="only write the manifest")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    X_path = os.path.join(base_dir, "data/X_enhanced_preprocessed.csv")
+    y_path = os.path.join(base_dir, "data/y_enhanced_target.csv")
+    models_dir = os.path.join(base_dir, "models")
+    X = read_table(X_path, dtypes=np.float32)
+    y = read_table(y_path).squeeze("columns")
+    dates = parse_dates(pd.read_csv(os.path.join(base_dir, "data/full_enhanced_dataset.csv"), usecols=["date"]))["date"]
+
+    start = time.perf_counter()
+    importance, fold_rmse = feature_importance(cached_matrix(X_path, y_path), dates, n_workers=args.workers,
+                                               seed=args.seed)
+    print(f"Permutation importance (relative RMSE increase) and gain share, averaged over the first "
+          f"{len(fold_rmse)} folds (fold RMSE {fold_rmse.mean():.2f} +/- {fold_rmse.std():.2f}):")
+    print(importance.to_string(index=False, float_format=lambda value: f"{value:.4f}"))
+    selected, holdout, all_holdout, tolerance = select_features(importance, fold_rmse, X, y, dates)
+    print(f"\nSelected {len(selected)} of {X.shape[1]} features in {time.perf_counter() - start:.1f}s "
+          f"(held-out RMSE {holdout['rmse']:.2f} vs {all_holdout['rmse']:.2f}):")
+    print(selected)
+
+    save_feature_manifest(models_dir, {
+        'features': selected,
+        'all_features': X.columns.tolist(),
+        'importance': importance,
+        'rmse': holdout['rmse'],
+        'all_features_rmse': all_holdout['rmse'],
+        'tolerance': tolerance,
+        'created': time.strftime("%Y-%m-%d %H:%M:%S")
+    })
+    print(f"Feature manifest saved to {FEATURE_MANIFEST_FILE}")
+
+    if not args.no_retrain:
+        print("\nRetraining the enhanced model on the selected features...")
+        train_enhanced_ml_model()
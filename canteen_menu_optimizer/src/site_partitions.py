@@ -0,0 +1,85 @@
+import pandas as pd
+import argparse
+import os
+import re
+
+try:
+    from .data_cache import read_table
+    from .data_schema import apply_schema
+except ImportError:  # Running as a script from src/
+    from data_cache import read_table
+    from data_schema import apply_schema
+
+# Per-site data lives in data/sites/<site_id>/<YYYY-MM>/<source>.csv, one partition per site and month
+SITES_DIR = "sites"
+MONTH_FORMAT = "%Y-%m"
+SOURCES = ("historical_sales", "weather_data", "operational_data", "academic_calendar")
+# Site ids become directory names, so only plain names are accepted (no separators or "..")
+SITE_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+def check_site_id(site_id):
+    """The site id as a string, or ValueError if it is not a plain directory name"""
+    site_id = str(site_id)
+    if not SITE_ID_PATTERN.fullmatch(site_id):
+        raise ValueError(f"Invalid site id {site_id!r}: use letters, digits, '_' and '-' only")
+    return site_id
+
+def site_dir(root_dir, site_id):
+    """A site's directory under data/ (partitions) or models/ (trained artifacts)"""
+    return os.path.join(root_dir, SITES_DIR, check_site_id(site_id))
+
+def partition_path(data_dir, site_id, month, source):
+    return os.path.join(site_dir(data_dir, site_id), month, f"{source}.csv")
+
+def list_sites(data_dir):
+    sites_dir = os.path.join(data_dir, SITES_DIR)
+    if not os.path.isdir(sites_dir):
+        return []
+    return sorted(name for name in os.listdir(sites_dir) if os.path.isdir(os.path.join(sites_dir, name)))
+
+def list_months(data_dir, site_id):
+    """A site's partition months in date order"""
+    return sorted(os.listdir(site_dir(data_dir, site_id)))
+
+def write_partitions(df, data_dir, source, site_id=None):
+    """Split a source frame by site and month and write one CSV per partition.
+
+    Rows are assigned to sites by their site_id column unless `site_id` is given.
+    Each written partition is replaced whole, so pass complete months.
+    """
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"])
+    if site_id is not None:
+        df["site_id"] = site_id
+    written = []
+    for (site, month), partition in df.groupby(["site_id", df["date"].dt.strftime(MONTH_FORMAT)], sort=True):
+        path = partition_path(data_dir, site, month, source)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partition.drop(columns="site_id").sort_values("date", kind="stable").to_csv(path, index=False)
+        written.append(path)
+    return written
+
+def read_site(data_dir, site_id, source, months=None):
+    """A site's frame for one source, concatenated from its month partitions in date order.
+
+    Partitions are read through the parsed-data cache, so adding a month only
+    parses the new partition.
+    """
+    months = list_months(data_dir, site_id) if months is None else months
+    paths = [partition_path(data_dir, site_id, month, source) for month in months]
+    frames = [read_table(path) for path in paths if os.path.exists(path)]
+    if not frames:
+        raise FileNotFoundError(f"No {source} partitions for site {site_id} in {data_dir}")
+    # Categories differ between partitions, so re-apply the schema to the combined frame
+    return apply_schema(pd.concat(frames, ignore_index=True))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partition the single-canteen data files by site and month")
+    parser.add_argument("--site", required=True, help="site id to file the existing data/ CSVs under")
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    data_dir = os.path.join(base_dir, "data")
+    for source in SOURCES:
+        paths = write_partitions(read_table(os.path.join(data_dir, f"{source}.csv")), data_dir, source, args.site)
+        print(f"{source}: {len(paths)} monthly partitions written for site {args.site}")
@@ -0,0 +1,81 @@
+import pandas as pd
+import xgboost as xgb
+import argparse
+import joblib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from data_preprocessing_enhanced import FEATURE_STATE_FILE, preprocess_enhanced_frames, save_feature_state
+from feature_manifest import selected_features
+from feature_pipeline import FeaturePipeline
+from site_partitions import list_months, list_sites, read_site, site_dir
+from train_enhanced_ml_model import fit_enhanced_model
+
+def train_site(data_dir, models_dir, site_id, n_jobs=1):
+    """Preprocess one site's partitions and train its model.
+
+    Writes the same artifacts as the single-canteen scripts (scaler, item encoder,
+    XGBoost model, feature state) to models/sites/<site_id>/. The model is trained
+    on the features selected by select_features.py, when a manifest exists.
+    """
+    start = time.perf_counter()
+    sales_df = read_site(data_dir, site_id, "historical_sales")
+    weather_df = read_site(data_dir, site_id, "weather_data")
+    calendar_df = read_site(data_dir, site_id, "academic_calendar")
+    operational_df = read_site(data_dir, site_id, "operational_data")
+
+    X, y, df, scaler, le_item_id = preprocess_enhanced_frames(sales_df, weather_df, calendar_df, operational_df)
+    features = selected_features(models_dir)
+    if features is not None:  # The scaler keeps every column; the engine subsets it to the model's features
+        X = X[features]
+    # Already one site per worker process, so the site's folds run in this process
+    model, fold_results, pooled = fit_enhanced_model(xgb.DMatrix(X, y), df['date'], n_jobs=n_jobs, n_workers=1)
+
+    out_dir = site_dir(models_dir, site_id)
+    os.makedirs(out_dir, exist_ok=True)
+    joblib.dump(scaler, os.path.join(out_dir, 'enhanced_scaler.pkl'))
+    joblib.dump(le_item_id, os.path.join(out_dir, 'enhanced_le_item_id.pkl'))
+    joblib.dump(model, os.path.join(out_dir, 'enhanced_xgboost_model.pkl'))
+    pipeline = FeaturePipeline('enhanced', item_encoder=le_item_id).fit(df)
+    save_feature_state(os.path.join(out_dir, FEATURE_STATE_FILE), pipeline, df)
+
+    return {
+        'site_id': site_id,
+        'months': len(list_months(data_dir, site_id)),
+        'rows': len(X),
+        'items': len(le_item_id.classes_),
+        **pooled,
+        'seconds': time.perf_counter() - start
+    }
+
+def train_sites(data_dir, models_dir, site_ids=None, n_workers=None):
+    """Train every site (or `site_ids`) in a process pool, one site per task"""
+    site_ids = list_sites(data_dir) if site_ids is None else site_ids
+    n_workers = min(n_workers or os.cpu_count(), max(1, len(site_ids)))
+    n_jobs = max(1, os.cpu_count() // n_workers)  # Split the cores between workers rather than oversubscribe
+
+    results = []
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [pool.submit(train_site, data_dir, models_dir, site_id, n_jobs) for site_id in site_ids]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"Site {result['site_id']} ({len(results)}/{len(site_ids)}): {result['rows']} rows from "
+                  f"{result['months']} monthly partitions, RMSE = {result['rmse']:.2f}, {result['seconds']:.1f}s")
+    return pd.DataFrame(results).sort_values('site_id').reset_index(drop=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocess and train a model per canteen site")
+    parser.add_argument("--sites", nargs="*", help="site ids to train (default: every site under data/sites)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    data_dir = os.path.join(base_dir, "data")
+    models_dir = os.path.join(base_dir, "models")
+
+    start = time.perf_counter()
+    summary = train_sites(data_dir, models_dir, site_ids=args.sites or None, n_workers=args.workers)
+    print(f"\nTrained {len(summary)} sites in {time.perf_counter() - start:.1f}s")
+    print(summary.to_string(index=False))
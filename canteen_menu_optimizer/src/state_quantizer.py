@@ -0,0 +1,85 @@
+import numpy as np
+
+class StateQuantizer:
+    """Fitted per-feature discretizer that turns RL states into packed integer keys.
+
+    Bin edges are computed once from a matrix of representative states and kept as an
+    (n_features, n_bins - 1) matrix, so one state or a whole batch is quantized with a
+    single broadcasted comparison instead of a Python loop over features.
+    """
+
+    WORD_BITS = 63  # Codes are packed into signed int64 words without overflow
+
+    def __init__(self, n_bins=5, strategy='quantile'):
+        self.n_bins = n_bins
+        self.strategy = strategy
+        self.edges = None
+
+    def fit(self, states):
+        """Compute bin edges per feature from a (n_samples, n_features) state matrix"""
+        states = np.asarray(states, dtype=np.float64)
+        if self.strategy == 'quantile':
+            quantiles = np.linspace(0, 1, self.n_bins + 1)[1:-1]
+            edges = np.quantile(states, quantiles, axis=0).T
+        else:  # uniform bins between each feature's observed min and max
+            fractions = np.linspace(0, 1, self.n_bins + 1)[1:-1]
+            low, high = states.min(axis=0), states.max(axis=0)
+            edges = low[:, np.newaxis] + (high - low)[:, np.newaxis] * fractions
+
+        # Drop repeated edges so constant or low-cardinality features keep a dense code range
+        self._set_edges([np.unique(row) for row in edges])
+        return self
+
+    def _set_edges(self, unique_edges):
+        # Pad ragged rows with +inf, which no finite value reaches
+        n_features = len(unique_edges)
+        self.edges = np.full((n_features, max([1] + [len(row) for row in unique_edges])), np.inf)
+        for i, row in enumerate(unique_edges):
+            self.edges[i, :len(row)] = row
+
+        # Mixed-radix multipliers, grouping features into words that fit in int64
+        self.multipliers = np.zeros((n_features, 1), dtype=np.int64)
+        word, capacity = 0, 1
+        for i, row in enumerate(unique_edges):
+            base = len(row) + 1
+            if capacity * base > 2 ** self.WORD_BITS:
+                self.multipliers = np.hstack([self.multipliers, np.zeros((n_features, 1), dtype=np.int64)])
+                word, capacity = word + 1, 1
+            self.multipliers[i, word] = capacity
+            capacity *= base
+
+    def transform(self, states):
+        """Bin codes with the same shape as `states` (one state or a batch)"""
+        if self.edges is None:
+            raise ValueError("StateQuantizer must be fitted before use")
+        states = np.asarray(states, dtype=np.float64)
+        return (states[..., np.newaxis] >= self.edges).sum(axis=-1)
+
+    def keys(self, states):
+        """Packed integer key per state for a (n_samples, n_features) batch"""
+        words = self.transform(states) @ self.multipliers
+        if words.shape[-1] == 1:
+            return words[..., 0].tolist()
+        return [self._combine(row) for row in words]
+
+    def key(self, state):
+        """Packed integer key for a single state"""
+        words = self.transform(state) @ self.multipliers
+        return self._combine(words)
+
+    def _combine(self, words):
+        key = 0
+        for i, word in enumerate(words):
+            key |= int(word) << (self.WORD_BITS * i)
+        return key
+
+    def to_dict(self):
+        """Plain-array representation for saving alongside a model"""
+        return {'n_bins': self.n_bins, 'strategy': self.strategy, 'edges': self.edges}
+
+    @classmethod
+    def from_dict(cls, params):
+        quantizer = cls(params['n_bins'], params['strategy'])
+        if params['edges'] is not None:
+            quantizer._set_edges([row[np.isfinite(row)] for row in np.asarray(params['edges'])])
+        return quantizer
@@ -2,25 +2,38 @@ import pandas as pd
 import numpy as np
 import xgboost as xgb
 import joblib
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import TimeSeriesSplit
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
+from concurrent.futures import ProcessPoolExecutor
+import argparse
 import os
+import time
 
-def train_enhanced_ml_model():
-    # Load enhanced preprocessed data
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    X = pd.read_csv(os.path.join(base_dir, "data/X_enhanced_preprocessed.csv"))
-    y = pd.read_csv(os.path.join(base_dir, "data/y_enhanced_target.csv")).squeeze("columns")
+from data_cache import file_hash
+from data_schema import parse_dates
+from feature_manifest import selected_features
+from model_versions import current_bundle, save_version
+from training_matrix import BATCH_ROWS, cached_matrix, csv_batches, external_matrix
 
-    print(f"Training with enhanced features: {X.shape[1]} features, {X.shape[0]} samples")
-    print("Feature columns:", X.columns.tolist())
+# Rolling-origin backtest: each fold trains on all days before its test block
+N_FOLDS = 4
 
-    # Split data into training and testing sets
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+# Incremental mode continues boosting the current model on rows appended since it was trained.
+# A full rebuild (backtest + fit from scratch) runs instead when the scaled features changed,
+# after MAX_INCREMENTAL_UPDATES updates in a row, or when the model's RMSE on the new days is
+# more than DRIFT_TOLERANCE above its backtest RMSE. The new days' errors are pooled across
+# updates until they cover MIN_DRIFT_DAYS days: on the repo data, 3-day windows of out-of-fold
+# predictions reach up to 1.5x the backtest RMSE by chance, while 7-day windows stay within 1.2x
+INCREMENTAL_TREES = 20
+MAX_INCREMENTAL_UPDATES = 14
+DRIFT_TOLERANCE = 0.25
+MIN_DRIFT_DAYS = 7
 
+def build_enhanced_model(n_jobs=-1):
     # Enhanced XGBoost with optimized hyperparameters
-    model = xgb.XGBRegressor(
+    return xgb.XGBRegressor(
         objective="reg:squarederror",
+        tree_method="hist",  # Histogram splits, which the cached and external-memory matrices are built for
         n_estimators=200,  # Increased for better learning
         learning_rate=0.08,  # Slightly lower for better generalization
         max_depth=6,  # Increased for complex patterns
@@ -29,27 +42,239 @@ def train_enhanced_ml_model():
         reg_alpha=0.1,  # L1 regularization
         reg_lambda=0.1,  # L2 regularization
         random_state=42,
-        n_jobs=-1  # Use all cores
+        n_jobs=n_jobs  # -1 uses all cores; fewer when folds or sites train in parallel
     )
 
-    print("Training enhanced XGBoost model...")
-    model.fit(X_train, y_train)
+def booster_params(n_jobs=-1, model_params=None):
+    """The enhanced model's native training parameters and number of boosting rounds.
+
+    `model_params` overrides XGBRegressor settings of build_enhanced_model (e.g. n_estimators).
+    """
+    model = build_enhanced_model(n_jobs).set_params(**(model_params or {}))
+    return model.get_xgb_params(), model.n_estimators
+
+def to_regressor(booster):
+    """Wrap a trained booster in an XGBRegressor, the model type the decision engines load"""
+    model = xgb.XGBRegressor()
+    model.load_model(bytearray(booster.save_raw()))
+    return model
+
+def regression_metrics(y_true, y_pred):
+    return {
+        'rmse': mean_squared_error(y_true, y_pred) ** 0.5,
+        'mae': mean_absolute_error(y_true, y_pred),
+        'r2': r2_score(y_true, y_pred)
+    }
+
+def time_series_folds(dates, n_folds=N_FOLDS):
+    """Row indices of expanding-window folds split on calendar days, not rows.
+
+    Every row of a test day falls in the same fold, and each fold trains only on
+    earlier days, so no future sales reach training through the lag features.
+    """
+    dates = pd.DatetimeIndex(dates)
+    days = dates.unique().sort_values()
+    folds = []
+    for train_days, test_days in TimeSeriesSplit(n_splits=n_folds).split(days):
+        test_start, test_end = days[test_days[0]], days[test_days[-1]]
+        folds.append((np.flatnonzero(dates < test_start),
+                      np.flatnonzero((dates >= test_start) & (dates <= test_end))))
+    return folds
+
+_worker_matrix = None  # The training matrix, loaded once per worker process
+
+def _attach_matrix(path):
+    global _worker_matrix
+    _worker_matrix = xgb.DMatrix(path)
+
+def _run_fold(fold, dtrain, train_rows, test_rows, n_jobs, model_params):
+    start = time.perf_counter()
+    dtrain = _worker_matrix if dtrain is None else dtrain
+    params, rounds = booster_params(n_jobs, model_params)
+    booster = xgb.train(params, dtrain.slice(train_rows), rounds)
+    dtest = dtrain.slice(test_rows)
+    y_test, y_pred = dtest.get_label(), booster.predict(dtest)
+    return {
+        'fold': fold,
+        'train_rows': len(train_rows),
+        'test_rows': len(test_rows),
+        **regression_metrics(y_test, y_pred),
+        'fit_seconds': time.perf_counter() - start
+    }, y_test, y_pred
+
+def out_of_fold(data, dates, n_folds=N_FOLDS, n_workers=None, model_params=None):
+    """Fit and score every fold, one worker process per fold.
+
+    `data` is a DMatrix, or the path of a binary DMatrix (see training_matrix.py).
+    Given a path, each worker loads the matrix once and slices its folds from it,
+    and the cores are split between the workers for XGBoost's threads. An
+    in-memory DMatrix cannot be sent to workers, so its folds run in this
+    process. Returns the per-fold results and the test rows, targets and
+    predictions of every fold, concatenated.
+    """
+    folds = time_series_folds(dates, n_folds)
+    n_workers = min(n_workers or os.cpu_count(), len(folds)) if isinstance(data, str) else 1
+    n_jobs = max(1, os.cpu_count() // n_workers)
+    if n_workers == 1:  # No pool to start (a single core, an in-memory matrix, or already inside a worker)
+        dtrain = xgb.DMatrix(data) if isinstance(data, str) else data
+        outcomes = [_run_fold(fold, dtrain, train_rows, test_rows, n_jobs, model_params)
+                    for fold, (train_rows, test_rows) in enumerate(folds, 1)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_attach_matrix, initargs=(data,)) as pool:
+            outcomes = list(pool.map(_run_fold, range(1, len(folds) + 1), [None] * len(folds),
+                                     *zip(*folds), [n_jobs] * len(folds), [model_params] * len(folds)))
+
+    fold_results = pd.DataFrame([result for result, _, _ in outcomes])
+    return (fold_results, np.concatenate([test_rows for _, test_rows in folds]),
+            np.concatenate([y_test for _, y_test, _ in outcomes]), np.concatenate([y_pred for _, _, y_pred in outcomes]))
+
+def backtest(data, dates, n_folds=N_FOLDS, n_workers=None, model_params=None):
+    """Per-fold results and the metrics pooled over all out-of-fold predictions"""
+    fold_results, _, y_test, y_pred = out_of_fold(data, dates, n_folds, n_workers, model_params)
+    return fold_results, regression_metrics(y_test, y_pred)
+
+def fit_enhanced_model(data, dates, n_jobs=-1, n_folds=N_FOLDS, n_workers=None, model_params=None):
+    """Backtest the enhanced model on rolling-origin folds, then fit it on all rows"""
+    fold_results, pooled = backtest(data, dates, n_folds, n_workers, model_params)
+    params, rounds = booster_params(n_jobs, model_params)
+    booster = xgb.train(params, xgb.DMatrix(data) if isinstance(data, str) else data, rounds)
+    return to_regressor(booster), fold_results, pooled
 
-    # Evaluate the model
-    y_pred = model.predict(X_test)
-    mse = mean_squared_error(y_test, y_pred)
-    rmse = mse**0.5
-    mae = mean_absolute_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
+def external_backtest(X_path, y_path, dates, n_folds=N_FOLDS, batch_rows=BATCH_ROWS, n_jobs=-1, columns=None):
+    """The backtest for data too large for memory, one fold at a time from external-memory matrices.
 
-    print(f"Enhanced XGBoost Model Performance:")
+    Needs the rows in date order (as the streaming preprocessing writes them), so
+    that each fold's training rows are a prefix of the CSVs and its test rows
+    the block right after; the test block is predicted batch by batch.
+    """
+    params, rounds = booster_params(n_jobs)
+    results, y_tests, y_preds = [], [], []
+    for fold, (train_rows, test_rows) in enumerate(time_series_folds(dates, n_folds), 1):
+        if train_rows[-1] != len(train_rows) - 1 or test_rows[-1] - test_rows[0] != len(test_rows) - 1:
+            raise ValueError("External-memory training needs the preprocessed rows in date order; "
+                             "rerun data_preprocessing_enhanced.py --stream")
+        start = time.perf_counter()
+        booster = xgb.train(params, external_matrix(X_path, y_path, batch_rows, stop=len(train_rows), columns=columns),
+                            rounds)
+        y_test, y_pred = [], []
+        for X_batch, y_batch in csv_batches(X_path, y_path, batch_rows, test_rows[0], test_rows[-1] + 1, columns):
+            y_test.append(y_batch.to_numpy())
+            y_pred.append(booster.inplace_predict(X_batch))
+        y_tests.append(np.concatenate(y_test))
+        y_preds.append(np.concatenate(y_pred))
+        results.append({
+            'fold': fold,
+            'train_rows': len(train_rows),
+            'test_rows': len(test_rows),
+            **regression_metrics(y_tests[-1], y_preds[-1]),
+            'fit_seconds': time.perf_counter() - start
+        })
+    return pd.DataFrame(results), regression_metrics(np.concatenate(y_tests), np.concatenate(y_preds))
+
+def fit_external_model(X_path, y_path, dates, n_jobs=-1, n_folds=N_FOLDS, batch_rows=BATCH_ROWS, columns=None):
+    """fit_enhanced_model for CSVs larger than memory, training from external-memory matrices"""
+    fold_results, pooled = external_backtest(X_path, y_path, dates, n_folds, batch_rows, n_jobs, columns)
+    params, rounds = booster_params(n_jobs)
+    booster = xgb.train(params, external_matrix(X_path, y_path, batch_rows, columns=columns), rounds)
+    return to_regressor(booster), fold_results, pooled
+
+def update_enhanced_model(model, dnew, n_jobs=-1):
+    """Add INCREMENTAL_TREES trees to a fitted model, boosting from its booster on the new rows only"""
+    params, _ = booster_params(n_jobs)
+    return to_regressor(xgb.train(params, dnew, INCREMENTAL_TREES, xgb_model=model.get_booster()))
+
+def choose_training_mode(previous, n_rows, scaler_hash, features):
+    """('incremental' | 'full' | None, reason) for the current bundle and preprocessed data"""
+    if previous is None:
+        return 'full', "no versioned model yet"
+    if previous['scaler_hash'] != scaler_hash or n_rows < previous['trained_rows']:
+        return 'full', "the preprocessed features were rebuilt"
+    if previous.get('features') != features:
+        return 'full', "the selected feature set changed"
+    if n_rows == previous['trained_rows']:
+        return None, "no rows appended since the current version"
+    if previous['incremental_updates'] >= MAX_INCREMENTAL_UPDATES:
+        return 'full', f"{previous['incremental_updates']} incremental updates since the last rebuild"
+    return 'incremental', f"{n_rows - previous['trained_rows']} new rows"
+
+def train_enhanced_ml_model(incremental=False, external_memory=False):
+    # Enhanced preprocessed data; only the dates and the header are read up front
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    X_path = os.path.join(base_dir, "data/X_enhanced_preprocessed.csv")
+    y_path = os.path.join(base_dir, "data/y_enhanced_target.csv")
+
+    # Rows line up with the full dataset written by the same preprocessing run
+    dates = parse_dates(pd.read_csv(os.path.join(base_dir, "data/full_enhanced_dataset.csv"), usecols=["date"]))["date"]
+    n_rows = len(dates)
+    if len(pd.read_csv(y_path)) != n_rows:
+        raise ValueError("full_enhanced_dataset.csv and y_enhanced_target.csv have different row counts; "
+                         "rerun data_preprocessing_enhanced.py")
+
+    # Every preprocessed feature, unless select_features.py saved a reduced set
+    models_dir = os.path.join(base_dir, 'models')
+    feature_names = selected_features(models_dir) or pd.read_csv(X_path, nrows=0).columns.tolist()
+    print(f"Training with enhanced features: {len(feature_names)} features, {n_rows} samples")
+    print("Feature columns:", feature_names)
+
+    scaler_hash = file_hash(os.path.join(models_dir, "enhanced_scaler.pkl"))
+    previous = current_bundle(models_dir)
+    mode, reason = choose_training_mode(previous, n_rows, scaler_hash, feature_names) if incremental else ('full', "requested")
+    if mode is None:
+        print(f"Nothing to train: {reason} ({previous['version']}).")
+        return previous['model'], previous['rmse'], previous['mae'], previous['r2']
+
+    start = time.perf_counter()
+    if mode == 'incremental':
+        # Score the current model on the new days first: an honest forward test, and the drift check
+        batches = list(csv_batches(X_path, y_path, start=previous['trained_rows'], columns=feature_names))
+        X_new = pd.concat([X_batch for X_batch, _ in batches])
+        y_new = pd.concat([y_batch for _, y_batch in batches])
+        dnew = xgb.DMatrix(X_new, y_new)
+        new_days = regression_metrics(y_new, previous['model'].get_booster().predict(dnew))
+
+        # Each run's errors are a forward test of the model before it; pool them until enough days are seen
+        drift = {
+            'drift_days': previous.get('drift_days', 0) + dates.iloc[previous['trained_rows']:].nunique(),
+            'drift_rows': previous.get('drift_rows', 0) + len(y_new),
+            'drift_sse': previous.get('drift_sse', 0.0) + new_days['rmse'] ** 2 * len(y_new)
+        }
+        if drift['drift_days'] < MIN_DRIFT_DAYS:
+            reason += f"; drift check after {MIN_DRIFT_DAYS} new days, {drift['drift_days']} so far"
+        else:
+            drift_rmse = (drift['drift_sse'] / drift['drift_rows']) ** 0.5
+            if drift_rmse > (1 + DRIFT_TOLERANCE) * previous['baseline_rmse']:
+                mode, reason = 'full', (f"RMSE on the last {drift['drift_days']} new days ({drift_rmse:.2f}) "
+                                        f"drifted above the backtest RMSE ({previous['baseline_rmse']:.2f})")
+            else:
+                reason += f"; RMSE on the last {drift['drift_days']} new days {drift_rmse:.2f}, no drift"
+            drift = {'drift_days': 0, 'drift_rows': 0, 'drift_sse': 0.0}
+    print(f"Training mode: {mode} ({reason})")
+
+    if mode == 'incremental':
+        print(f"Boosting {INCREMENTAL_TREES} more trees on {len(y_new)} new rows...")
+        model = update_enhanced_model(previous['model'], dnew)
+        metrics = {**new_days, 'baseline_rmse': previous['baseline_rmse'],
+                   'incremental_updates': previous['incremental_updates'] + 1, **drift}
+        print(f"Enhanced XGBoost Model Performance (previous version on the new days):")
+    else:
+        print(f"Backtesting on {N_FOLDS} rolling-origin folds, then training enhanced XGBoost model on all rows...")
+        if external_memory:
+            model, fold_results, pooled = fit_external_model(X_path, y_path, dates, columns=feature_names)
+        else:
+            model, fold_results, pooled = fit_enhanced_model(cached_matrix(X_path, y_path, feature_names), dates)
+        metrics = {**pooled, 'baseline_rmse': pooled['rmse'], 'incremental_updates': 0,
+                   'drift_days': 0, 'drift_rows': 0, 'drift_sse': 0.0}
+        print(f"Enhanced XGBoost Model Performance (out-of-fold):")
+        print(fold_results.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+    seconds = time.perf_counter() - start
+    rmse, mae, r2 = metrics['rmse'], metrics['mae'], metrics['r2']
     print(f"RMSE: {rmse:.2f}")
     print(f"MAE: {mae:.2f}")
     print(f"R²: {r2:.4f}")
+    print(f"Training time: {seconds:.1f}s")
 
     # Feature importance analysis
     feature_importance = model.feature_importances_
-    feature_names = X.columns
     importance_df = pd.DataFrame({
         'feature': feature_names,
         'importance': feature_importance
@@ -58,11 +283,18 @@ def train_enhanced_ml_model():
     print("\\nTop 15 Most Important Features:")
     print(importance_df.head(15).to_string(index=False))
 
-    # Save the enhanced model
-    models_dir = os.path.join(base_dir, 'models')
-    os.makedirs(models_dir, exist_ok=True)
-    joblib.dump(model, os.path.join(models_dir, "enhanced_xgboost_model.pkl"))
-    print("\\nEnhanced XGBoost model trained and saved to enhanced_xgboost_model.pkl")
+    # Save the enhanced model as a new version and publish it as enhanced_xgboost_model.pkl
+    version = save_version(models_dir, model, {
+        'mode': mode,
+        'trees': model.get_booster().num_boosted_rounds(),
+        'trained_rows': n_rows,
+        'features': feature_names,
+        'last_date': dates.max().date(),
+        'scaler_hash': scaler_hash,
+        'seconds': seconds,
+        **metrics
+    })
+    print(f"\\nEnhanced XGBoost model trained and saved to enhanced_xgboost_model.pkl (version {version})")
 
     # Save feature importance for reference
     importance_df.to_csv(os.path.join(base_dir, "data/feature_importance.csv"), index=False)
@@ -71,4 +303,10 @@ def train_enhanced_ml_model():
     return model, rmse, mae, r2
 
 if __name__ == "__main__":
-    model, rmse, mae, r2 = train_enhanced_ml_model()
+    parser = argparse.ArgumentParser(description="Train the enhanced XGBoost demand model")
+    parser.add_argument("--incremental", action="store_true",
+                        help="continue boosting the current model on newly appended rows when the rebuild policy allows")
+    parser.add_argument("--external-memory", action="store_true",
+                        help="train from the CSVs in batches (XGBoost external memory) instead of an in-memory matrix")
+    args = parser.parse_args()
+    model, rmse, mae, r2 = train_enhanced_ml_model(incremental=args.incremental, external_memory=args.external_memory)
@@ -1,13 +1,18 @@
 import numpy as np
 import pandas as pd
-import random
-from collections import defaultdict
+import argparse
 import joblib
 import os
+from contextlib import nullcontext
+
+from q_table import DenseQTable
+from replay_buffer import ReplayBuffer
+from state_quantizer import StateQuantizer
 
 class EnhancedQLearningAgent:
     def __init__(self, state_size, action_size, learning_rate=0.1, discount_factor=0.99, 
-                 epsilon=1.0, epsilon_decay_rate=0.995, min_epsilon=0.01):
+                 epsilon=1.0, epsilon_decay_rate=0.995, min_epsilon=0.01, seed=None,
+                 n_bins=5, quantizer=None, replay_capacity=0, batch_size=32, replay_every=4):
         self.state_size = state_size
         self.action_size = action_size
         self.learning_rate = learning_rate
@@ -15,93 +20,433 @@ class EnhancedQLearningAgent:
         self.epsilon = epsilon
         self.epsilon_decay_rate = epsilon_decay_rate
         self.min_epsilon = min_epsilon
-        self.q_table = defaultdict(lambda: np.zeros(self.action_size))
+        self.q_table = DenseQTable(self.action_size)
+        self.rng = np.random.default_rng(seed)  # Owned RNG so exploration is reproducible
+        self.quantizer = quantizer or StateQuantizer(n_bins)
+
+        # Experience replay mode is enabled by a non-zero replay_capacity
+        self.replay_buffer = ReplayBuffer(replay_capacity, state_size, seed=seed) if replay_capacity else None
+        self.batch_size = batch_size
+        self.replay_every = replay_every
+        self._steps_since_replay = 0
         
         # Track learning progress
         self.episode_rewards = []
         self.epsilon_history = []
 
-    def _state_to_tuple(self, state):
-        """Convert numpy array state to a hashable tuple with quantization for large state spaces"""
-        # Use percentile-based quantization for better state representation
-        if len(state) > 20:  # For large state spaces, use coarser quantization
-            bins = 5
-        else:
-            bins = 10
-            
-        # Quantize each dimension independently based on its range
-        quantized_state = []
-        for i, value in enumerate(state):
-            # Use fixed ranges for known feature types to ensure consistency
-            if i < 5:  # Day context features
-                if i == 0:  # day_of_week
-                    quantized_state.append(int(value) if -1 <= value <= 1 else 0)
-                elif i == 1:  # month  
-                    quantized_state.append(int(value) if -2 <= value <= 2 else 0)
-                else:
-                    quantized_state.append(int(np.digitize(value, np.linspace(-3, 3, bins))))
-            elif i < 9:  # Weather features (temperature, humidity, rainfall, feels_like)
-                quantized_state.append(int(np.digitize(value, np.linspace(-3, 3, bins))))
-            else:  # Other features
-                quantized_state.append(int(np.digitize(value, np.linspace(-2, 2, bins))))
-                
-        return tuple(quantized_state)
+    def fit_quantizer(self, states):
+        """Fit the state quantizer's bin edges on a matrix of representative states"""
+        self.quantizer.fit(states)
+        return self
+
+    def _state_to_key(self, state):
+        """Convert numpy array state to a packed integer key using the fitted quantizer"""
+        return self.quantizer.key(state)
 
     def choose_action(self, state):
-        if random.uniform(0, 1) < self.epsilon:
-            return random.randint(0, self.action_size - 1)  # Explore
+        if self.rng.random() < self.epsilon:
+            return int(self.rng.integers(self.action_size))  # Explore
         else:
-            state_tuple = self._state_to_tuple(state)
-            return np.argmax(self.q_table[state_tuple])  # Exploit
+            state_key = self._state_to_key(state)
+            return np.argmax(self.q_table[state_key])  # Exploit
 
     def learn(self, state, action, reward, next_state, done):
-        state_tuple = self._state_to_tuple(state)
-        
-        if done or next_state is None:
-            target = reward
+        if self.replay_buffer is not None:
+            # Store the transition and periodically learn from a sampled minibatch
+            self.replay_buffer.add(state, action, reward, next_state, done)
+            self._steps_since_replay += 1
+            if self._steps_since_replay >= self.replay_every and len(self.replay_buffer) >= self.batch_size:
+                self.replay()
+                self._steps_since_replay = 0
         else:
-            next_state_tuple = self._state_to_tuple(next_state)
-            target = reward + self.discount_factor * np.max(self.q_table[next_state_tuple])
+            state_key = self._state_to_key(state)
+
+            if done or next_state is None:
+                target = reward
+            else:
+                next_state_key = self._state_to_key(next_state)
+                target = reward + self.discount_factor * np.max(self.q_table[next_state_key])
 
-        # Q-learning update with enhanced learning rate decay
-        current_q = self.q_table[state_tuple][action]
-        self.q_table[state_tuple][action] = current_q + self.learning_rate * (target - current_q)
+            # Q-learning update with enhanced learning rate decay
+            current_q = self.q_table[state_key][action]
+            self.q_table[state_key][action] = current_q + self.learning_rate * (target - current_q)
 
         # Decay epsilon more gradually for better exploration
         if self.epsilon > self.min_epsilon:
             self.epsilon *= self.epsilon_decay_rate
 
+    def remember_batch(self, states, actions, rewards, next_states, dones):
+        """Add many transitions (e.g. historical days) to the replay buffer without stepping the env"""
+        self.replay_buffer.add_batch(states, actions, rewards, next_states, dones)
+
+    def replay(self, batch_size=None):
+        """Sample a minibatch from the replay buffer and apply one batched Q-learning update"""
+        self.learn_batch(*self.replay_buffer.sample(batch_size or self.batch_size))
+
+    def learn_batch(self, states, actions, rewards, next_states, dones):
+        """Vectorized Q-learning update for a batch of transitions"""
+        # Resolve every row before touching values: inserting unseen states may grow the table
+        rows = np.array([self.q_table.row(key) for key in self.quantizer.keys(states)], dtype=np.int64)
+        not_done = ~np.asarray(dones, dtype=bool)
+        next_rows = np.array([self.q_table.row(key) for key in self.quantizer.keys(next_states[not_done])],
+                             dtype=np.int64)
+        q_values = self.q_table.values
+
+        targets = np.array(rewards, dtype=np.float64)
+        if len(next_rows):
+            targets[not_done] += self.discount_factor * q_values[next_rows].max(axis=1)
+        td_errors = targets - q_values[rows, actions]
+
+        # Average repeated (state, action) pairs so duplicates in a batch do not overshoot
+        _, inverse, counts = np.unique(rows * self.action_size + actions, return_inverse=True, return_counts=True)
+        np.add.at(q_values, (rows, actions), self.learning_rate * td_errors / counts[inverse])
+
     def save_model(self, filepath):
-        """Save the Q-table and agent parameters"""
+        """Save agent parameters to `filepath` and the Q-table as .npy files beside it"""
         model_data = {
-            'q_table': dict(self.q_table),
             'state_size': self.state_size,
             'action_size': self.action_size,
             'epsilon': self.epsilon,
+            'quantizer': self.quantizer.to_dict(),
             'episode_rewards': self.episode_rewards,
             'epsilon_history': self.epsilon_history
         }
+        self.q_table.save(filepath)
         joblib.dump(model_data, filepath)
 
-    def load_model(self, filepath):
+    def load_model(self, filepath, mmap_mode=None):
         """Load the Q-table and agent parameters"""
         model_data = joblib.load(filepath)
-        self.q_table = defaultdict(lambda: np.zeros(self.action_size), model_data['q_table'])
         self.state_size = model_data['state_size']
         self.action_size = model_data['action_size']
+        if 'q_table' in model_data:  # Older files pickled the Q-table as a dict
+            self.q_table = DenseQTable.from_dict(model_data['q_table'], self.action_size)
+        else:
+            self.q_table = DenseQTable.load(filepath, mmap_mode=mmap_mode)
         self.epsilon = model_data['epsilon']
+        if 'quantizer' in model_data:
+            self.quantizer = StateQuantizer.from_dict(model_data['quantizer'])
         if 'episode_rewards' in model_data:
             self.episode_rewards = model_data['episode_rewards']
         if 'epsilon_history' in model_data:
             self.epsilon_history = model_data['epsilon_history']
 
+    def checkpoint_state(self):
+        """Everything needed to resume training exactly where it stopped"""
+        return {
+            'q_keys': list(self.q_table.keys()),
+            'q_values': np.array(self.q_table.values),
+            'quantizer': self.quantizer.to_dict(),
+            'epsilon': self.epsilon,
+            'rng_state': self.rng.bit_generator.state,
+            'replay_buffer': self.replay_buffer.to_dict() if self.replay_buffer is not None else None,
+            'steps_since_replay': self._steps_since_replay,
+            'episode_rewards': list(self.episode_rewards),
+            'epsilon_history': list(self.epsilon_history)
+        }
+
+    def restore_checkpoint_state(self, state):
+        self.q_table = DenseQTable.from_arrays(state['q_keys'], state['q_values'])
+        self.quantizer = StateQuantizer.from_dict(state['quantizer'])
+        self.epsilon = state['epsilon']
+        self.rng.bit_generator.state = state['rng_state']
+        if state['replay_buffer'] is not None:
+            self.replay_buffer = ReplayBuffer.from_dict(state['replay_buffer'])
+        self._steps_since_replay = state['steps_since_replay']
+        self.episode_rewards = state['episode_rewards']
+        self.epsilon_history = state['epsilon_history']
+
     def get_q_value(self, state, action):
         """Get Q-value for debugging and analysis"""
-        state_tuple = self._state_to_tuple(state)
-        return self.q_table[state_tuple][action]
+        state_key = self._state_to_key(state)
+        return self.q_table[state_key][action]
+
+class LinearQAgent:
+    """Q-learning with tile-coded linear function approximation.
+
+    Each state feature is covered by `n_tilings` offset tilings of `n_tiles` tiles,
+    so a state activates one weight row per (feature, tiling) plus a bias row. The
+    weight matrix has a fixed (n_weights, action_size) shape however many states are
+    visited, and Q(s, .) is the sum of the active rows (a sparse dot product).
+    """
+
+    def __init__(self, state_size, action_size, learning_rate=0.1, discount_factor=0.99,
+                 epsilon=1.0, epsilon_decay_rate=0.995, min_epsilon=0.01, seed=None,
+                 n_tiles=8, n_tilings=4, replay_capacity=0, batch_size=32, replay_every=4):
+        self.state_size = state_size
+        self.action_size = action_size
+        self.learning_rate = learning_rate
+        self.discount_factor = discount_factor
+        self.epsilon = epsilon
+        self.epsilon_decay_rate = epsilon_decay_rate
+        self.min_epsilon = min_epsilon
+        self.rng = np.random.default_rng(seed)
+        self.n_tiles = n_tiles
+        self.n_tilings = n_tilings
+
+        # One row per (feature, tiling, tile) plus a bias row that is always active
+        self.n_weights = state_size * n_tilings * (n_tiles + 1) + 1
+        self.weights = np.zeros((self.n_weights, action_size), dtype=np.float64)
+        self.low = np.zeros(state_size)
+        self.tile_width = np.ones(state_size)
+
+        # Tiling k is shifted by k / n_tilings of a tile; offsets index each (feature, tiling) block
+        self._tiling_shift = np.arange(n_tilings) / n_tilings
+        self._block_offset = (np.arange(state_size * n_tilings) * (n_tiles + 1)).reshape(state_size, n_tilings)
+
+        self.replay_buffer = ReplayBuffer(replay_capacity, state_size, seed=seed) if replay_capacity else None
+        self.batch_size = batch_size
+        self.replay_every = replay_every
+        self._steps_since_replay = 0
+
+        # Track learning progress
+        self.episode_rewards = []
+        self.epsilon_history = []
+
+    def fit_quantizer(self, states):
+        """Fit each feature's tile range on a matrix of representative states"""
+        states = np.asarray(states, dtype=np.float64)
+        self.low = states.min(axis=0)
+        span = states.max(axis=0) - self.low
+        self.tile_width = np.where(span > 0, span / self.n_tiles, 1.0)
+        return self
+
+    def _active_features(self, states):
+        """(batch, n_active) indices of the weight rows activated by each state"""
+        states = np.atleast_2d(np.asarray(states, dtype=np.float64))
+        scaled = (states - self.low) / self.tile_width
+        tiles = np.floor(scaled[:, :, np.newaxis] + self._tiling_shift).astype(np.int64)
+        tiles = np.clip(tiles, 0, self.n_tiles)
+        active = (self._block_offset + tiles).reshape(len(states), -1)
+        bias = np.full((len(states), 1), self.n_weights - 1)
+        return np.hstack([active, bias])
+
+    def q_values(self, states):
+        """Q-values for a batch of states, shape (batch, action_size)"""
+        return self.weights[self._active_features(states)].sum(axis=1)
+
+    def choose_action(self, state):
+        if self.rng.random() < self.epsilon:
+            return int(self.rng.integers(self.action_size))  # Explore
+        else:
+            return int(np.argmax(self.q_values(state)[0]))  # Exploit
+
+    def learn(self, state, action, reward, next_state, done):
+        if self.replay_buffer is not None:
+            self.replay_buffer.add(state, action, reward, next_state, done)
+            self._steps_since_replay += 1
+            if self._steps_since_replay >= self.replay_every and len(self.replay_buffer) >= self.batch_size:
+                self.learn_batch(*self.replay_buffer.sample(self.batch_size))
+                self._steps_since_replay = 0
+        else:
+            done = done or next_state is None
+            next_states = np.zeros((1, self.state_size)) if next_state is None else np.asarray(next_state)[np.newaxis]
+            self.learn_batch(np.asarray(state)[np.newaxis], np.array([action]), np.array([reward]),
+                             next_states, np.array([done]))
+
+        # Decay epsilon more gradually for better exploration
+        if self.epsilon > self.min_epsilon:
+            self.epsilon *= self.epsilon_decay_rate
+
+    def remember_batch(self, states, actions, rewards, next_states, dones):
+        """Add many transitions (e.g. historical days) to the replay buffer without stepping the env"""
+        self.replay_buffer.add_batch(states, actions, rewards, next_states, dones)
+
+    def learn_batch(self, states, actions, rewards, next_states, dones):
+        """Semi-gradient Q-learning step for a batch of transitions"""
+        actions = np.asarray(actions, dtype=np.int64)
+        active = self._active_features(states)
+        current_q = self.weights[active, actions[:, np.newaxis]].sum(axis=1)
+
+        targets = np.array(rewards, dtype=np.float64)
+        not_done = ~np.asarray(dones, dtype=bool)
+        if not_done.any():
+            targets[not_done] += self.discount_factor * self.q_values(next_states[not_done]).max(axis=1)
+
+        # Each transition's step is split across its active rows, so it moves its own Q(s, a) by
+        # learning_rate * TD error whatever the batch size; a minibatch applies one such step per transition
+        step = self.learning_rate * (targets - current_q) / active.shape[1]
+        np.add.at(self.weights, (active, actions[:, np.newaxis]), step[:, np.newaxis])
+
+    def save_model(self, filepath):
+        """Save the weight matrix, tile ranges and agent parameters"""
+        model_data = {
+            'state_size': self.state_size,
+            'action_size': self.action_size,
+            'epsilon': self.epsilon,
+            'n_tiles': self.n_tiles,
+            'n_tilings': self.n_tilings,
+            'low': self.low,
+            'tile_width': self.tile_width,
+            'weights': self.weights,
+            'episode_rewards': self.episode_rewards,
+            'epsilon_history': self.epsilon_history
+        }
+        joblib.dump(model_data, filepath)
+
+    def load_model(self, filepath):
+        """Load the weight matrix, tile ranges and agent parameters"""
+        model_data = joblib.load(filepath)
+        self.__init__(model_data['state_size'], model_data['action_size'],
+                      learning_rate=self.learning_rate, discount_factor=self.discount_factor,
+                      n_tiles=model_data['n_tiles'], n_tilings=model_data['n_tilings'])
+        self.epsilon = model_data['epsilon']
+        self.low = model_data['low']
+        self.tile_width = model_data['tile_width']
+        self.weights = model_data['weights']
+        self.episode_rewards = model_data['episode_rewards']
+        self.epsilon_history = model_data['epsilon_history']
+
+    def checkpoint_state(self):
+        """Everything needed to resume training exactly where it stopped"""
+        return {
+            'weights': self.weights.copy(),
+            'low': self.low,
+            'tile_width': self.tile_width,
+            'epsilon': self.epsilon,
+            'rng_state': self.rng.bit_generator.state,
+            'replay_buffer': self.replay_buffer.to_dict() if self.replay_buffer is not None else None,
+            'steps_since_replay': self._steps_since_replay,
+            'episode_rewards': list(self.episode_rewards),
+            'epsilon_history': list(self.epsilon_history)
+        }
+
+    def restore_checkpoint_state(self, state):
+        self.weights = state['weights']
+        self.low = state['low']
+        self.tile_width = state['tile_width']
+        self.epsilon = state['epsilon']
+        self.rng.bit_generator.state = state['rng_state']
+        if state['replay_buffer'] is not None:
+            self.replay_buffer = ReplayBuffer.from_dict(state['replay_buffer'])
+        self._steps_since_replay = state['steps_since_replay']
+        self.episode_rewards = state['episode_rewards']
+        self.epsilon_history = state['epsilon_history']
+
+    def get_q_value(self, state, action):
+        """Get Q-value for debugging and analysis"""
+        return self.q_values(state)[0, action]
+
+class EarlyStopping:
+    """Signals a plateau once the moving-average episode reward stops improving"""
+
+    def __init__(self, window=10, patience=20, min_delta=0.01):
+        self.window = window
+        self.patience = patience
+        self.min_delta = min_delta  # Relative improvement over the best average that counts as progress
+        self.best_average = None
+        self.episodes_without_improvement = 0
+
+    @property
+    def stopped(self):
+        return self.episodes_without_improvement >= self.patience
+
+    def update(self, episode_rewards):
+        """Record the latest episode's reward history; returns True once training should stop"""
+        if len(episode_rewards) < self.window:
+            return False
+        average = float(np.mean(episode_rewards[-self.window:]))
+        if self.best_average is None or average > self.best_average + self.min_delta * abs(self.best_average):
+            self.best_average = average
+            self.episodes_without_improvement = 0
+        else:
+            self.episodes_without_improvement += 1
+        return self.stopped
+
+def save_checkpoint(filepath, agent, env, episode, early_stopping=None, metrics=None):
+    """Write a training checkpoint atomically: dump to a temp file, then rename over the old one"""
+    checkpoint = {
+        'episode': episode,
+        'agent': agent.checkpoint_state(),
+        'env_rng_state': env.rng.bit_generator.state,
+        'early_stopping': dict(vars(early_stopping)) if early_stopping is not None else None,
+        'metrics': metrics.history if metrics is not None else []
+    }
+    tmp_path = filepath + ".tmp"
+    joblib.dump(checkpoint, tmp_path)
+    os.replace(tmp_path, filepath)
+
+def load_checkpoint(filepath, agent, env, early_stopping=None, metrics=None):
+    """Restore agent, env RNG, early-stopping and metrics state; returns the number of completed episodes"""
+    checkpoint = joblib.load(filepath)
+    agent.restore_checkpoint_state(checkpoint['agent'])
+    env.rng.bit_generator.state = checkpoint['env_rng_state']
+    if early_stopping is not None and checkpoint['early_stopping'] is not None:
+        # Keep the new run's settings but carry over the plateau progress
+        early_stopping.best_average = checkpoint['early_stopping']['best_average']
+        early_stopping.episodes_without_improvement = checkpoint['early_stopping']['episodes_without_improvement']
+    if metrics is not None:
+        metrics.history = list(checkpoint.get('metrics', []))
+    return checkpoint['episode']
+
+def train_agent(agent, env, episodes, start_episode=0, checkpoint_path=None, checkpoint_every=10,
+                early_stopping=None, max_steps=1000, verbose=True, metrics=None):
+    """Run episodes `start_episode`..`episodes`, checkpointing periodically and stopping on a plateau.
+
+    With a TrainingMetrics instance, each episode's time split and throughput are recorded too.
+    """
+    with metrics.instrument(agent, env) if metrics is not None else nullcontext():
+        for episode in range(start_episode, episodes):
+            if early_stopping is not None and early_stopping.stopped:
+                if verbose:
+                    print(f"Early stopping after episode {episode}: no {early_stopping.min_delta:.0%} improvement in the "
+                          f"{early_stopping.window}-episode average reward for {early_stopping.patience} episodes")
+                break
+
+            if metrics is not None:
+                metrics.start_episode()
+            state = env.reset()
+            done = False
+            total_reward = 0
+            step_count = 0
+
+            while not done and step_count < max_steps:  # Episode length cap; also prevents infinite loops
+                action = agent.choose_action(state)
+                next_state, reward, done, _ = env.step(action)
+                agent.learn(state, action, reward, next_state, done)
+                state = next_state
+                total_reward += reward
+                step_count += 1
+
+            agent.episode_rewards.append(total_reward)
+            agent.epsilon_history.append(agent.epsilon)
+            if metrics is not None:
+                metrics.end_episode(episode + 1, step_count, agent)
+            if early_stopping is not None:
+                early_stopping.update(agent.episode_rewards)
+
+            # Print progress every 10 episodes
+            if verbose and (episode + 1) % 10 == 0:
+                avg_reward = np.mean(agent.episode_rewards[-10:])
+                throughput = f", {metrics.history[-1]['steps_per_sec']:,.0f} steps/s" if metrics is not None else ""
+                print(f"Episode {episode + 1}: Avg Reward (last 10) = {avg_reward:.0f}, "
+                      f"Current Reward = {total_reward:.0f}, Epsilon = {agent.epsilon:.3f}{throughput}")
+
+            if checkpoint_path and ((episode + 1) % checkpoint_every == 0 or episode + 1 == episodes
+                                    or (early_stopping is not None and early_stopping.stopped)):
+                save_checkpoint(checkpoint_path, agent, env, episode + 1, early_stopping, metrics)
+    return agent
 
 if __name__ == '__main__':
+    import cProfile
+    import pstats
     from enhanced_canteen_env import EnhancedCanteenEnv
+    from training_metrics import TrainingMetrics
+
+    parser = argparse.ArgumentParser(description="Train the enhanced Q-learning agent")
+    parser.add_argument("--agent", choices=["tabular", "linear"], default="tabular",
+                        help="tabular Q-table or tile-coded linear function approximation")
+    parser.add_argument("--replay-capacity", type=int, default=0,
+                        help="enable experience replay with this many transitions (0 = online updates)")
+    parser.add_argument("--batch-size", type=int, default=32, help="replay minibatch size")
+    parser.add_argument("--episodes", type=int, default=150, help="maximum number of training episodes")
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="episodes between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint if one exists")
+    parser.add_argument("--patience", type=int, default=20,
+                        help="stop after this many episodes without improvement in the moving-average reward (0 = never)")
+    parser.add_argument("--profile", action="store_true",
+                        help="run training under cProfile and dump the stats to data/rl_training.prof")
+    args = parser.parse_args()
     
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     sales_path = os.path.join(base_dir, "data/historical_sales.csv")
@@ -109,7 +454,8 @@ if __name__ == '__main__':
     weather_path = os.path.join(base_dir, "data/weather_data.csv")
     academic_path = os.path.join(base_dir, "data/academic_calendar.csv")
     
-    env = EnhancedCanteenEnv(sales_path, operational_path, weather_path, academic_path)
+    seed = 42  # Fixed seed so training benchmarks are reproducible
+    env = EnhancedCanteenEnv(sales_path, operational_path, weather_path, academic_path, seed=seed)
     state_size = env.get_state_space_size()
     action_size = env.get_action_space_size()
 
@@ -117,53 +463,69 @@ if __name__ == '__main__':
     print(f"State size: {state_size}")
     print(f"Action size: {action_size}")
 
-    agent = EnhancedQLearningAgent(state_size, action_size)
+    agent_class = LinearQAgent if args.agent == "linear" else EnhancedQLearningAgent
+    agent = agent_class(state_size, action_size, seed=seed,
+                        replay_capacity=args.replay_capacity, batch_size=args.batch_size)
+    env.reset()
+    agent.fit_quantizer(env.get_state_matrix())
 
-    episodes = 150  # Increased episodes for better learning
-    best_reward = float('-inf')
-    
-    for episode in range(episodes):
-        state = env.reset()
-        done = False
-        total_reward = 0
-        step_count = 0
-
-        while not done and step_count < 1000:  # Prevent infinite loops
-            action = agent.choose_action(state)
-            next_state, reward, done, _ = env.step(action)
-            agent.learn(state, action, reward, next_state, done)
-            state = next_state
-            total_reward += reward
-            step_count += 1
-
-        agent.episode_rewards.append(total_reward)
-        agent.epsilon_history.append(agent.epsilon)
-        
-        if total_reward > best_reward:
-            best_reward = total_reward
-            
-        # Print progress every 10 episodes
-        if (episode + 1) % 10 == 0:
-            avg_reward = np.mean(agent.episode_rewards[-10:])
-            print(f"Episode {episode + 1}: Avg Reward (last 10) = {avg_reward:.0f}, "
-                  f"Current Reward = {total_reward:.0f}, Epsilon = {agent.epsilon:.3f}")
+    if agent.replay_buffer is not None:
+        # Seed the buffer with every historical day under random actions, no env stepping needed
+        agent.remember_batch(*env.get_transitions(env.rng.integers(0, action_size, env.max_steps)))
+        print(f"Replay buffer pre-filled with {len(agent.replay_buffer)} historical transitions")
+
+    episodes = args.episodes
+    early_stopping = EarlyStopping(window=10, patience=args.patience) if args.patience else None
+    models_dir = os.path.join(base_dir, 'models')
+    os.makedirs(models_dir, exist_ok=True)
+    checkpoint_path = os.path.join(models_dir, f"enhanced_rl_{args.agent}_checkpoint.pkl")
+
+    metrics = TrainingMetrics()
+
+    start_episode = 0
+    if args.resume and os.path.exists(checkpoint_path):
+        start_episode = load_checkpoint(checkpoint_path, agent, env, early_stopping, metrics)
+        print(f"Resumed from {checkpoint_path} after episode {start_episode}")
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    train_agent(agent, env, episodes, start_episode=start_episode, checkpoint_path=checkpoint_path,
+                checkpoint_every=args.checkpoint_every, early_stopping=early_stopping, metrics=metrics)
+    if profiler is not None:
+        profiler.disable()
+        profile_path = os.path.join(base_dir, "data/rl_training.prof")
+        profiler.dump_stats(profile_path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+        print(f"cProfile stats saved to {profile_path}")
+    best_reward = max(agent.episode_rewards)
 
     print(f"\\nTraining completed!")
     print(f"Best reward achieved: {best_reward:.0f}")
     print(f"Final epsilon: {agent.epsilon:.3f}")
-    print(f"Total Q-table entries: {len(agent.q_table)}")
+    if metrics.history:
+        summary = metrics.summary()
+        print(f"Throughput: {summary['steps_per_sec']:,.0f} steps/s; time split: "
+              + ", ".join(f"{section} {summary[section]:.0%}" for section in TrainingMetrics.SECTIONS)
+              + " (choose_action and learn exclude their state_key time)")
+    if args.agent == "linear":
+        print(f"Weight matrix shape: {agent.weights.shape}")
+        agent.save_model(os.path.join(models_dir, "enhanced_rl_linear_q.pkl"))
+        print("Enhanced RL linear Q weights saved.")
+    else:
+        print(f"Total Q-table entries: {len(agent.q_table)}")
 
-    # Save enhanced model
-    models_dir = os.path.join(base_dir, 'models')
-    os.makedirs(models_dir, exist_ok=True)
-    agent.save_model(os.path.join(models_dir, "enhanced_rl_q_table.pkl"))
-    print("Enhanced RL Q-table saved.")
+        # Save enhanced model
+        agent.save_model(os.path.join(models_dir, "enhanced_rl_q_table.pkl"))
+        print("Enhanced RL Q-table saved.")
     
     # Save training history
     history_df = pd.DataFrame({
-        'episode': range(1, episodes + 1),
+        'episode': range(1, len(agent.episode_rewards) + 1),
         'reward': agent.episode_rewards,
         'epsilon': agent.epsilon_history
     })
+    if metrics.history:
+        history_df = history_df.merge(pd.DataFrame(metrics.history), on='episode', how='left')
     history_df.to_csv(os.path.join(base_dir, "data/rl_training_history.csv"), index=False)
     print("RL training history saved.")
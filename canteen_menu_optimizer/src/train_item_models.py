@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+import argparse
+import joblib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sklearn.cluster import KMeans
+
+from data_schema import parse_dates
+from feature_manifest import selected_features
+from item_models import ITEM_MODELS_DIR, REGISTRY_FILE, group_model_path, registry_path
+from train_enhanced_ml_model import fit_enhanced_model, out_of_fold, regression_metrics
+from training_matrix import cached_matrix
+
+# A specialised model sees one item (or a few similar items), so it gets fewer, shallower trees
+# than the global model
+ITEM_MODEL_PARAMS = {'n_estimators': 100, 'max_depth': 4}
+
+def item_clusters(item_ids, y, n_clusters, seed=42):
+    """item_id -> cluster name, clustering the items on the mean and spread of their demand"""
+    stats = pd.DataFrame({'item_id': item_ids, 'y': y}).groupby('item_id')['y'].agg(['mean', 'std'])
+    labels = KMeans(n_clusters, random_state=seed, n_init=10).fit_predict((stats - stats.mean()) / stats.std())
+    return {item_id: f"cluster_{label}" for item_id, label in zip(stats.index, labels)}
+
+_matrix = None  # The training matrix, loaded once per worker process
+
+def _attach_matrix(path):
+    global _matrix
+    _matrix = xgb.DMatrix(path)
+
+def _train_group(models_dir, group, rows, dates, n_jobs):
+    """Backtest and fit one group's model on its rows of the training matrix"""
+    start = time.perf_counter()
+    model, fold_results, pooled = fit_enhanced_model(_matrix.slice(rows), dates, n_jobs=n_jobs, n_workers=1,
+                                                     model_params=ITEM_MODEL_PARAMS)
+    joblib.dump(model, group_model_path(models_dir, group))
+    return {'group': group, 'rows': len(rows), **pooled, 'seconds': time.perf_counter() - start}
+
+def train_item_models(data_dir, models_dir, n_clusters=None, n_workers=None):
+    """Train a model per item (or per item cluster) in a process pool and write the registry.
+
+    Every group is backtested on the same rolling-origin folds as the global
+    model; only items whose group beats the global model's out-of-fold RMSE on
+    their rows are routed to it, the rest stay on the global model.
+    """
+    # Same features as the global model, since the engine scales one feature vector for both
+    X_path = os.path.join(data_dir, "X_enhanced_preprocessed.csv")
+    features = selected_features(models_dir) or pd.read_csv(X_path, nrows=0).columns.tolist()
+    matrix_path = cached_matrix(X_path, os.path.join(data_dir, "y_enhanced_target.csv"), features)
+    rows_info = parse_dates(pd.read_csv(os.path.join(data_dir, "full_enhanced_dataset.csv"),
+                                        usecols=["date", "item_id"]))
+    item_ids = rows_info["item_id"].astype(str)
+    dates = rows_info["date"]
+    y = pd.read_csv(os.path.join(data_dir, "y_enhanced_target.csv")).squeeze("columns")
+    if n_clusters:
+        groups = item_clusters(item_ids, y, n_clusters)
+    else:
+        groups = {item_id: item_id for item_id in sorted(item_ids.unique())}
+    group_rows = {group: np.flatnonzero(item_ids.map(groups) == group) for group in sorted(set(groups.values()))}
+
+    # The global model's out-of-fold predictions, to compare each group against on the same rows
+    _, test_rows, y_test, y_pred = out_of_fold(matrix_path, dates, n_workers=n_workers)
+
+    out_dir = os.path.join(models_dir, ITEM_MODELS_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    n_workers = min(n_workers or os.cpu_count(), len(group_rows))
+    n_jobs = max(1, os.cpu_count() // n_workers)  # Split the cores between workers rather than oversubscribe
+    jobs = [(models_dir, group, rows, dates.iloc[rows], n_jobs) for group, rows in group_rows.items()]
+    if n_workers == 1:  # No pool to start on a single core
+        _attach_matrix(matrix_path)
+        results = [_train_group(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_attach_matrix, initargs=(matrix_path,)) as pool:
+            futures = [pool.submit(_train_group, *job) for job in jobs]
+            results = [future.result() for future in as_completed(futures)]
+
+    summary = pd.DataFrame(results).sort_values('group').reset_index(drop=True)
+    summary['global_rmse'] = [regression_metrics(y_test[mask], y_pred[mask])['rmse']
+                              for mask in (np.isin(test_rows, group_rows[group]) for group in summary['group'])]
+    summary['routed'] = summary['rmse'] < summary['global_rmse']
+
+    # Write the registry atomically, then drop models of groups from earlier runs
+    routed = set(summary.loc[summary['routed'], 'group'])
+    registry = {
+        'items': {item_id: group for item_id, group in groups.items() if group in routed},
+        'groups': summary.to_dict('records'),
+        'model_params': ITEM_MODEL_PARAMS,
+        'features': features  # Checked against the global model's features on load
+    }
+    tmp_path = registry_path(models_dir) + ".tmp"
+    joblib.dump(registry, tmp_path)
+    os.replace(tmp_path, registry_path(models_dir))
+    keep = {REGISTRY_FILE} | {os.path.basename(group_model_path(models_dir, group)) for group in group_rows}
+    for name in set(os.listdir(out_dir)) - keep:
+        os.remove(os.path.join(out_dir, name))
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train specialised demand models per item or item cluster")
+    parser.add_argument("--clusters", type=int, default=0,
+                        help="group items into this many demand clusters (default: one model per item)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    data_dir = os.path.join(base_dir, "data")
+    models_dir = os.path.join(base_dir, "models")
+
+    start = time.perf_counter()
+    summary = train_item_models(data_dir, models_dir, n_clusters=args.clusters, n_workers=args.workers)
+    print(f"Trained {len(summary)} item models in {time.perf_counter() - start:.1f}s "
+          f"({summary['routed'].sum()} beat the global model and are routed)")
+    print(summary.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
@@ -1,17 +1,20 @@
 
 import pandas as pd
+import numpy as np
 import xgboost as xgb
 import joblib
 import os
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error
 
+from data_cache import read_table
+
 # Get base directory
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # Load preprocessed data
-X = pd.read_csv(os.path.join(base_dir, "data/X_preprocessed.csv"))
-y = pd.read_csv(os.path.join(base_dir, "data/y_target.csv")).squeeze("columns")
+X = read_table(os.path.join(base_dir, "data/X_preprocessed.csv"), dtypes=np.float32)
+y = read_table(os.path.join(base_dir, "data/y_target.csv")).squeeze("columns")
 
 # Split data into training and testing sets
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+import hashlib
+import os
+
+from data_cache import CACHE_DIR_NAME, file_hash, read_table
+
+BATCH_ROWS = 100000  # Rows per batch read from CSV for external-memory matrices and batched prediction
+
+def matrix_path(X_path, y_path, columns=None):
+    """Binary DMatrix cache path for a preprocessed X/y pair, keyed by both files' contents and the columns"""
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(X_path)), CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(X_path))[0]
+    if columns is not None:  # Each feature subset gets its own entry
+        stem += "." + hashlib.sha256(repr(list(columns)).encode()).hexdigest()[:8]
+    return os.path.join(cache_dir, f"{stem}.dmatrix-{file_hash(X_path)}{file_hash(y_path)}.buffer")
+
+def cached_matrix(X_path, y_path, columns=None):
+    """Path of a binary DMatrix of the preprocessed X/y CSVs (or X's `columns`), built on first use.
+
+    Loading the binary file skips CSV parsing and pandas entirely, and worker
+    processes each load it once instead of receiving pickled frames. A DMatrix
+    also keeps the histogram index `hist` builds from it, so folds and trials
+    sliced from one matrix are not re-sketched on every fit.
+    """
+    path = matrix_path(X_path, y_path, columns)
+    if os.path.exists(path):
+        return path
+    X = read_table(X_path, dtypes=np.float32)
+    if columns is not None:
+        X = X[list(columns)]
+    y = read_table(y_path).squeeze("columns")
+
+    # Drop matrices built from older versions of the CSVs, then write atomically
+    cache_dir, name = os.path.split(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = name.rsplit("-", 1)[0]
+    for old in os.listdir(cache_dir):
+        if old.rsplit("-", 1)[0] == stem and old != name:
+            os.remove(os.path.join(cache_dir, old))
+    tmp_path = path + ".tmp"
+    xgb.DMatrix(X, y).save_binary(tmp_path, silent=True)
+    os.replace(tmp_path, path)
+    return path
+
+def csv_batches(X_path, y_path, batch_rows=BATCH_ROWS, start=0, stop=None, columns=None):
+    """(X, y) frames for rows [start, stop) of the preprocessed CSVs (X's `columns` only), `batch_rows` at a time"""
+    rows = dict(skiprows=range(1, start + 1), nrows=None if stop is None else stop - start, chunksize=batch_rows)
+    X_reader = pd.read_csv(X_path, dtype=np.float32, usecols=columns, **rows)
+    y_reader = pd.read_csv(y_path, **rows)
+    for X, y in zip(X_reader, y_reader):
+        yield (X if columns is None else X[list(columns)]), y.squeeze("columns")
+
+class CsvBatches(xgb.DataIter):
+    """Feeds rows [start, stop) of the preprocessed CSVs to XGBoost one batch at a time"""
+    def __init__(self, X_path, y_path, batch_rows=BATCH_ROWS, start=0, stop=None, columns=None, cache_prefix=None):
+        self.X_path = X_path
+        self.y_path = y_path
+        self.batch_rows = batch_rows
+        self.start = start
+        self.stop = stop
+        self.columns = columns
+        self.reset()
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        batch = next(self._batches, None)
+        if batch is None:
+            return False
+        X, y = batch
+        input_data(data=X, label=y)
+        return True
+
+    def reset(self):
+        self._batches = csv_batches(self.X_path, self.y_path, self.batch_rows, self.start, self.stop, self.columns)
+
+def external_matrix(X_path, y_path, batch_rows=BATCH_ROWS, start=0, stop=None, columns=None):
+    """External-memory matrix over rows [start, stop) of the preprocessed CSVs.
+
+    The CSVs are read one batch at a time to build the quantile sketch and the
+    compressed pages; XGBoost then trains from the pages, so the full feature
+    matrix is never held in memory.
+    """
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(X_path)), CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Pages are named after the input files (one per site) and the process, so concurrent
+    # trainings never share a page file; XGBoost deletes them with the matrix
+    inputs = hashlib.sha256(f"{os.path.abspath(X_path)}:{os.path.abspath(y_path)}".encode()).hexdigest()[:8]
+    batches = CsvBatches(X_path, y_path, batch_rows, start, stop, columns,
+                         cache_prefix=os.path.join(cache_dir, f"xgb_external-{inputs}-{os.getpid()}"))
+    return xgb.ExtMemQuantileDMatrix(batches)
@@ -0,0 +1,113 @@
+import numpy as np
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource  # Unix only; peak memory is reported as NaN elsewhere
+except ImportError:
+    resource = None
+
+class TrainingMetrics:
+    """Per-episode throughput counters for an RL training loop.
+
+    Wall time is attributed to env.step, choose_action and learn, plus the state
+    encoding (quantizer keys or tile features) that runs inside the latter two.
+    Sections are exclusive: state encoding is charged to state_key only, not to
+    the choose_action or learn call it ran in, so the shares never exceed 1.
+    Each finished episode appends one record with steps/sec, model size and peak
+    memory, ready to be joined onto the training history CSV.
+    """
+
+    SECTIONS = ('env_step', 'choose_action', 'learn', 'state_key')
+
+    def __init__(self):
+        self.history = []
+        self.seconds = dict.fromkeys(self.SECTIONS, 0.0)
+        self._episode_start = None
+        self._nested = []  # Time spent in timed calls nested inside each open timed call
+
+    def start_episode(self):
+        self.seconds = dict.fromkeys(self.SECTIONS, 0.0)
+        self._episode_start = time.perf_counter()
+
+    def end_episode(self, episode, steps, agent):
+        """Close the episode's counters and return its record"""
+        elapsed = time.perf_counter() - self._episode_start
+        record = {
+            'episode': episode,
+            'steps': steps,
+            'seconds': elapsed,
+            'steps_per_sec': steps / elapsed if elapsed > 0 else 0.0,
+            **{f'{section}_seconds': seconds for section, seconds in self.seconds.items()},
+            'model_entries': model_entries(agent),
+            'model_mb': model_nbytes(agent) / 2 ** 20,
+            'peak_rss_mb': peak_rss_mb()
+        }
+        self.history.append(record)
+        return record
+
+    @contextmanager
+    def instrument(self, agent, env):
+        """Time env.step, choose_action, learn and the agent's state encoding for the duration of the block"""
+        targets = [(env, 'step', 'env_step'), (agent, 'choose_action', 'choose_action'), (agent, 'learn', 'learn')]
+        if hasattr(agent, 'quantizer'):
+            targets += [(agent.quantizer, 'key', 'state_key'), (agent.quantizer, 'keys', 'state_key')]
+        else:
+            targets += [(agent, '_active_features', 'state_key')]
+        for owner, name, section in targets:
+            setattr(owner, name, self._timed(section, getattr(owner, name)))
+        try:
+            yield self
+        finally:
+            for owner, name, _ in targets:
+                delattr(owner, name)  # Drop the instance attribute so the class method is used again
+
+    def _timed(self, section, function):
+        # Looks the counters up at call time, since start_episode replaces the dict
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            self._nested.append(0.0)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.seconds[section] += elapsed - self._nested.pop()
+                if self._nested:
+                    self._nested[-1] += elapsed  # Charge it to this section, not the enclosing one
+        return timed
+
+    def summary(self):
+        """Share of the loop's wall time spent in each section over all recorded episodes
+
+        The remainder (1 minus the shares) is loop overhead outside the timed calls.
+        """
+        total = sum(record['seconds'] for record in self.history)
+        steps = sum(record['steps'] for record in self.history)
+        shares = {section: sum(record[f'{section}_seconds'] for record in self.history) / total
+                  for section in self.SECTIONS}
+        return {'steps_per_sec': steps / total, **shares}
+
+def model_entries(agent):
+    """Number of Q-table rows (tabular) or weight rows (linear)"""
+    if hasattr(agent, 'q_table'):
+        return len(agent.q_table)
+    return len(agent.weights)
+
+def model_nbytes(agent):
+    """Bytes held by the Q-table or weight matrix, plus the replay buffer if enabled"""
+    nbytes = agent.q_table._values.nbytes if hasattr(agent, 'q_table') else agent.weights.nbytes
+    buffer = getattr(agent, 'replay_buffer', None)
+    if buffer is not None:
+        nbytes += sum(array.nbytes for array in (buffer.states, buffer.actions, buffer.rewards,
+                                                  buffer.next_states, buffer.dones))
+    return nbytes
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB"""
+    if resource is None:
+        return np.nan
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 2 ** 20  # Reported in bytes on macOS
+    return peak / 1024  # Reported in KB on Linux and the BSDs
@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from data_schema import parse_dates
+from feature_manifest import selected_features
+from search_space import grid_trials, random_trials
+from train_enhanced_ml_model import N_FOLDS, booster_params, build_enhanced_model, time_series_folds, to_regressor
+from training_matrix import cached_matrix
+
+# Values tried for each XGBoost hyperparameter; the number of trees is set by early stopping
+SEARCH_SPACE = {
+    'max_depth': [3, 4, 6, 8],
+    'learning_rate': [0.03, 0.05, 0.08, 0.15],
+    'subsample': [0.7, 0.85, 1.0],
+    'colsample_bytree': [0.6, 0.85, 1.0],
+    'min_child_weight': [1, 5, 10],
+    'reg_lambda': [0.1, 1.0, 5.0],
+}
+MAX_TREES = 1000
+EARLY_STOPPING_ROUNDS = 30
+VALIDATION_DAYS = 28  # The last days of each fold's training window, held out for early stopping
+HALVING_FACTOR = 3  # Successive halving keeps the best 1/HALVING_FACTOR of the trials at each rung
+LATENCY_REPEATS = 50
+
+RESULT_COLUMNS = ['trial', *SEARCH_SPACE, 'folds', 'rmse', 'mae', 'trees', 'latency_ms', 'model_kb',
+                  'fit_seconds']
+
+def search_folds(dates, n_folds=N_FOLDS, validation_days=VALIDATION_DAYS):
+    """(fit_rows, valid_rows, test_rows) per rolling-origin fold, most recent fold first.
+
+    The validation days sit between the fit rows and the test block, so early
+    stopping never sees the days it is scored on.
+    """
+    dates = pd.DatetimeIndex(dates)
+    folds = []
+    for train_rows, test_rows in time_series_folds(dates, n_folds):
+        valid_start = dates[train_rows].max() - pd.Timedelta(days=validation_days - 1)
+        valid_mask = dates[train_rows] >= valid_start
+        folds.append((train_rows[~valid_mask], train_rows[valid_mask], test_rows))
+    return folds[::-1]
+
+# Per worker process: the training matrix, loaded once, and each fold's matrices, sliced once
+# and reused by every trial (a DMatrix keeps the histogram index built on its first fit)
+_matrix = None
+_fold_matrices = {}
+
+def _attach_matrix(path):
+    global _matrix
+    _matrix = xgb.DMatrix(path)
+    _fold_matrices.clear()
+
+def _fold_matrix(fold, fold_rows):
+    if fold not in _fold_matrices:
+        _fold_matrices[fold] = tuple(_matrix.slice(rows) for rows in fold_rows)
+    return _fold_matrices[fold]
+
+def _run_fold(trial, params, fold, fold_rows, n_jobs):
+    """Fit one trial on one fold with early stopping; returns error sums so folds can be pooled"""
+    start = time.perf_counter()
+    dfit, dvalid, dtest = _fold_matrix(fold, fold_rows)
+    booster = xgb.train({**booster_params(n_jobs)[0], **params}, dfit, MAX_TREES, evals=[(dvalid, 'valid')],
+                        early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=False)
+    fit_seconds = time.perf_counter() - start
+    trees = booster.best_iteration + 1
+    errors = dtest.get_label() - booster.predict(dtest, iteration_range=(0, trees))
+
+    # The decision engine predicts one row at a time through the sklearn wrapper, so time that
+    model = to_regressor(booster[:trees])
+    row = pd.DataFrame(dtest.get_data()[:1].toarray(), columns=dtest.feature_names)
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        tick = time.perf_counter()
+        model.predict(row)
+        timings.append(time.perf_counter() - tick)
+    return {
+        'trial': trial,
+        'fold': fold,
+        'n': len(errors),
+        'squared_error': float(np.sum(errors ** 2)),
+        'absolute_error': float(np.sum(np.abs(errors))),
+        'trees': trees,
+        'latency_ms': float(np.median(timings)) * 1000,
+        'model_kb': len(model.get_booster().save_raw()) / 1024,
+        'fit_seconds': fit_seconds
+    }
+
+def summarize(fold_results, trials):
+    """One row per trial, with errors pooled over every fold it was evaluated on"""
+    rows = []
+    for trial, runs in pd.DataFrame(fold_results).groupby('trial'):
+        n = runs['n'].sum()
+        rows.append({
+            'trial': trial,
+            **trials[trial],
+            'folds': len(runs),
+            'rmse': math.sqrt(runs['squared_error'].sum() / n),
+            'mae': runs['absolute_error'].sum() / n,
+            'trees': int(round(runs['trees'].mean())),
+            'latency_ms': runs['latency_ms'].median(),
+            'model_kb': runs['model_kb'].mean(),
+            'fit_seconds': runs['fit_seconds'].sum()
+        })
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS).sort_values(['folds', 'rmse'], ascending=[False, True])
+
+def rung_folds(n_folds, halving):
+    """Number of folds evaluated at each rung: 1, 2, 4, ... up to n_folds, or all at once"""
+    if not halving:
+        return [n_folds]
+    rungs = []
+    k = 1
+    while k < n_folds:
+        rungs.append(k)
+        k *= 2
+    return rungs + [n_folds]
+
+def run_search(matrix_path, dates, trials, results_path, halving=False, n_folds=N_FOLDS, n_workers=None):
+    """Score every trial on rolling-origin folds, one (trial, fold) fit per worker task.
+
+    Each worker loads the binary training matrix at `matrix_path` once (see
+    training_matrix.py) and slices its folds from it.
+
+    With `halving`, trials first run on the most recent fold only; after each rung
+    the best 1/HALVING_FACTOR go on to twice as many folds. Trial 0 (the baseline)
+    always runs on every fold. The trade-off table is rewritten to `results_path`
+    after each rung.
+    """
+    folds = search_folds(dates, n_folds)
+    n_workers = n_workers or os.cpu_count()
+    n_jobs = max(1, os.cpu_count() // n_workers)  # Split the cores between workers rather than oversubscribe
+
+    fold_results = []
+    survivors = list(range(len(trials)))
+    done_folds = 0
+    if n_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=n_workers, initializer=_attach_matrix, initargs=(matrix_path,))
+    else:
+        pool = None
+        _attach_matrix(matrix_path)
+    try:
+        for rung, k in enumerate(rung_folds(len(folds), halving)):
+            jobs = [(trial, trials[trial], fold, folds[fold], n_jobs)
+                    for trial in survivors for fold in range(done_folds, k)]
+            if pool is None:  # No pool to start on a single core
+                fold_results.extend(_run_fold(*job) for job in jobs)
+            else:
+                fold_results.extend(pool.map(_run_fold, *zip(*jobs)))
+            done_folds = k
+
+            table = summarize(fold_results, trials)
+            table.to_csv(results_path, index=False)
+            print(f"Rung {rung + 1}: {len(survivors)} trials on {k} fold(s), "
+                  f"best RMSE = {table['rmse'].iloc[0]:.2f} (trial {table['trial'].iloc[0]})")
+
+            ranked = [trial for trial in table['trial'] if trial in survivors]
+            survivors = ranked[:max(1, math.ceil(len(ranked) / HALVING_FACTOR))]
+            if 0 not in survivors:
+                survivors.append(0)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return table
+
+def cheapest_within_budget(table, max_rmse):
+    """The smallest fully evaluated trial whose RMSE is within `max_rmse`.
+
+    Ranked by model size rather than latency: size tracks the work per prediction,
+    while single-row latency is mostly fixed overhead and is noisy when trials
+    share cores.
+    """
+    candidates = table[(table['folds'] == table['folds'].max()) & (table['rmse'] <= max_rmse)]
+    if candidates.empty:
+        return None
+    return candidates.sort_values(['model_kb', 'latency_ms']).iloc[0]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Hyperparameter search for the enhanced XGBoost demand model")
+    parser.add_argument("--search", choices=["grid", "random"], default="random")
+    parser.add_argument("--trials", type=int, default=30, help="number of random-search trials")
+    parser.add_argument("--halving", action="store_true",
+                        help="successive halving over the folds instead of scoring every trial on every fold")
+    parser.add_argument("--max-rmse", type=float,
+                        help="error budget for the recommendation (default: the current settings' RMSE)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    matrix_path = cached_matrix(os.path.join(base_dir, "data/X_enhanced_preprocessed.csv"),
+                                os.path.join(base_dir, "data/y_enhanced_target.csv"),
+                                selected_features(os.path.join(base_dir, "models")))
+    dates = parse_dates(pd.read_csv(os.path.join(base_dir, "data/full_enhanced_dataset.csv"), usecols=["date"]))["date"]
+    results_path = os.path.join(base_dir, "data/xgb_search_results.csv")
+
+    # Trial 0 is the current hand-picked configuration, the baseline for the error budget
+    current = build_enhanced_model().get_params()
+    trials = [{name: current[name] for name in SEARCH_SPACE if current[name] is not None}]
+    if args.search == "grid":
+        trials += grid_trials(SEARCH_SPACE)
+    else:
+        trials += random_trials(SEARCH_SPACE, args.trials, seed=args.seed)
+    print(f"Running {len(trials)} trials ({args.search} search{', successive halving' if args.halving else ''}) "
+          f"on {args.workers} workers")
+
+    start = time.perf_counter()
+    table = run_search(matrix_path, dates, trials, results_path, halving=args.halving, n_workers=args.workers)
+    print(f"\nSearch completed in {time.perf_counter() - start:.1f}s; results saved to xgb_search_results.csv")
+    print(table.head(10).to_string(index=False, float_format=lambda value: f"{value:.3g}"))
+
+    baseline = table[table['trial'] == 0].iloc[0]
+    max_rmse = args.max_rmse if args.max_rmse is not None else baseline['rmse']
+    best = cheapest_within_budget(table, max_rmse)
+    if best is None:
+        print(f"\nNo configuration meets RMSE <= {max_rmse:.2f}")
+    else:
+        print(f"\nCheapest configuration with RMSE <= {max_rmse:.2f}: trial {best['trial']:.0f} "
+              f"(RMSE {best['rmse']:.2f}, {best['trees']:.0f} trees, {best['latency_ms']:.2f} ms/row, "
+              f"{best['model_kb']:.0f} KB; current settings: RMSE {baseline['rmse']:.2f}, "
+              f"{baseline['trees']:.0f} trees, {baseline['latency_ms']:.2f} ms/row, {baseline['model_kb']:.0f} KB)")
+        print(f"n_estimators={best['trees']:.0f}, {trials[int(best['trial'])]}")
@@ -0,0 +1,22 @@
+import pytest
+import pandas as pd
+
+from data_schema import apply_schema
+
+def test_out_of_range_override_keeps_a_wider_dtype():
+    # A request overriding student_count beyond int16 must not wrap around to a negative count
+    df = apply_schema(pd.DataFrame({"student_count": [40000, 1200], "is_weekend": [1, 0],
+                                    "student_weekend_interaction": [40000, 0]}))
+    assert df["student_count"].tolist() == [40000, 1200]
+    assert df["student_count"].dtype == "int32"
+    assert df["student_weekend_interaction"].tolist() == [40000, 0]
+    assert df["is_weekend"].dtype == "int8"
+
+def test_in_range_values_use_the_schema_dtype():
+    df = apply_schema(pd.DataFrame({"student_count": [1200, 32767], "day_of_week": [0, 6]}))
+    assert df["student_count"].dtype == "int16"
+    assert df["day_of_week"].dtype == "int8"
+
+def test_values_beyond_int64_are_rejected():
+    with pytest.raises(ValueError):
+        apply_schema(pd.DataFrame({"student_count": [1e20]}))
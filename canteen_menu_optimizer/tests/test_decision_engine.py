@@ -0,0 +1,27 @@
+import os
+
+import pandas as pd
+
+import decision_engine
+from canteen_env import policy_state
+from data_cache import read_table
+
+DATA_DIR = os.path.join(decision_engine.base_dir, "data")
+
+def request_features(date, rainfall_today=None):
+    frames = [read_table(os.path.join(DATA_DIR, f"{name}.csv"))
+              for name in ("historical_sales", "weather_data", "academic_calendar", "operational_data")]
+    _, features = decision_engine.get_enhanced_features(date, "item_1", *frames, rainfall_today=rainfall_today)
+    return features
+
+def test_forecast_date_beyond_the_sales_history_gets_an_rl_adjustment():
+    sales = read_table(os.path.join(DATA_DIR, "historical_sales.csv"))
+    date = pd.Timestamp("2026-03-04")
+    assert date > sales["date"].max()
+    assert decision_engine.get_rl_adjustment(date, request_features(date)) != 0
+
+def test_rl_state_comes_from_the_request_features():
+    date = pd.Timestamp("2026-03-04")
+    dry, wet = request_features(date), request_features(date, rainfall_today=30.0)
+    assert wet["rainfall"] == 30.0
+    assert policy_state(date, dry)[-1] == 0 and policy_state(date, wet)[-1] == 2
@@ -0,0 +1,62 @@
+import numpy as np
+
+from parallel_rl_trainer import merge_q_tables
+from q_table import decode_keys, encode_keys
+
+def update(keys, deltas, n_actions=2):
+    """One worker's (key_words, deltas) for the rows it touched"""
+    return encode_keys(keys), np.array(deltas, dtype=np.float64).reshape(-1, n_actions)
+
+def test_single_worker_update_is_not_diluted():
+    base = (encode_keys([1, 2]), np.array([[1.0, 2.0], [3.0, 4.0]]))
+    merged = merge_q_tables(base, [update([1], [[0.0, 3.0]]), update([], [])], n_actions=2)
+    np.testing.assert_allclose(merged[1], [1.0, 5.0])
+    np.testing.assert_allclose(merged[2], [3.0, 4.0])
+
+def test_shared_updates_are_averaged():
+    base = (encode_keys([1]), np.array([[0.0, 10.0]]))
+    merged = merge_q_tables(base, [update([1], [[2.0, 0.0]]), update([1], [[4.0, 6.0]])], n_actions=2)
+    np.testing.assert_allclose(merged[1], [3.0, 16.0])
+
+def test_new_states_keep_the_values_of_the_workers_that_saw_them():
+    base = (encode_keys([1]), np.array([[1.0, 1.0]]))
+    first = update([7], [[2.0, 0.0]])
+    second = update([7, 9], [[4.0, 0.0], [5.0, 6.0]])
+    merged = merge_q_tables(base, [first, second, update([], [])], n_actions=2)
+    assert list(merged.keys()) == [1, 7, 9]  # Merged rows are sorted by key
+    np.testing.assert_allclose(merged[7], [3.0, 0.0])
+    np.testing.assert_allclose(merged[9], [5.0, 6.0])
+
+def test_multi_word_keys_merge_with_single_word_keys():
+    wide = 1 << 70
+    base = (encode_keys([1]), np.array([[1.0, 1.0]]))
+    merged = merge_q_tables(base, [update([wide, 1], [[2.0, 0.0], [1.0, 0.0]])], n_actions=2)
+    assert list(merged.keys()) == [1, wide]
+    np.testing.assert_allclose(merged[1], [2.0, 1.0])
+    np.testing.assert_allclose(merged[wide], [2.0, 0.0])
+
+def test_first_round_starts_from_an_empty_table():
+    merged = merge_q_tables((encode_keys([]), np.zeros((0, 2))), [update([3], [[1.0, 2.0]])], n_actions=2)
+    np.testing.assert_allclose(merged[3], [1.0, 2.0])
+
+def test_matches_a_per_key_merge_on_random_tables():
+    rng = np.random.default_rng(0)
+    pool = [int(key) for key in rng.integers(0, 2 ** 62, 200)] + [(1 << 80) + int(key) for key in range(50)]
+    base_keys = [pool[i] for i in rng.permutation(len(pool))[:150]]  # Unsorted, like a fresh agent's table
+    base_values = rng.random((len(base_keys), 3))
+    updates = []
+    for _ in range(4):
+        keys = [pool[i] for i in rng.choice(len(pool), 60, replace=False)]
+        updates.append(update(keys, rng.integers(-1, 2, (60, 3)), n_actions=3))
+    merged = merge_q_tables((encode_keys(base_keys), base_values), updates, n_actions=3)
+
+    start = {key: values for key, values in zip(base_keys, base_values)}
+    changes = {}
+    for words, deltas in updates:
+        for key, delta in zip(decode_keys(words), deltas):
+            changes.setdefault(key, []).append(delta)
+    assert sorted(merged.keys()) == list(merged.keys()) == sorted(set(start) | set(changes))
+    for key in merged.keys():
+        deltas = np.array(changes.get(key, np.zeros((1, 3))))
+        expected = start.get(key, np.zeros(3)) + deltas.sum(axis=0) / np.maximum((deltas != 0).sum(axis=0), 1)
+        np.testing.assert_allclose(merged[key], expected)
@@ -0,0 +1,21 @@
+import pytest
+
+from enhanced_decision_engine import SiteEngineCache
+from site_partitions import site_dir
+
+@pytest.mark.parametrize("site_id", ["../..", "../models", "/etc", "a/b", "", "site.1"])
+def test_site_dir_rejects_ids_that_are_not_plain_names(site_id):
+    with pytest.raises(ValueError):
+        site_dir("models", site_id)
+
+def test_site_dir_accepts_plain_names():
+    assert site_dir("models", "north_block-2").endswith("north_block-2")
+
+def test_cache_rejects_untrained_site_before_loading(tmp_path):
+    cache = SiteEngineCache()
+    cache.models_dir = str(tmp_path)
+    (tmp_path / "sites" / "north").mkdir(parents=True)
+    for site_id in ["../..", "south"]:
+        with pytest.raises(KeyError):
+            cache.get(site_id)
+    assert len(cache) == 0
@@ -191,6 +191,7 @@ async function handlePredictionSubmit(event) {
     const requestData = {
         date: formData.get('date'),
         item_id: formData.get('item_id'),
+        site_id: formData.get('site_id') ? formData.get('site_id').trim() : null,
         current_stock: formData.get('current_stock') ? parseInt(formData.get('current_stock')) : null,
         rainfall_today: formData.get('rainfall_today') ? parseFloat(formData.get('rainfall_today')) : null,
         student_count: formData.get('student_count') ? parseInt(formData.get('student_count')) : null,